@@ -142,7 +142,8 @@ async function startAnalysis() {
 
         // Step 2: Run full-analysis (3-stage pipeline + permissions + hidden clauses)
         updateLoadingStep(2);
-        const result = await apiCall("/full-analysis", {
+        // Compact view: only the fields rendered below (full detail: GET /analysis/{url_hash})
+        const result = await apiCall("/full-analysis?view=compact", {
             url: state.currentUrl,
             html: state.currentHtml,
         });
@@ -480,7 +481,7 @@ function renderHiddenClauses() {
     let html = "";
 
     // Transparency score
-    if (data.transparency_score !== undefined) {
+    if (data.transparency_score != null) {
         const tScore = data.transparency_score;
         html += `
       <div style="padding:12px;margin-bottom:12px;background:var(--bg-glass);border:1px solid var(--border-glass);border-radius:var(--radius-sm);text-align:center">
@@ -1,15 +1,20 @@
 import os
+import json
 import shutil
 from typing import List, Tuple
 import math
-from collections import Counter
+import hashlib
+import threading
+from collections import Counter, OrderedDict
 import re
 
 # HTML & Text Processing
-from bs4 import BeautifulSoup
+from html_cleaner import clean_html  # re-exported: callers use ai_engine.clean_html
 from dotenv import load_dotenv
 from langchain_text_splitters import RecursiveCharacterTextSplitter
-from llm_config import llm  # shared instance with SQLiteCache
+from llm_config import ainvoke, ainvoke_json, astream, requires, run_sync  # shared LLM with SQLiteCache, via the concurrency governor
+import metrics
+import prompts
 from sentence_transformers import SentenceTransformer
 import numpy as np
 load_dotenv()
@@ -24,66 +29,6 @@ except Exception as e:
     embedding_model = None
 
 
-def clean_html(raw_html: str) -> str:
-    """
-    Strips HTML tags, scripts, and styles to leave only readable text.
-    """
-    soup = BeautifulSoup(raw_html, "html.parser")
-    
-    # Remove junk tags
-    for tag in soup(["script", "style", "nav", "footer", "header", "noscript", "meta"]):
-        tag.decompose()
-    
-    text = soup.get_text(separator="\n")
-    
-    # Remove extra whitespace/empty lines
-    clean_lines = [line.strip() for line in text.splitlines() if line.strip()]
-    return "\n".join(clean_lines)
-
-
-def process_policy(html_content: str, url_hash: str, existing_summary: str = None) -> Tuple[str, str, str]:
-    """
-    Main Pipeline:
-    1. Cleans HTML.
-    2. Returns summary and cleaned text.
-    Returns: (summary_text, empty_string, clean_text)
-    """
-    # 1. Clean Text
-    clean_text = clean_html(html_content)
-    if len(clean_text) < 100:
-        return "Error: Content too short to analyze.", "", ""
-
-    if existing_summary:
-        print(f"Skipping LLM summary generation for {url_hash} (Using cached summary)")
-        return existing_summary, "", clean_text
-
-    # 2. Generate Summary (Using Groq)
-    # We send the first 15,000 chars to Groq (Flash handles big context easily)
-    context_preview = clean_text[:15000] 
-    
-    prompt = f"""
-    You are a Privacy Expert. Analyze the following privacy policy text.
-    Identify the most critical risks for the user.
-    
-    Output Format:
-    - **Data Collected:** (List key items)
-    - **Third Party Sharing:** (Who gets the data?)
-    - **User Rights:** (Can they delete data?)
-    - **Risk Score:** (1-10, give a number based on invasiveness)
-    
-    Policy Text:
-    {context_preview}
-    """
-    
-    try:
-        response = llm.invoke(prompt)
-        summary = response.content
-    except Exception as e:
-        summary = f"AI Error: {str(e)}"
-
-    return summary, "", clean_text
-
-
 async def process_policy_async(html_content: str, url_hash: str, existing_summary: str = None) -> Tuple[str, str, str]:
     """
     Asynchronous version of the process policy pipeline for high-speed concurrent execution.
@@ -98,24 +43,10 @@ async def process_policy_async(html_content: str, url_hash: str, existing_summar
         return existing_summary, "", clean_text
 
     # 2. Generate Summary (Using Groq API asynchronously)
-    context_preview = clean_text[:15000] 
-    
-    prompt = f"""
-    You are a Privacy Expert. Analyze the following privacy policy text.
-    Identify the most critical risks for the user.
-    
-    Output Format:
-    - **Data Collected:** (List key items)
-    - **Third Party Sharing:** (Who gets the data?)
-    - **User Rights:** (Can they delete data?)
-    - **Risk Score:** (1-10, give a number based on invasiveness)
-    
-    Policy Text:
-    {context_preview}
-    """
+    prompt = prompts.render_with_document("summary", clean_text)
     
     try:
-        response = await llm.ainvoke(prompt)
+        response = await ainvoke(prompt, task="summary")
         summary = response.content
     except Exception as e:
         summary = f"AI Error: {str(e)}"
@@ -145,42 +76,90 @@ def chunk_text(text: str, max_words: int = 200, overlap: int = 50) -> list[dict]
         })
     return chunks
 
+# ── Embedding helpers ──────────────────────────────────────────────────────
+_EMBED_CACHE_SIZE = int(os.getenv("EMBED_CACHE_SIZE", "64"))
+_chunk_embedding_cache: "OrderedDict[str, np.ndarray]" = OrderedDict()
+_chunk_embedding_lock = threading.Lock()   # callers may run in worker threads (asyncio.to_thread)
+
+
+@metrics.timed("embed")
+def embed_texts(texts: list[str]) -> np.ndarray:
+    """Unit-normalized embeddings (one row per text). Requires embedding_model."""
+    return embedding_model.encode(texts, convert_to_numpy=True, normalize_embeddings=True)
+
+
+def get_chunk_embeddings(chunks: list[dict]) -> np.ndarray:
+    """
+    Normalized embedding matrix for a policy's chunks, LRU-cached by chunk content
+    so /chat, permission mapping etc. encode each policy only once.
+    """
+    key = hashlib.sha1("\x00".join(chunk["text"] for chunk in chunks).encode("utf-8")).hexdigest()
+    with _chunk_embedding_lock:
+        cached = _chunk_embedding_cache.get(key)
+        if cached is not None:
+            _chunk_embedding_cache.move_to_end(key)
+    metrics.inc("embedding_cache_lookups_total", result="miss" if cached is None else "hit")
+    if cached is not None:
+        return cached
+    embs = embed_texts([chunk["text"] for chunk in chunks])
+    with _chunk_embedding_lock:
+        _chunk_embedding_cache[key] = embs
+        if len(_chunk_embedding_cache) > _EMBED_CACHE_SIZE:
+            _chunk_embedding_cache.popitem(last=False)
+    return embs
+
+
+def embed_query(query: str):
+    """Normalized query embedding, or None without an embedding model."""
+    if embedding_model is None:
+        return None
+    try:
+        return embed_texts([query])[0]
+    except Exception as e:
+        print(f"[Semantic RAG] Failed to embed query: {e}")
+        return None
+
+
 def tokenize(text: str) -> list[str]:
     return re.findall(r'\b\w+\b', text.lower())
 
-def retrieve_chunks(query: str, chunks: list[dict], top_k: int = 5) -> list[dict]:
+def retrieve_chunks(query: str, chunks: list[dict], top_k: int = 5, query_emb=None) -> list[dict]:
+    """Top-k chunks by similarity. Pass `query_emb` (from embed_query) to reuse an existing encoding."""
+    return _rank_chunks(query, chunks, top_k, query_emb)[0]
+
+
+@metrics.timed("retrieve_chunks")
+def _rank_chunks(query: str, chunks: list[dict], top_k: int, query_emb=None) -> tuple:
+    """Returns (top-k chunks, scorer used: "embedding" or "token_overlap")."""
     if not chunks:
-        return []
+        return [], "token_overlap"
 
     # ── Semantic Search (Vector Embedding Cosine Similarity) ──────────────────
     if embedding_model is not None:
         try:
-            chunk_texts = [chunk["text"] for chunk in chunks]
-            # Encode query and chunks to dense vector space (384-dimensions)
-            query_emb = embedding_model.encode(query, convert_to_numpy=True)
-            chunk_embs = embedding_model.encode(chunk_texts, convert_to_numpy=True)
-
-            # Compute Cosine Similarity: A . B / (||A|| * ||B||)
-            query_norm = np.linalg.norm(query_emb)
-            chunk_norms = np.linalg.norm(chunk_embs, axis=1)
+            # Encode query to dense vector space (384-dimensions); chunk vectors are cached
+            # per policy, so repeated questions only pay for the query encoding.
+            if query_emb is None:
+                query_emb = embed_texts([query])[0]
+            chunk_embs = get_chunk_embeddings(chunks)
 
-            # Avoid division by zero warnings
-            query_norm = query_norm if query_norm > 0 else 1.0
-            chunk_norms = np.where(chunk_norms > 0, chunk_norms, 1.0)
-
-            dot_products = np.dot(chunk_embs, query_emb)
-            scores = dot_products / (chunk_norms * query_norm)
+            # Cosine Similarity: rows are unit-normalized, so it is a plain dot product
+            scores = np.dot(chunk_embs, query_emb)
 
             for i, chunk in enumerate(chunks):
                 # Cosine similarity score range [-1, 1], normalized to [0, 1] for thresholding
                 chunk["similarity_score"] = float(max(0.0, scores[i]))
 
             sorted_chunks = sorted(chunks, key=lambda x: x["similarity_score"], reverse=True)
-            return sorted_chunks[:top_k]
+            return sorted_chunks[:top_k], "embedding"
         except Exception as e:
             print(f"[Semantic RAG] Error in vector similarity search: {e}. Falling back to token overlap.")
 
-    # ── Fallback: Token Overlap Similarity ──────────────────────────────────
+    return rank_by_token_overlap(query, chunks, top_k), "token_overlap"
+
+
+def rank_by_token_overlap(query: str, chunks: list[dict], top_k: int) -> list[dict]:
+    """Fallback scorer: share of the query's content words found in each chunk."""
     query_tokens = set(tokenize(query))
     stop_words = {"what", "is", "the", "in", "a", "an", "of", "and", "to", "how", "does", "do", "are", "if"}
     query_tokens = query_tokens - stop_words
@@ -204,81 +183,155 @@ def retrieve_chunks(query: str, chunks: list[dict], top_k: int = 5) -> list[dict
     return sorted_chunks[:top_k]
 
 
-def chat_with_policy(query: str, policy_text: str) -> str:
+def retrieve_for_question(query: str, policy_text: str, top_k: int = 5) -> tuple:
+    """Returns (top chunks for `query`, query embedding or None, scorer used)."""
+    query_emb = embed_query(query)
+    retrieved, scorer = _rank_chunks(query, chunk_text(policy_text), top_k, query_emb)
+    return retrieved, query_emb, scorer
+
+
+def retrieve_for_questions(queries: list[str], policy_text: str, top_k: int = 5) -> list[tuple]:
     """
-    Directly answers user's questions about the policy using retrieved chunks.
+    retrieve_for_question for several questions on one policy: the policy is
+    chunked once, all questions are encoded in one batch and scored against the
+    cached chunk matrix with a single matrix multiply.
+    """
+    chunks = chunk_text(policy_text)
+    if embedding_model is not None and chunks:
+        try:
+            query_embs = embed_texts(queries)
+            scores = get_chunk_embeddings(chunks) @ query_embs.T      # (n_chunks, n_questions)
+            results = []
+            for q, query_emb in enumerate(query_embs):
+                order = np.argsort(scores[:, q])[::-1][:top_k]
+                retrieved = [{**chunks[i], "similarity_score": float(max(0.0, scores[i, q]))} for i in order]
+                results.append((retrieved, query_emb, "embedding"))
+            return results
+        except Exception as e:
+            print(f"[Semantic RAG] Error in batch vector search: {e}. Falling back to token overlap.")
+    results = []
+    for query in queries:
+        retrieved, scorer = _rank_chunks(query, [dict(chunk) for chunk in chunks], top_k)
+        results.append((retrieved, None, scorer))
+    return results
+
+
+# ── Off-topic short-circuit ────────────────────────────────────────────────
+# The Q&A prompt tells the model to answer "document is silent" when the best
+# similarity_score is below 0.55 (prompts.CHAT); the embedding floor applies that
+# same rule locally, so the answer is returned without an LLM call. Token
+# overlap (the share of the question's content words found in the best chunk)
+# runs on a lower scale: 0.15 is the highest value that silences none of the
+# answerable questions in tests/data/silence_questions.json (the lowest, "Can I
+# get my money back?", scores 0.167), while still silencing 6 of the 20
+# unanswerable ones. Re-derive both with `python -m rag.benchmarks.calibrate silence`.
+SILENT_THRESHOLDS = {
+    "embedding": float(os.getenv("CHAT_SILENT_THRESHOLD_EMBEDDING", "0.55")),
+    "token_overlap": float(os.getenv("CHAT_SILENT_THRESHOLD_OVERLAP", "0.15")),
+}
+
+
+def document_silent(retrieved: list[dict], scorer: str) -> bool:
+    """True when even the best retrieved chunk is below the scorer's threshold."""
+    best = max((chunk.get("similarity_score", 0.0) for chunk in retrieved), default=0.0)
+    return best < SILENT_THRESHOLDS[scorer]
+
+
+def build_chat_prompt(query: str, policy_text: str, retrieved: list[dict] = None) -> str:
+    """Renders the Q&A Agent prompt, retrieving the top chunks unless they are passed in."""
+    if retrieved is None:
+        retrieved = retrieve_for_question(query, policy_text)[0]
+    return prompts.render("chat", query=query, retrieved_chunks=json.dumps(retrieved, indent=2))
+
+
+async def chat_with_policy_async(query: str, policy_text: str, retrieved: list[dict] = None) -> str:
+    """
+    Directly answers user's questions about the policy asynchronously.
     """
     if not policy_text:
         return "Error: Policy data not found. Please refresh the analysis."
 
-    print(f"[RAG] Answering chat question directly using RAG chunks...")
-    chunks = chunk_text(policy_text)
-    retrieved = retrieve_chunks(query, chunks, top_k=5)
-    
-    import json
-    
-    prompt = f"""You are the Q&A Agent for PolicyLens. You answer user questions about a specific policy using ONLY retrieved chunks provided to you in context — never the full document, never outside knowledge.
-
-INPUT: {{"question": "{query}", "retrieved_chunks": {json.dumps(retrieved, indent=2)}}}
-
-RULES:
-- If retrieved_chunks' max similarity_score is below 0.55, respond that the document likely doesn't address this question — do not force an answer from weak matches.
-- Cite chunk_id alongside every claim so the frontend can highlight the source in the original document viewer.
-- If chunks conflict, present both and note the conflict — do not silently pick one.
-- 2-4 sentence answers. No legal advice framing.
-
-OUTPUT (JSON only):
-{{
-  "answer": "string",
-  "confidence": "High|Medium|Low",
-  "cited_chunks": ["chunk_id1", "chunk_id2"],
-  "document_silent_on_topic": true|false
-}}
-"""
+    print(f"[RAG] Answering chat question asynchronously using RAG chunks...")
+    prompt = build_chat_prompt(query, policy_text, retrieved)
     try:
-        response = llm.invoke(prompt)
-        
-        # Try to parse JSON from the response to format it nicely for the user, 
-        # but if we are called by a route expecting a string, we might just return the raw string or parsed JSON.
-        # Keeping return as string to match old signature, but containing JSON format as requested by architecture.
-        return response.content
+        return json.dumps(await ainvoke_json(prompt, task="chat", validate=_has_answer,
+                                             confident=_confident_answer))
+    except json.JSONDecodeError as e:
+        return e.doc  # unparseable even after the retry; the caller's fallback shows it as text
     except Exception as e:
         return f'{{"error": "AI Error: {str(e)}"}}'
 
 
-async def chat_with_policy_async(query: str, policy_text: str) -> str:
+def _has_answer(value) -> bool:
+    return isinstance(value, dict) and bool(value.get("answer"))
+
+
+def _confident_answer(value: dict) -> bool:
     """
-    Directly answers user's questions about the policy asynchronously.
+    Small-tier chat replies escalate to the large model unless they answer with
+    more than Low confidence (or say the policy is silent). A Low answer is
+    legitimate, so it never triggers a same-model retry.
     """
-    if not policy_text:
-        return "Error: Policy data not found. Please refresh the analysis."
+    return value.get("document_silent_on_topic") is True or str(value.get("confidence", "")).lower() != "low"
 
-    print(f"[RAG] Answering chat question asynchronously using RAG chunks...")
-    chunks = chunk_text(policy_text)
-    retrieved = retrieve_chunks(query, chunks, top_k=5)
-    
-    import json
-    
-    prompt = f"""You are the Q&A Agent for PolicyLens. You answer user questions about a specific policy using ONLY retrieved chunks provided to you in context — never the full document, never outside knowledge.
-
-INPUT: {{"question": "{query}", "retrieved_chunks": {json.dumps(retrieved, indent=2)}}}
-
-RULES:
-- If retrieved_chunks' max similarity_score is below 0.55, respond that the document likely doesn't address this question — do not force an answer from weak matches.
-- Cite chunk_id alongside every claim so the frontend can highlight the source in the original document viewer.
-- If chunks conflict, present both and note the conflict — do not silently pick one.
-- 2-4 sentence answers. No legal advice framing.
-
-OUTPUT (JSON only):
-{{
-  "answer": "string",
-  "confidence": "High|Medium|Low",
-  "cited_chunks": ["chunk_id1", "chunk_id2"],
-  "document_silent_on_topic": true|false
-}}
-"""
+
+async def stream_chat_async(query: str, policy_text: str, retrieved: list[dict] = None):
+    """Same prompt as chat_with_policy_async, yielding the raw reply as it is generated."""
+    prompt = build_chat_prompt(query, policy_text, retrieved)
+    async for text in astream(prompt, task="chat"):
+        yield text
+
+
+async def chat_batch_async(queries: list[str], retrieved: list[list[dict]]) -> list:
+    """
+    Answers several questions about one policy in a single LLM call. Chunks shared
+    between questions are sent once. Returns one parsed answer dict per question,
+    or None where the model gave no usable answer (callers fall back to chat_with_policy_async).
+    """
+    pool = {}
+    questions = []
+    for index, (query, chunks) in enumerate(zip(queries, retrieved)):
+        for chunk in chunks:
+            pool.setdefault(chunk["chunk_id"], {"chunk_id": chunk["chunk_id"], "text": chunk["text"]})
+        questions.append({
+            "index": index,
+            "question": query,
+            "chunks": [{"chunk_id": c["chunk_id"], "similarity_score": round(c["similarity_score"], 3)} for c in chunks],
+        })
+
+    prompt = prompts.render(
+        "chat_batch",
+        questions=json.dumps(questions, indent=2),
+        retrieved_chunks=json.dumps(list(pool.values()), indent=2),
+    )
+    answers = [None] * len(queries)
     try:
-        response = await llm.ainvoke(prompt)
-        return response.content
+        result = await ainvoke_json(prompt, task="chat_batch", validate=requires("answers"))
     except Exception as e:
-        return f'{{"error": "AI Error: {str(e)}"}}'
\ No newline at end of file
+        print(f"[RAG] Batch chat call failed: {e}")
+        return answers
+    for item in result.get("answers") or []:
+        index = item.get("index") if isinstance(item, dict) else None
+        if isinstance(index, int) and 0 <= index < len(answers) and "answer" in item:
+            answers[index] = item
+    return answers
+
+
+# ── Sync wrappers ──────────────────────────────────────────────────────────
+# Same prompts and LLM cache entries as the async versions above.
+
+def process_policy(html_content: str, url_hash: str, existing_summary: str = None) -> Tuple[str, str, str]:
+    """
+    Main Pipeline:
+    1. Cleans HTML.
+    2. Returns summary and cleaned text.
+    Returns: (summary_text, empty_string, clean_text)
+    """
+    return run_sync(process_policy_async(html_content, url_hash, existing_summary))
+
+
+def chat_with_policy(query: str, policy_text: str) -> str:
+    """
+    Directly answers user's questions about the policy using retrieved chunks.
+    """
+    return run_sync(chat_with_policy_async(query, policy_text))
@@ -0,0 +1,191 @@
+"""
+PrivaShield AI - Analysis File Cache
+Shared helpers for the per-URL JSON cache in storage/analysis_cache/.
+Every endpoint and tool that reads or writes `<url_hash>_v3.json` goes through here
+so the on-disk format stays identical across /analyze, /full-analysis and batch jobs.
+
+Files live in hash-prefix shards (`analysis_cache/3f/3f2a..._v3.json`) so no
+directory grows to hundreds of thousands of entries. Flat files written before
+sharding are still read; storage_maintenance moves them into their shard.
+A hit (load, or entry_tag for a conditional request answered with 304)
+refreshes the file's access time, which LRU eviction goes by.
+"""
+
+import os
+import json
+import time
+import hashlib
+from typing import Optional
+
+import metrics
+
+CACHE_DIR = os.path.join("storage", "analysis_cache")
+CACHE_VERSION = "v3"
+CACHE_SUFFIX = f"_{CACHE_VERSION}.json"
+FAQ_SUFFIX = "_faq.json"     # precomputed FAQ answers (faq.py), stored next to the analysis
+_KINDS = {CACHE_SUFFIX: "analysis", FAQ_SUFFIX: "faq"}   # metric label per file type
+SUFFIXES = tuple(_KINDS)
+SHARD_WIDTH = 2                 # hex chars of the url_hash per shard directory -> 256 shards
+_ATIME_RESOLUTION = 3600        # seconds; a hit refreshes atime at most this often
+
+_TAGS_MAX = 10000
+_tags = {}   # path -> ((mtime_ns, size), tag), so unchanged files are only stat()ed
+
+
+def url_hash(url: str) -> str:
+    """Same MD5 key used by database.create_scan / get_scan_by_url."""
+    return hashlib.md5(url.encode()).hexdigest()
+
+
+def cache_path(key: str, suffix: str = CACHE_SUFFIX) -> str:
+    return os.path.join(CACHE_DIR, key[:SHARD_WIDTH], f"{key}{suffix}")
+
+
+def legacy_path(key: str, suffix: str = CACHE_SUFFIX) -> str:
+    """Flat location used before sharding."""
+    return os.path.join(CACHE_DIR, f"{key}{suffix}")
+
+
+def _locate(key: str, suffix: str):
+    """(path, stat) of the stored file, sharded or legacy; (None, None) if there is none."""
+    for path in (cache_path(key, suffix), legacy_path(key, suffix)):
+        try:
+            return path, os.stat(path)
+        except OSError:
+            continue
+    return None, None
+
+
+def _touch(path: str, stat: os.stat_result) -> None:
+    """Records the access for LRU eviction (explicitly: relatime / noatime mounts would not)."""
+    now = time.time()
+    if now - stat.st_atime < _ATIME_RESOLUTION:
+        return
+    try:
+        os.utime(path, ns=(int(now * 1e9), stat.st_mtime_ns))   # mtime (and so the ETag memo) unchanged
+    except OSError:
+        pass
+
+
+def load(key: str, suffix: str = CACHE_SUFFIX) -> Optional[dict]:
+    """Returns the cached payload for a url_hash, or None on miss / unreadable file."""
+    kind = _KINDS.get(suffix, "other")
+    with metrics.span("cache_read", kind=kind):
+        path, stat = _locate(key, suffix)
+        if path is None:
+            metrics.inc("file_cache_lookups_total", kind=kind, result="miss")
+            return None
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                payload = json.load(f)
+        except Exception as e:
+            print(f"[Analysis Cache] Error reading cache file {path}: {e}")
+            metrics.inc("file_cache_lookups_total", kind=kind, result="error")
+            return None
+        _touch(path, stat)
+    metrics.inc("file_cache_lookups_total", kind=kind, result="hit")
+    return payload
+
+
+def save(key: str, payload: dict, suffix: str = CACHE_SUFFIX) -> bool:
+    """
+    Writes the payload atomically (temp file + rename) so concurrent batch workers
+    never leave a half-written JSON file behind for a reader to trip over.
+    """
+    path = cache_path(key, suffix)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        with metrics.span("cache_write", kind=_KINDS.get(suffix, "other")):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(payload, f, indent=4, ensure_ascii=False)
+            os.replace(tmp_path, path)
+        try:
+            os.remove(legacy_path(key, suffix))   # superseded
+        except OSError:
+            pass
+        return True
+    except Exception as e:
+        print(f"[Analysis Cache] Failed to write cache file {path}: {e}")
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        return False
+
+
+def entry_tag(key: str, suffix: str = CACHE_SUFFIX) -> Optional[str]:
+    """
+    Strong validator for the stored file, or None if there is none:
+    `<cache version>-<content_hash prefix>-<digest of the file bytes>`. A file
+    rewritten with different results (same policy text) gets a new tag. Memoized
+    on (mtime, size), so a revalidation of an unchanged entry costs one stat().
+    Counts as an access for LRU eviction, like load().
+    """
+    path, stat = _locate(key, suffix)
+    if path is None:
+        return None
+    _touch(path, stat)
+    memo = _tags.get(path)
+    if memo is not None and memo[0] == (stat.st_mtime_ns, stat.st_size):
+        return memo[1]
+
+    try:
+        with open(path, "rb") as f:
+            stat = os.fstat(f.fileno())   # the stamp of the bytes actually read
+            raw = f.read()
+    except OSError:
+        return None
+    try:
+        content_hash = str(json.loads(raw).get("content_hash") or "")
+    except (ValueError, AttributeError):
+        content_hash = ""
+    tag = f"{CACHE_VERSION}-{content_hash[:16] or 'none'}-{hashlib.sha256(raw).hexdigest()[:24]}"
+
+    if len(_tags) >= _TAGS_MAX:
+        _tags.clear()
+    _tags[path] = ((stat.st_mtime_ns, stat.st_size), tag)
+    return tag
+
+
+def remove(key: str) -> int:
+    """Deletes every file stored for a url_hash (analysis and FAQ, either layout); returns bytes freed."""
+    freed = 0
+    for suffix in SUFFIXES:
+        for path in (cache_path(key, suffix), legacy_path(key, suffix)):
+            try:
+                size = os.stat(path).st_size
+                os.remove(path)
+                freed += size
+            except OSError:
+                continue
+            _tags.pop(path, None)
+    return freed
+
+
+def entries():
+    """
+    Yields (url_hash, suffix, path, stat) for every stored file, sharded or legacy.
+    Unfinished temp files and unknown names are skipped.
+    """
+    def scan(directory: str):
+        try:
+            with os.scandir(directory) as it:
+                items = list(it)
+        except OSError:
+            return
+        for item in items:
+            if item.is_dir(follow_symlinks=False):
+                if directory == CACHE_DIR and len(item.name) == SHARD_WIDTH:
+                    yield from scan(item.path)
+                continue
+            suffix = next((s for s in SUFFIXES if item.name.endswith(s)), None)
+            if suffix is None:
+                continue
+            try:
+                stat = item.stat(follow_symlinks=False)
+            except OSError:
+                continue
+            yield item.name[:-len(suffix)], suffix, item.path, stat
+
+    yield from scan(CACHE_DIR)
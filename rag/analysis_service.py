@@ -0,0 +1,186 @@
+"""
+PrivaShield AI - Analysis Service
+The complete /full-analysis unit of work, independent of any HTTP request:
+3-stage pipeline + permission mapping + hidden clause detection, run concurrently,
+and persistence of the result to the global scan table.
+"""
+
+import os
+import time
+import asyncio
+from typing import Optional
+from sqlalchemy.orm import Session
+
+import database
+import pipeline
+import risk_analyzer
+import policy_diff
+import prompts
+from html_cleaner import clean_html
+from llm_config import model_name
+
+# Above this share of changed text an incremental update saves little; re-run everything.
+INCREMENTAL_MAX_CHANGE_RATIO = float(os.getenv("INCREMENTAL_MAX_CHANGE_RATIO", "0.5"))
+
+# Layout of the stored payload; bump when readers need entries re-analysed.
+# (A new analysis_cache.CACHE_VERSION instead orphans every entry at once.)
+SCHEMA_VERSION = 1
+# LLM tasks whose prompts and models shape a stored analysis.
+ANALYSIS_TASKS = ("extractor", "risk_analyzer", "risk_prose", "verifier",
+                  "permissions", "permissions_ambiguous", "hidden_clauses", "hidden_clauses_full")
+# What a fresh analysis is computed with; stored as each entry's cache_meta.
+CURRENT_VERSION = {
+    "schema_version": SCHEMA_VERSION,
+    "prompt_hash": prompts.fingerprint(ANALYSIS_TASKS),
+    "models": {task: model_name(task) for task in ANALYSIS_TASKS},
+}
+
+
+async def analyze_policy_text(clean_text: str) -> dict:
+    """
+    Runs all analysis stages concurrently and returns the payload in the exact
+    shape stored in the analysis file cache.
+    """
+    pipeline_data, permission_data, hidden_data = await asyncio.gather(
+        pipeline.run_full_pipeline(clean_text),
+        risk_analyzer.map_permissions_async(clean_text),
+        risk_analyzer.detect_hidden_clauses_async(clean_text),
+    )
+    return {
+        "pipeline_data": pipeline_data,
+        "permission_data": permission_data,
+        "hidden_clauses_data": hidden_data,
+    }
+
+
+def attach_source_hashes(payload: dict, clean_text: str, html: Optional[str] = None) -> dict:
+    """
+    Records what the payload was computed from: the policy (for change detection
+    on later submissions) and CURRENT_VERSION (for revalidation, see stale_reason).
+    """
+    payload["content_hash"] = policy_diff.content_hash(clean_text)
+    if html is not None:
+        payload["html_hash"] = policy_diff.content_hash(html)
+    payload["cache_meta"] = {**CURRENT_VERSION, "analyzed_at": int(time.time())}
+    return payload
+
+
+def cacheable(payload: dict) -> bool:
+    """
+    False if the hidden-clause task fell back to the keyword pre-scan (LLM
+    unavailable). Such a payload is returned but not stored, so the next request
+    analyses the policy again; the LLM cache answers the stages that succeeded.
+    """
+    return not (payload.get("hidden_clauses_data") or {}).get("preliminary")
+
+
+def stale_reason(payload: dict) -> Optional[str]:
+    """
+    Why a cached payload was not computed with CURRENT_VERSION ("legacy" for an
+    entry without cache_meta, else "schema", "prompts" or "model"), or None.
+    "preliminary" marks an entry stored with keyword pre-scan results before
+    cacheable() kept them out.
+    """
+    if not cacheable(payload):
+        return "preliminary"
+    meta = payload.get("cache_meta")
+    if not isinstance(meta, dict):
+        return "legacy"
+    if meta.get("schema_version") != SCHEMA_VERSION:
+        return "schema"
+    if meta.get("prompt_hash") != CURRENT_VERSION["prompt_hash"]:
+        return "prompts"
+    if meta.get("models") != CURRENT_VERSION["models"]:
+        return "model"
+    return None
+
+
+async def detect_policy_change(cached_payload: dict, html: str, previous_text: Optional[str]) -> Optional[str]:
+    """
+    Returns the new clean text if the submitted HTML carries a different policy
+    than the cached analysis, otherwise None (serve the cache).
+    Identical HTML is recognised by hash without parsing it; otherwise the HTML
+    is cleaned in a worker thread (ads, nonces and timestamps make that common).
+    """
+    if cached_payload.get("html_hash") == policy_diff.content_hash(html):
+        return None
+    clean_text = await asyncio.to_thread(clean_html, html)
+    if len(clean_text) < 100:
+        return None  # nothing usable submitted; keep serving the cached analysis
+    known_hash = cached_payload.get("content_hash")
+    if known_hash is None and previous_text:
+        known_hash = policy_diff.content_hash(previous_text)
+    if known_hash is None or known_hash == policy_diff.content_hash(clean_text):
+        return None
+    return clean_text
+
+
+async def reanalyze_changed_policy(previous_text: Optional[str], clean_text: str, prior_payload: dict) -> dict:
+    """
+    Re-analyses an edited policy. When the previous text and facts are available,
+    current (not stale) and the edit is small, only the changed sections are
+    re-extracted; permission and hidden-clause results are reused unless the edit
+    changes what they read (chunks / candidate passages, see risk_analyzer).
+    """
+    prior_pipeline = prior_payload.get("pipeline_data") or {}
+    if (not previous_text or "error" in prior_pipeline or not prior_pipeline.get("extracted_facts")
+            or stale_reason(prior_payload)):
+        return await analyze_policy_text(clean_text)
+
+    diff = policy_diff.diff_sections(previous_text, clean_text)
+    if diff["change_ratio"] > INCREMENTAL_MAX_CHANGE_RATIO:
+        return await analyze_policy_text(clean_text)
+    print(f"[Change Detection] {diff['changed_count']}/{diff['total_count']} sections changed "
+          f"({diff['change_ratio']:.0%} of text), {diff['removed_count']} removed")
+
+    changed_text = "\n".join(s["text"] for s in diff["changed"])
+    permissions_changed, clauses_changed = await asyncio.to_thread(_side_task_inputs_changed, previous_text, clean_text)
+
+    tasks = [pipeline.run_incremental_pipeline(clean_text, changed_text, prior_pipeline)]
+    if permissions_changed:
+        tasks.append(risk_analyzer.map_permissions_async(clean_text))
+    if clauses_changed:
+        tasks.append(risk_analyzer.detect_hidden_clauses_async(clean_text))
+    results = iter(await asyncio.gather(*tasks))
+
+    pipeline_data = next(results)
+    if "error" not in pipeline_data:
+        pipeline_data["incremental_update"] = {
+            "changed_sections": diff["changed_count"],
+            "removed_sections": diff["removed_count"],
+            "total_sections": diff["total_count"],
+            "change_ratio": round(diff["change_ratio"], 4),
+        }
+    return {
+        "pipeline_data": pipeline_data,
+        "permission_data": next(results) if permissions_changed else prior_payload.get("permission_data", {}),
+        "hidden_clauses_data": next(results) if clauses_changed else prior_payload.get("hidden_clauses_data", {}),
+    }
+
+
+def _side_task_inputs_changed(previous_text: str, clean_text: str) -> tuple:
+    """(permissions, hidden clauses): whether the edit changes what each side task reads."""
+    return (
+        risk_analyzer.permission_inputs(previous_text) != risk_analyzer.permission_inputs(clean_text),
+        risk_analyzer.hidden_clause_inputs(previous_text) != risk_analyzer.hidden_clause_inputs(clean_text),
+    )
+
+
+def summarize(pipeline_data: dict) -> str:
+    """Short summary stored in processed_sites.risk_summary."""
+    summary_text = "Analysis complete."
+    if "trust_score" in pipeline_data:
+        summary_text = f"Trust Score: {pipeline_data['trust_score'].get('score')} ({pipeline_data['trust_score'].get('grade')})"
+    return summary_text
+
+
+def save_scan(db: Session, url: str, pipeline_data: dict, clean_text: str) -> None:
+    """Upserts the global scan record (used by /chat to find the policy text)."""
+    summary_text = summarize(pipeline_data)
+    existing = database.get_scan_by_url(db, url)
+    if existing:
+        existing.risk_summary = summary_text
+        existing.policy_text = clean_text
+        db.commit()
+    else:
+        database.create_scan(db, url, summary_text, "", clean_text)
@@ -0,0 +1,100 @@
+"""
+PrivaShield AI - Analysis Payload Views
+A stored analysis carries every verbatim quote and the full extracted_facts,
+tens of KB per policy. The extension popup only renders the score, red flags,
+permissions and hidden clauses, so clients can ask for less:
+
+    ?view=compact                          what the popup renders
+    ?fields=pipeline_data.trust_score,permission_data.permission_risk_score
+                                           only these (dotted) paths
+
+The full payload stays available by url_hash (GET /analysis/{url_hash}).
+"""
+
+from typing import Optional
+
+from fastapi import HTTPException
+
+VIEWS = ("full", "compact")
+
+_PIPELINE_KEYS = ("trust_score", "red_flags", "jurisdiction_signals", "jurisdiction_notes",
+                  "scoring_method", "error")
+_SECTION_KEYS = ("title", "summary", "risk_level")
+_PERMISSION_KEYS = ("name", "requested", "confidence", "purpose", "deny_consequence",
+                    "recommendation", "recommendation_reason")
+_PERMISSION_DATA_KEYS = ("total_permissions_requested", "unnecessary_permissions", "permission_risk_score", "error")
+_CLAUSE_KEYS = ("title", "original_text", "plain_english", "severity", "category", "action_recommended")
+_HIDDEN_DATA_KEYS = ("transparency_score", "overall_assessment", "error")
+
+
+def _pick(data, keys) -> dict:
+    return {k: data[k] for k in keys if k in data} if isinstance(data, dict) else {}
+
+
+def _compact_pipeline(data: dict) -> dict:
+    out = _pick(data, _PIPELINE_KEYS)
+    if isinstance(data.get("sections"), list):
+        out["sections"] = [_pick(s, _SECTION_KEYS) for s in data["sections"]]
+    if isinstance(data.get("verification"), dict):
+        out["verification"] = _pick(data["verification"], ("verification_passed", "method"))
+    return out
+
+
+def _compact_permissions(data: dict) -> dict:
+    out = _pick(data, _PERMISSION_DATA_KEYS)
+    if isinstance(data.get("permissions"), list):
+        out["permissions"] = [_pick(p, _PERMISSION_KEYS) for p in data["permissions"]]
+    return out
+
+
+def _compact_hidden(data: dict) -> dict:
+    out = _pick(data, _HIDDEN_DATA_KEYS)
+    if isinstance(data.get("hidden_clauses"), list):
+        out["hidden_clauses"] = [_pick(c, _CLAUSE_KEYS) for c in data["hidden_clauses"]]
+    return out
+
+
+_COMPACTORS = {
+    "pipeline_data": _compact_pipeline,
+    "permission_data": _compact_permissions,
+    "hidden_clauses_data": _compact_hidden,
+}
+
+
+def _select(payload: dict, fields: str) -> dict:
+    """Keeps only the comma-separated dotted paths in `fields` (missing paths are skipped)."""
+    out = {}
+    for path in filter(None, (f.strip() for f in fields.split(","))):
+        keys = path.split(".")
+        value = payload
+        for key in keys:
+            if not isinstance(value, dict) or key not in value:
+                break
+            value = value[key]
+        else:
+            target = out
+            for key in keys[:-1]:
+                target = target.setdefault(key, {})
+            target[keys[-1]] = value
+    return out
+
+
+def check_view(view: str) -> None:
+    if view not in VIEWS:
+        raise HTTPException(status_code=400, detail=f"Unknown view {view!r}; expected one of {', '.join(VIEWS)}.")
+
+
+def apply(payload: dict, view: str = "full", fields: Optional[str] = None) -> dict:
+    """
+    Returns the analysis sections (pipeline_data, permission_data,
+    hidden_clauses_data) of `payload` shaped by `view` and then `fields`.
+    Raises HTTPException(400) for an unknown view.
+    """
+    check_view(view)
+    sections = {key: payload.get(key) or {} for key in _COMPACTORS}
+    if view == "compact":
+        sections = {key: _COMPACTORS[key](value) for key, value in sections.items()}
+    if fields:
+        selected = _select(sections, fields)
+        sections = {key: selected.get(key, {}) for key in _COMPACTORS}
+    return sections
@@ -0,0 +1,345 @@
+"""
+PrivaShield AI - Offline Benchmark Runner
+Runs the real FastAPI app in-process (httpx ASGI transport, so event-loop
+blocking counts) against the mock LLM server, and reports per scenario:
+latency percentiles, throughput, errors, LLM calls made and process RSS.
+
+Scenarios:
+    cold_full_analysis    /full-analysis on policies never seen before
+    cached_full_analysis  the same policies again (analysis cache hits)
+    chat_burst            /chat questions (FAQ-like, paraphrased, off-topic) on analyzed policies
+    mixed                 60% chat, 30% cached analysis, 10% new policies
+
+Everything runs in a throwaway working directory (SQLite DB, storage/, LLM
+cache), so nothing touches the real database.
+
+Usage:
+    python -m rag.benchmarks.bench
+    python -m rag.benchmarks.bench --policies 40 --concurrency 16 --latency-ms 500
+    python -m rag.benchmarks.bench --corpus ./saved_policies --scenarios cold_full_analysis
+    python -m rag.benchmarks.bench --corpus rag/benchmarks/policies --baseline rag/benchmarks/baseline.json
+    python -m rag.benchmarks.bench --corpus rag/benchmarks/policies --save-baseline rag/benchmarks/baseline.json
+With --baseline, the exit status is 1 if any p50/p95 latency or throughput
+regressed by more than --max-regression, so CI can gate on it. Changes smaller
+than --min-delta-ms (latency, or scenario duration for throughput) are noise at
+these sizes (cached requests take ~20 ms) and never count.
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+import platform
+import tempfile
+from typing import Optional
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+RAG_DIR = os.path.dirname(BENCH_DIR)
+for _path in (RAG_DIR, BENCH_DIR):
+    if _path not in sys.path:
+        sys.path.insert(0, _path)
+
+import corpus  # noqa: E402
+from mock_llm import MockConfig, MockLLMServer  # noqa: E402
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+SCENARIOS = ["cold_full_analysis", "cached_full_analysis", "chat_burst", "mixed"]
+
+CHAT_QUESTIONS = [
+    "Can I delete my data?",
+    "How do I get my data deleted?",
+    "Do they sell my data?",
+    "Is my personal information sold to anyone?",
+    "How long is my data kept?",
+    "Do they use cookies or tracking?",
+    "Do I give up the right to sue?",
+    "Can they use my uploads to train AI?",
+    "Is the service safe for children?",
+    "What happens to my photos after I delete my account?",
+    "What is the refund policy for hardware?",
+    "Who is the CEO of the company?",
+]
+
+
+# ── Measurement ──────────────────────────────────────────────────────────────
+
+def _rss_mb() -> dict:
+    """Current resident set size (Linux /proc) and peak RSS (getrusage), in MB."""
+    usage = {}
+    try:
+        with open("/proc/self/statm", "r") as f:
+            usage["current"] = round(int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20, 1)
+    except (OSError, ValueError, IndexError):
+        pass
+    if resource is not None:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        usage["peak"] = round(peak / 2**20 if sys.platform == "darwin" else peak / 1024, 1)  # bytes on macOS
+    return usage
+
+
+def _percentile(values: list, pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    k = (len(ordered) - 1) * pct / 100
+    low = int(k)
+    high = min(low + 1, len(ordered) - 1)
+    return ordered[low] + (ordered[high] - ordered[low]) * (k - low)
+
+
+class Recorder:
+    def __init__(self):
+        self.latencies_ms = []
+        self.errors = []
+
+    async def call(self, send) -> Optional[object]:
+        start = time.perf_counter()
+        try:
+            response = await send()
+        except Exception as e:
+            self.errors.append(f"{type(e).__name__}: {e}")
+            return None
+        finally:
+            self.latencies_ms.append((time.perf_counter() - start) * 1000)
+        if response.status_code >= 400:
+            self.errors.append(f"HTTP {response.status_code}: {response.text[:200]}")
+        return response
+
+    def summary(self, duration: float) -> dict:
+        lat = self.latencies_ms
+        return {
+            "requests": len(lat),
+            "errors": len(self.errors),
+            "error_samples": self.errors[:3],
+            "duration_s": round(duration, 3),
+            "throughput_rps": round(len(lat) / duration, 2) if duration > 0 else 0.0,
+            "latency_ms": {
+                "mean": round(sum(lat) / len(lat), 1) if lat else 0.0,
+                "p50": round(_percentile(lat, 50), 1),
+                "p90": round(_percentile(lat, 90), 1),
+                "p95": round(_percentile(lat, 95), 1),
+                "p99": round(_percentile(lat, 99), 1),
+                "max": round(max(lat), 1) if lat else 0.0,
+            },
+        }
+
+
+async def _run_bounded(jobs: list, concurrency: int) -> None:
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def bounded(job):
+        async with semaphore:
+            await job()
+
+    await asyncio.gather(*(bounded(job) for job in jobs))
+
+
+def _llm_delta(before: dict, after: dict) -> dict:
+    return {k: after[k] - before.get(k, 0) for k in sorted(after) if after[k] - before.get(k, 0)}
+
+
+# ── Scenarios ────────────────────────────────────────────────────────────────
+
+def _analysis_job(client, recorder: Recorder, url: str, html: str):
+    return lambda: recorder.call(lambda: client.post("/full-analysis", json={"url": url, "html": html}))
+
+
+def _chat_job(client, recorder: Recorder, url: str, question: str):
+    return lambda: recorder.call(lambda: client.post("/chat", json={"url": url, "question": question}))
+
+
+def _jobs(name: str, client, recorder: Recorder, pages: list, fresh: list, args, rng: random.Random) -> list:
+    if name in ("cold_full_analysis", "cached_full_analysis"):
+        return [_analysis_job(client, recorder, url, html) for url, html in pages]
+    if name == "chat_burst":
+        return [
+            _chat_job(client, recorder, rng.choice(pages)[0], rng.choice(CHAT_QUESTIONS))
+            for _ in range(args.chat_requests)
+        ]
+    # mixed
+    jobs = []
+    fresh = list(fresh)
+    for _ in range(args.chat_requests):
+        roll = rng.random()
+        if roll < 0.1 and fresh:
+            url, html = fresh.pop()
+            jobs.append(_analysis_job(client, recorder, url, html))
+        elif roll < 0.4:
+            url, html = rng.choice(pages)
+            jobs.append(_analysis_job(client, recorder, url, html))
+        else:
+            jobs.append(_chat_job(client, recorder, rng.choice(pages)[0], rng.choice(CHAT_QUESTIONS)))
+    return jobs
+
+
+async def run_scenarios(app, mock: MockLLMServer, pages: list, fresh: list, args) -> dict:
+    import httpx
+    import faq
+
+    rng = random.Random(args.seed)
+    results = {}
+    transport = httpx.ASGITransport(app=app)
+    async with app.router.lifespan_context(app):
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+            for name in args.scenarios:
+                recorder = Recorder()
+                jobs = _jobs(name, client, recorder, pages, fresh, args, rng)
+                llm_before = mock.snapshot()
+                start = time.perf_counter()
+                await _run_bounded(jobs, args.concurrency)
+                duration = time.perf_counter() - start
+                # FAQ precompute runs in the background after an analysis; let it land before the next scenario.
+                if faq._pending:
+                    await asyncio.gather(*list(faq._pending), return_exceptions=True)
+                results[name] = recorder.summary(duration)
+                results[name]["llm_calls"] = _llm_delta(llm_before, mock.snapshot())
+                results[name]["rss_mb"] = _rss_mb()
+                _print_result(name, results[name])
+    return results
+
+
+# ── Reporting / baseline ─────────────────────────────────────────────────────
+
+def _print_result(name: str, result: dict) -> None:
+    lat = result["latency_ms"]
+    print(
+        f"  {name:<22} {result['requests']:>5} req  {result['errors']:>3} err  "
+        f"{result['throughput_rps']:>8.2f} req/s  p50 {lat['p50']:>8.1f}  p95 {lat['p95']:>8.1f}  "
+        f"p99 {lat['p99']:>8.1f} ms  LLM calls {result['llm_calls'].get('requests', 0):>4}  "
+        f"RSS {result['rss_mb'].get('current', '?')} MB"
+    )
+    for sample in result["error_samples"]:
+        print(f"      error: {sample}")
+
+
+def compare(report: dict, baseline: dict, max_regression: float, min_delta_ms: float = 0.0) -> list[str]:
+    """
+    Human-readable regressions of `report` against `baseline` beyond `max_regression`
+    (0.2 = 20%) and, in absolute terms, `min_delta_ms`.
+    """
+    regressions = []
+    for name, current in report["scenarios"].items():
+        previous = baseline.get("scenarios", {}).get(name)
+        if not previous:
+            continue
+        for pct in ("p50", "p95"):
+            old, new = previous["latency_ms"][pct], current["latency_ms"][pct]
+            if old > 0 and new > old * (1 + max_regression) and new - old > min_delta_ms:
+                regressions.append(f"{name}: {pct} latency {old:.1f} -> {new:.1f} ms (+{(new / old - 1):.0%})")
+        old, new = previous["throughput_rps"], current["throughput_rps"]
+        slower_ms = (current["duration_s"] - previous["duration_s"]) * 1000
+        if old > 0 and new < old * (1 - max_regression) and slower_ms > min_delta_ms:
+            regressions.append(f"{name}: throughput {old:.2f} -> {new:.2f} req/s ({(new / old - 1):.0%})")
+        if current["errors"] > previous["errors"]:
+            regressions.append(f"{name}: errors {previous['errors']} -> {current['errors']}")
+    return regressions
+
+
+def _parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Offline PrivaShield benchmarks against a mock LLM.")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS),
+                        help=f"comma-separated subset of: {', '.join(SCENARIOS)}")
+    parser.add_argument("--policies", type=int, default=20, help="synthetic policies to analyze")
+    parser.add_argument("--corpus", help="directory of saved policy HTML to use instead of the synthetic corpus")
+    parser.add_argument("--chat-requests", type=int, default=100, help="requests in chat_burst and mixed")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--latency-ms", type=float, default=300.0, help="mock LLM latency per call")
+    parser.add_argument("--jitter-ms", type=float, default=50.0)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of LLM calls answered with 429")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--workdir", help="working directory (default: a fresh temporary directory)")
+    parser.add_argument("--report", help="write the JSON report here")
+    parser.add_argument("--baseline", help="JSON report to compare against")
+    parser.add_argument("--max-regression", type=float, default=0.2)
+    parser.add_argument("--min-delta-ms", type=float, default=25.0,
+                        help="ignore latency / duration changes smaller than this")
+    parser.add_argument("--save-baseline", help="write this run's report as the new baseline")
+    args = parser.parse_args(argv)
+    args.scenarios = [s.strip() for s in args.scenarios.split(",") if s.strip()]
+    unknown = set(args.scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(sorted(unknown))}")
+    return args
+
+
+def main(argv=None) -> int:
+    args = _parse_args(argv)
+    # Resolve output paths before leaving the caller's directory.
+    for attr in ("corpus", "report", "baseline", "save_baseline"):
+        if getattr(args, attr):
+            setattr(args, attr, os.path.abspath(getattr(args, attr)))
+
+    if args.corpus:
+        pages = corpus.load(args.corpus)
+        fresh = []
+    else:
+        generated = corpus.generate(args.policies + max(1, args.chat_requests // 10), args.seed)
+        pages, fresh = generated[:args.policies], generated[args.policies:]
+    if not pages:
+        print("No policies to benchmark.")
+        return 2
+
+    mock = MockLLMServer(MockConfig(
+        latency_ms=args.latency_ms, jitter_ms=args.jitter_ms, error_rate=args.error_rate, seed=args.seed,
+    )).start()
+
+    # Storage paths are relative and load_dotenv() does not override variables
+    # that are already set, so point everything at the workdir and the mock first.
+    workdir = os.path.abspath(args.workdir or tempfile.mkdtemp(prefix="privashield-bench-"))
+    os.makedirs(workdir, exist_ok=True)
+    os.chdir(workdir)
+    os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(workdir, 'bench.db')}"
+    os.environ["LLM_BASE_URL"] = mock.base_url
+    os.environ["GROQ_API_KEY"] = "bench-key"
+    os.environ.setdefault("HF_HUB_OFFLINE", "1")
+
+    import ai_engine
+    import database
+    from run import app
+    database.init_db()
+
+    print(f"[Bench] {len(pages)} policies, concurrency {args.concurrency}, "
+          f"mock LLM {args.latency_ms:.0f}ms, workdir {workdir}")
+    try:
+        scenarios = asyncio.run(run_scenarios(app, mock, pages, fresh, args))
+    finally:
+        mock.stop()
+
+    report = {
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "config": {k: getattr(args, k) for k in (
+            "policies", "chat_requests", "concurrency", "latency_ms", "jitter_ms", "error_rate", "seed",
+        )},
+        "corpus": os.path.relpath(args.corpus, RAG_DIR) if args.corpus else "synthetic",
+        # Chat latency depends on it; the embedding model is not downloaded offline.
+        "retrieval": "embedding" if ai_engine.embedding_model is not None else "token_overlap",
+        "scenarios": scenarios,
+    }
+    for path in (args.report, args.save_baseline):
+        if path:
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump(report, f, indent=2)
+            print(f"[Bench] Report written to {path}")
+
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            regressions = compare(report, json.load(f), args.max_regression, args.min_delta_ms)
+        if regressions:
+            print(f"[Bench] {len(regressions)} regression(s) beyond {args.max_regression:.0%}:")
+            for line in regressions:
+                print(f"  {line}")
+            return 1
+        print(f"[Bench] No regressions beyond {args.max_regression:.0%} against {args.baseline}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
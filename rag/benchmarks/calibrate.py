@@ -0,0 +1,137 @@
+"""
+PrivaShield AI - Threshold Calibration
+Derives the local decision thresholds from the labelled sets in rag/tests/data/
+and prints them next to the values currently configured:
+
+    permissions   PERMISSION_ACCEPT_THRESHOLD / PERMISSION_REJECT_THRESHOLD from
+                  permission_pairs.json (policy sentence, permission, requested?),
+                  each sentence scored by permission_matcher like a one-chunk policy
+    silence       CHAT_SILENT_THRESHOLD_OVERLAP / CHAT_SILENT_THRESHOLD_EMBEDDING from
+                  silence_questions.json (question, benchmark policy, answerable?),
+                  scored by the best retrieved chunk of that policy; the embedding
+                  value needs the model, token overlap does not
+
+Thresholds are placed on a 0.05 grid: "accept" just above the highest-scoring
+negative (no false "requested"), "reject" at the lowest-scoring positive (no
+false "not requested"); whatever falls between goes to the LLM. The silence
+threshold is the highest value that silences no answerable question.
+
+Usage:
+    python -m rag.benchmarks.calibrate permissions
+    python -m rag.benchmarks.calibrate silence
+"""
+
+import os
+import sys
+import json
+import math
+import argparse
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+RAG_DIR = os.path.dirname(BENCH_DIR)
+DATA_DIR = os.path.join(RAG_DIR, "tests", "data")
+if RAG_DIR not in sys.path:
+    sys.path.insert(0, RAG_DIR)
+
+GRID = 0.05
+
+
+def _floor(value: float) -> float:
+    return round(math.floor(value / GRID + 1e-9) * GRID, 2)
+
+
+def load_labelled(name: str) -> list[dict]:
+    with open(os.path.join(DATA_DIR, name), "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def fit_accept_reject(scored: list[tuple]) -> tuple:
+    """(accept, reject) for [(score, is_positive)]; reject never exceeds accept."""
+    negatives = [score for score, positive in scored if not positive]
+    positives = [score for score, positive in scored if positive]
+    accept = round(_floor(max(negatives, default=0.0)) + GRID, 2)
+    reject = min(_floor(min(positives, default=1.0)), accept)
+    return accept, reject
+
+
+def fit_silence(scored: list[tuple]) -> float:
+    """Highest threshold at which no answerable question in [(score, answerable)] is silenced."""
+    return _floor(min((score for score, answerable in scored if answerable), default=0.0))
+
+
+def score_permission_pairs(pairs: list[dict] = None) -> list[tuple]:
+    """[(score, requested)] per labelled pair, or None without an embedding model."""
+    import permission_matcher
+
+    pairs = pairs if pairs is not None else load_labelled("permission_pairs.json")
+    scored = []
+    for pair in pairs:
+        matches = permission_matcher.score_permissions([{"text": pair["text"]}])
+        if matches is None:
+            return None
+        scored.append((matches[pair["permission"]]["score"], pair["requested"]))
+    return scored
+
+
+def _calibrate_permissions() -> int:
+    import permission_matcher
+
+    scored = score_permission_pairs()
+    if scored is None:
+        print("No embedding model loaded (all-MiniLM-L6-v2); permission thresholds cannot be measured.")
+        return 2
+    accept, reject = fit_accept_reject(scored)
+    print(f"{len(scored)} labelled pairs ({sum(p for _, p in scored)} requested)")
+    print(f"derived:    PERMISSION_ACCEPT_THRESHOLD={accept}  PERMISSION_REJECT_THRESHOLD={reject}")
+    print(f"configured: PERMISSION_ACCEPT_THRESHOLD={permission_matcher.ACCEPT_THRESHOLD}  "
+          f"PERMISSION_REJECT_THRESHOLD={permission_matcher.REJECT_THRESHOLD}")
+    return 0
+
+
+def score_silence_questions(questions: list[dict] = None) -> dict:
+    """{scorer: [(best chunk score, answerable)]}; "embedding" only with a model loaded."""
+    import ai_engine
+
+    questions = questions if questions is not None else load_labelled("silence_questions.json")
+    scored = {"token_overlap": []}
+    for policy in dict.fromkeys(q["policy"] for q in questions):
+        with open(os.path.join(BENCH_DIR, "policies", policy), "r", encoding="utf-8") as f:
+            text = ai_engine.clean_html(f.read())
+        chunks = ai_engine.chunk_text(text)
+        labelled = [q for q in questions if q["policy"] == policy]
+        for q in labelled:
+            best = ai_engine.rank_by_token_overlap(q["question"], [dict(c) for c in chunks], 1)
+            scored["token_overlap"].append((best[0]["similarity_score"] if best else 0.0, q["answerable"]))
+        if ai_engine.embedding_model is not None:
+            retrieved = ai_engine.retrieve_for_questions([q["question"] for q in labelled], text)
+            for q, (top, _, scorer) in zip(labelled, retrieved):
+                scored.setdefault(scorer, []).append((top[0]["similarity_score"] if top else 0.0, q["answerable"]))
+    return scored
+
+
+def _calibrate_silence() -> int:
+    import ai_engine
+
+    for scorer, scored in score_silence_questions().items():
+        threshold = fit_silence(scored)
+        silenced = sum(1 for score, answerable in scored if not answerable and score < threshold)
+        unanswerable = sum(1 for _, answerable in scored if not answerable)
+        print(f"{scorer}: derived {threshold} (silences {silenced}/{unanswerable} unanswerable questions), "
+              f"configured {ai_engine.SILENT_THRESHOLDS[scorer]}")
+    if ai_engine.embedding_model is None:
+        print("No embedding model loaded (all-MiniLM-L6-v2); the embedding threshold cannot be measured.")
+    return 0
+
+
+COMMANDS = {"permissions": _calibrate_permissions, "silence": _calibrate_silence}
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Derive local decision thresholds from the labelled test sets.")
+    parser.add_argument("target", choices=sorted(COMMANDS))
+    args = parser.parse_args(argv)
+    return COMMANDS[args.target]()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,160 @@
+"""
+PrivaShield AI - Benchmark Policy Corpus
+Deterministic synthetic privacy-policy pages for the offline benchmarks. Each
+page mixes the clause types the analysis looks for (sale, arbitration,
+retention, cookies, children, licensing...) with filler sections, so pages vary
+in size and in which detectors fire, but a given seed always yields the same
+corpus.
+
+Write it to disk (HTML files + manifest.tsv, also usable by warm.py); load()
+reads such a directory back, or any directory of saved policy pages:
+    python -m rag.benchmarks.corpus ./bench_corpus --count 50
+
+benchmarks/policies/ holds five complete policy pages with real-world markup
+(cookie banners, navigation, tables, inline scripts, JSON-LD) for fictional
+companies, and benchmarks/baseline.json the report measured on them.
+"""
+
+import os
+import random
+import argparse
+from html import escape
+
+CLAUSES = {
+    "Information We Collect": [
+        "We collect your name, email address, phone number and payment details when you create an account.",
+        "We automatically collect your IP address, device identifiers, browser type and precise location from GPS.",
+        "We may access your camera and microphone when you use video features, and your contacts if you choose to invite friends.",
+    ],
+    "How We Share Information": [
+        "We share personal information with service providers who process it on our behalf.",
+        "We may sell your personal information to data brokers and advertising partners for monetary consideration.",
+        "We do not sell your personal information to third parties.",
+        "We may disclose information to law enforcement or government authorities in response to a subpoena or court order.",
+    ],
+    "Data Retention": [
+        "We retain personal information for 24 months after your last activity, after which it is deleted.",
+        "We retain your information for as long as necessary for our business purposes, and backup copies may persist even after you delete your account.",
+        "We keep your data indefinitely unless you ask us to delete it.",
+    ],
+    "Your Rights and Choices": [
+        "You can delete your account and associated data at any time from the settings page.",
+        "You may request deletion of your data by emailing our privacy team; some information may be retained as required by law.",
+        "You may opt out of marketing emails by clicking the unsubscribe link.",
+    ],
+    "Cookies and Tracking": [
+        "We use cookies and similar technologies that are enabled by default; you may opt out in your browser settings.",
+        "We only set non-essential cookies after you opt in through our cookie banner.",
+        "We link activity across your devices and browsers to build a cross-device profile for advertising.",
+    ],
+    "Children's Privacy": [
+        "Our services are not directed to children under 13 and we do not knowingly collect their data.",
+        "Users must be at least 16 years old to create an account.",
+    ],
+    "Dispute Resolution": [
+        "Any dispute will be resolved by binding individual arbitration, and you waive your right to participate in a class action or jury trial.",
+        "Disputes are governed by the laws of the State of California and resolved in its courts.",
+    ],
+    "Content You Provide": [
+        "By uploading content you grant us a worldwide, perpetual, irrevocable, royalty-free license to use, modify and distribute it.",
+        "You retain ownership of your content; we use it only to provide the service.",
+    ],
+    "Changes to This Policy": [
+        "We may change this policy at any time without prior notice; continued use means you accept the changes.",
+        "We will notify you by email at least 30 days before material changes take effect.",
+    ],
+    "Artificial Intelligence": [
+        "We may use your messages and uploads to train our machine learning models and improve our AI features.",
+    ],
+    "Subscriptions": [
+        "Subscriptions automatically renew until you cancel, and fees are non-refundable.",
+    ],
+}
+
+FILLER = [
+    "This section describes our practices in more detail and applies to all of our websites, applications and services.",
+    "We implement administrative, technical and physical safeguards designed to protect your information.",
+    "Where required by applicable law, we rely on your consent or our legitimate interests to process information.",
+    "Our partners are contractually required to protect your information and use it only for the purposes we specify.",
+    "If you have questions about this section, please contact us using the details at the end of this policy.",
+    "Information may be transferred to and processed in countries other than the one in which you reside.",
+]
+
+
+def _page(rng: random.Random, index: int) -> tuple:
+    url = f"https://bench-{index:05d}.example.com/privacy"
+    sections = []
+    for heading, options in CLAUSES.items():
+        if rng.random() < 0.85:
+            paragraphs = [rng.choice(options)]
+            paragraphs += rng.sample(FILLER, k=rng.randint(1, 4))
+            sections.append((heading, paragraphs))
+    rng.shuffle(sections)
+    # Long policies are the expensive case; pad some pages well past the prompt window.
+    for n in range(rng.choice([0, 0, 2, 6, 12])):
+        sections.append((f"Additional Terms {n + 1}", rng.sample(FILLER, k=len(FILLER))))
+
+    body = "\n".join(
+        f"<h2>{escape(heading)}</h2>\n" + "\n".join(f"<p>{escape(p)}</p>" for p in paragraphs)
+        for heading, paragraphs in sections
+    )
+    html = (
+        f"<!DOCTYPE html><html><head><title>Privacy Policy - Bench {index}</title>"
+        f'<link rel="canonical" href="{url}"></head>'
+        f"<body><nav>Home | Products | Support</nav><main><h1>Privacy Policy</h1>\n"
+        f"<p>Last updated: January {1 + index % 28}, 2025</p>\n{body}\n</main>"
+        f"<footer>Copyright Bench {index}</footer><script>var tracking = true;</script></body></html>"
+    )
+    return url, html
+
+
+def generate(count: int, seed: int = 7) -> list[tuple]:
+    """[(url, html)] — `count` distinct policy pages."""
+    rng = random.Random(seed)
+    return [_page(rng, i) for i in range(count)]
+
+
+def write(directory: str, count: int, seed: int = 7) -> str:
+    """Writes the corpus as HTML files plus manifest.tsv; returns the directory."""
+    os.makedirs(directory, exist_ok=True)
+    lines = []
+    for i, (url, html) in enumerate(generate(count, seed)):
+        name = f"policy_{i:05d}.html"
+        with open(os.path.join(directory, name), "w", encoding="utf-8") as f:
+            f.write(html)
+        lines.append(f"{name}\t{url}")
+    with open(os.path.join(directory, "manifest.tsv"), "w", encoding="utf-8") as f:
+        f.write("\n".join(lines) + "\n")
+    return directory
+
+
+def load(directory: str) -> list[tuple]:
+    """[(url, html)] from a directory of saved pages, with URLs from its manifest.tsv when present."""
+    manifest = {}
+    manifest_path = os.path.join(directory, "manifest.tsv")
+    if os.path.exists(manifest_path):
+        with open(manifest_path, "r", encoding="utf-8") as f:
+            for line in f:
+                name, _, url = line.strip().partition("\t")
+                if url:
+                    manifest[name] = url
+    pages = []
+    for name in sorted(os.listdir(directory)):
+        if name.lower().endswith((".html", ".htm")):
+            with open(os.path.join(directory, name), "r", encoding="utf-8", errors="replace") as f:
+                pages.append((manifest.get(name, f"https://bench.local/{name}"), f.read()))
+    return pages
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Write the synthetic benchmark policy corpus.")
+    parser.add_argument("directory")
+    parser.add_argument("--count", type=int, default=50)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+    write(args.directory, args.count, args.seed)
+    print(f"Wrote {args.count} policies to {args.directory}")
+
+
+if __name__ == "__main__":
+    main()
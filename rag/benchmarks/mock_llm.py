@@ -0,0 +1,300 @@
+"""
+PrivaShield AI - Mock OpenAI-compatible LLM Server
+Offline stand-in for the Groq API: POST /v1/chat/completions answers every
+PrivaShield prompt (extractor, verifier, chat, ...) with canned JSON in the
+right shape, after a configurable latency. It can inject 429s, and it streams
+when asked (`"stream": true`). Usage reports prompt_tokens_details.cached_tokens
+for the longest prefix shared with a recent prompt, like provider prompt caching.
+
+GET /stats returns request counts per task, so benchmarks can show how many
+LLM calls a scenario needed.
+
+Standalone:
+    python -m rag.benchmarks.mock_llm --port 8099 --latency-ms 400 --error-rate 0.05
+    LLM_BASE_URL=http://127.0.0.1:8099/v1 python run.py
+"""
+
+import re
+import json
+import time
+import random
+import argparse
+import threading
+from collections import Counter, deque
+from dataclasses import dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+@dataclass
+class MockConfig:
+    latency_ms: float = 300.0      # time to first token / full reply
+    jitter_ms: float = 50.0
+    error_rate: float = 0.0        # share of requests answered with 429
+    stream_chunk_chars: int = 12
+    stream_chunk_ms: float = 5.0
+    seed: int = 7
+
+
+# ──────────────────────────────────────────────
+#  CANNED REPLIES
+# ──────────────────────────────────────────────
+
+_SENTENCE_RE = re.compile(r"[A-Z][^.\n<>]{30,220}\.")
+
+
+def _quotes(prompt: str, n: int = 6) -> list:
+    """Sentences from the policy in the prompt, so source quotes are verbatim."""
+    document = prompt.split("<document>", 1)[-1].split("</document>", 1)[0]
+    return _SENTENCE_RE.findall(document)[:n] or ["We collect information you provide to us."]
+
+
+def _indexes(prompt: str) -> int:
+    found = [int(i) for i in re.findall(r'"index": (\d+)', prompt)]
+    return max(found) + 1 if found else 1
+
+
+def _extractor(prompt):
+    q = _quotes(prompt)
+    pick = lambda i: q[i % len(q)]
+    return {
+        "document_type": "privacy_policy",
+        "detected_jurisdiction_signals": ["CCPA"],
+        "effective_date": None,
+        "last_updated": "January 2025",
+        "extracted_facts": {
+            "data_collected": [{"item": "contact details", "source_quote": pick(0)}],
+            "data_use_purposes": [{"purpose": "provide the service", "source_quote": pick(1)}],
+            "third_party_sharing": [{"party_type": "service providers", "purpose": "processing", "source_quote": pick(2)}],
+            "retention_period": {"stated": "24 months", "source_quote": pick(3), "multiple_mentions": False},
+            "deletion_mechanism": {"exists": True, "source_quote": pick(4)},
+            "tracking_cookies": {"default_state": "opt-out", "source_quote": pick(5)},
+            "arbitration_clause": {"exists": False, "waives_class_action": False, "source_quote": None},
+            "policy_change_notice": {"method": "email", "source_quote": None},
+            "childrens_data": {"addressed": True, "min_age_stated": 13, "source_quote": None},
+            "content_license_grant": {"exists": False, "scope": None, "source_quote": None},
+        },
+        "contradictions_found": [],
+        "completeness_warning": None,
+    }
+
+
+def _sections():
+    return {
+        "sections": [
+            {"title": "Data Sharing", "summary": "Data is shared with service providers.", "risk_level": "MEDIUM", "source_quote": None},
+            {"title": "Tracking", "summary": "Tracking cookies are on by default.", "risk_level": "MEDIUM", "source_quote": None},
+        ],
+        "red_flags": ["Tracking enabled by default (opt-out)"],
+        "jurisdiction_notes": "CCPA signals detected.",
+    }
+
+
+def _risk_analyzer(prompt):
+    return {
+        "trust_score": {"score": 90, "grade": "A", "score_breakdown": [
+            {"factor": "Tracking enabled by default (opt-out)", "deduction": -10, "confidence": "High"},
+        ]},
+        **_sections(),
+    }
+
+
+def _answers(prompt, extra):
+    return {"answers": [
+        {"index": i, "answer": "The policy addresses this in the cited section.", "confidence": "Medium",
+         "document_silent_on_topic": False, **extra}
+        for i in range(_indexes(prompt))
+    ]}
+
+
+RESPONDERS = [
+    # Most specific markers first; document prompts all share the same preamble.
+    ("You are the Extraction Agent", "extractor", _extractor),
+    ("You are the Verification Agent", "verifier",
+     lambda p: {"verification_passed": True, "issues_found": [], "corrected_output": None}),
+    ("trust score below was already computed", "risk_prose", lambda p: _sections()),
+    ("WEIGHTED SCORING MODEL", "risk_analyzer", _risk_analyzer),
+    ("An automatic pre-screen could not decide", "permissions_ambiguous",
+     lambda p: {"permissions": [], "unnecessary_permissions": []}),
+    ("map it to device-level permissions", "permissions",
+     lambda p: {"permissions": [], "total_permissions_requested": 0, "unnecessary_permissions": [], "permission_risk_score": 1}),
+    ("Candidate Passages:", "hidden_clauses",
+     lambda p: {"hidden_clauses": [], "transparency_score": 7, "overall_assessment": "No hidden clauses confirmed."}),
+    ("find ALL hidden", "hidden_clauses_full",
+     lambda p: {"hidden_clauses": [], "transparency_score": 7, "overall_assessment": "No hidden clauses found."}),
+    ("extract key risks", "risks",
+     lambda p: {"overall_risk_score": 4, "risk_level": "MEDIUM", "data_collected": [], "third_party_sharing": [],
+                "hidden_clauses": [], "user_rights": {}, "retention_policy": "24 months", "red_flags": []}),
+    ("using ONLY the structured facts", "faq", lambda p: _answers(p, {"source_quotes": _quotes(p, 1)})),
+    ("several user questions", "chat_batch", lambda p: _answers(p, {"cited_chunks": ["chunk_0"]})),
+    ("You are the Q&A Agent", "chat",
+     lambda p: {"answer": "According to the policy, this is covered in the cited section.", "confidence": "Medium",
+                "cited_chunks": ["chunk_0"], "document_silent_on_topic": False}),
+    ("You are a Privacy Expert", "summary", lambda p: "- **Data Collected:** contact details\n- **Risk Score:** 4"),
+]
+
+
+def reply_for(prompt: str) -> tuple:
+    """(task, reply text) for a PrivaShield prompt."""
+    for marker, task, build in RESPONDERS:
+        if marker in prompt:
+            body = build(prompt)
+            return task, body if isinstance(body, str) else json.dumps(body)
+    return "unknown", json.dumps({"answer": "ok"})
+
+
+# ──────────────────────────────────────────────
+#  SERVER
+# ──────────────────────────────────────────────
+
+class MockLLMServer:
+    """Threaded HTTP server; start() returns immediately, `base_url` goes into LLM_BASE_URL."""
+
+    def __init__(self, config: MockConfig = None, host: str = "127.0.0.1", port: int = 0):
+        self.config = config or MockConfig()
+        self.counts = Counter()
+        self._recent_prompts = deque(maxlen=32)
+        self._lock = threading.Lock()
+        self._rng = random.Random(self.config.seed)
+        self._httpd = ThreadingHTTPServer((host, port), self._handler())
+        self._httpd.daemon_threads = True
+        self._thread = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def start(self) -> "MockLLMServer":
+        self._thread = threading.Thread(target=self._httpd.serve_forever, name="mock-llm", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return dict(self.counts)
+
+    def _cached_tokens(self, prompt: str) -> int:
+        """Longest shared prefix with a recent prompt, in 128-token blocks (~4 chars per token)."""
+        with self._lock:
+            best = 0
+            for previous in self._recent_prompts:
+                n = 0
+                for a, b in zip(previous, prompt):
+                    if a != b:
+                        break
+                    n += 1
+                best = max(best, n)
+            self._recent_prompts.append(prompt)
+        return (best // 4) // 128 * 128
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def _send_json(self, status: int, payload: dict, headers: dict = None):
+                body = json.dumps(payload).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_GET(self):
+                if self.path.rstrip("/") == "/stats":
+                    return self._send_json(200, server.snapshot())
+                self._send_json(404, {"error": {"message": "not found"}})
+
+            def do_POST(self):
+                if not self.path.endswith("/chat/completions"):
+                    return self._send_json(404, {"error": {"message": "not found"}})
+                length = int(self.headers.get("Content-Length") or 0)
+                request = json.loads(self.rfile.read(length) or b"{}")
+                prompt = "\n".join(str(m.get("content", "")) for m in request.get("messages", []))
+                config = server.config
+
+                with server._lock:
+                    throttled = server._rng.random() < config.error_rate
+                    delay = max(0.0, config.latency_ms + server._rng.uniform(-config.jitter_ms, config.jitter_ms)) / 1000
+                if throttled:
+                    with server._lock:
+                        server.counts["rate_limited"] += 1
+                    return self._send_json(
+                        429,
+                        {"error": {"message": "Rate limit reached (mock)", "type": "tokens", "code": "rate_limit_exceeded"}},
+                        {"retry-after-ms": "50", "retry-after": "0"},
+                    )
+
+                task, content = reply_for(prompt)
+                with server._lock:
+                    server.counts[task] += 1
+                    server.counts["requests"] += 1
+                usage = {
+                    "prompt_tokens": len(prompt) // 4,
+                    "completion_tokens": len(content) // 4,
+                    "total_tokens": (len(prompt) + len(content)) // 4,
+                    "prompt_tokens_details": {"cached_tokens": server._cached_tokens(prompt)},
+                }
+                model = request.get("model", "mock")
+                time.sleep(delay)
+
+                if request.get("stream"):
+                    return self._stream(model, content, usage)
+                self._send_json(200, {
+                    "id": "mock-1", "object": "chat.completion", "created": int(time.time()), "model": model,
+                    "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+                    "usage": usage,
+                })
+
+            def _stream(self, model: str, content: str, usage: dict):
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Connection", "close")
+                self.end_headers()
+                step = max(1, server.config.stream_chunk_chars)
+                for i in range(0, len(content), step):
+                    chunk = {"id": "mock-1", "object": "chat.completion.chunk", "created": int(time.time()), "model": model,
+                             "choices": [{"index": 0, "delta": {"content": content[i:i + step]}, "finish_reason": None}]}
+                    self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+                    self.wfile.flush()
+                    time.sleep(server.config.stream_chunk_ms / 1000)
+                final = {"id": "mock-1", "object": "chat.completion.chunk", "created": int(time.time()), "model": model,
+                         "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}], "usage": usage}
+                self.wfile.write(f"data: {json.dumps(final)}\n\ndata: [DONE]\n\n".encode("utf-8"))
+                self.wfile.flush()
+                self.close_connection = True
+
+        return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline OpenAI-compatible mock for PrivaShield benchmarks.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8099)
+    parser.add_argument("--latency-ms", type=float, default=300.0)
+    parser.add_argument("--jitter-ms", type=float, default=50.0)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of requests answered with 429")
+    args = parser.parse_args()
+
+    config = MockConfig(latency_ms=args.latency_ms, jitter_ms=args.jitter_ms, error_rate=args.error_rate)
+    server = MockLLMServer(config, args.host, args.port).start()
+    print(f"[Mock LLM] Serving {server.base_url} (latency {args.latency_ms}ms, 429 rate {args.error_rate:.0%})")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,154 @@
+"""
+PrivaShield AI - Lexical Clause Detector
+One-pass, compiled multi-pattern matcher for the 10 hidden-clause categories.
+It scans the FULL policy (not just the first 15k chars) and returns candidate
+passages with offsets, so the LLM only reads text that can contain a clause and
+a preliminary result is available instantly when the LLM is throttled.
+"""
+
+import re
+from typing import Dict, List
+
+# Category key -> (label used in the LLM prompt/output, lexical signatures)
+CLAUSE_CATEGORIES = {
+    "perpetual_license": (
+        "Perpetual content ownership / license grants",
+        r"perpetual|irrevocable|royalty[- ]free|sub-?licensable|worldwide,? (non-exclusive )?licen[cs]e",
+    ),
+    "data_sale": (
+        "Data selling to third parties",
+        r"\bsell(s|ing)?\b|\bsold\b|\bsale of (your )?(personal )?(data|information)|\brent(s|ing)? (your )?(data|information)"
+        r"|monetary (or other valuable )?consideration|data brokers?",
+    ),
+    "arbitration": (
+        "Arbitration clauses that waive class-action rights",
+        r"arbitrat\w*|class[- ]action|jury trial|class[- ]wide",
+    ),
+    "auto_renewal": (
+        "Auto-renewal / cancellation traps",
+        r"auto(matic(ally)?)?[- ]renew\w*|recurring (billing|charges?|payments?)|until (you )?cancel|cancellation fees?|non-refundable",
+    ),
+    "terms_change": (
+        "Right to change terms without notice",
+        r"(change|modify|update|amend|revise)\w* (these|this|our|the) (terms|policy|agreement)"
+        r"|without (prior )?notice|(in|at) our sole discretion",
+    ),
+    "retention_after_deletion": (
+        "Data retention after account deletion",
+        r"after (you )?(delete|deletion|close|closing|terminat\w*)|backup (copies|archives|systems)|residual copies"
+        r"|even after (you|your account)",
+    ),
+    "cross_device": (
+        "Cross-device tracking",
+        r"cross[- ]device|across (your |all )?(devices|browsers)|device graph|(browser|device) fingerprint\w*",
+    ),
+    "government_sharing": (
+        "Sharing data with government/law enforcement without warrant",
+        r"law enforcement|government(al)? (authorit\w*|agenc\w*|requests?)|subpoena|court order|legal process|national security",
+    ),
+    "ai_training": (
+        "Using data for AI/ML training",
+        r"machine[- ]learning|artificial intelligence|\bA\.?I\.? (models?|systems?|features?)|train(ing)? (our |the )?(models?|algorithms?)"
+        r"|large language models?",
+    ),
+    "indemnification": (
+        "Broad indemnification clauses",
+        r"indemnif\w*|hold (us |\w+ )?harmless|defend,? indemnify",
+    ),
+}
+
+_COMBINED_RE = re.compile(
+    "|".join(f"(?P<{key}>{pattern})" for key, (_, pattern) in CLAUSE_CATEGORIES.items()),
+    re.IGNORECASE,
+)
+
+PASSAGE_RADIUS = 300             # chars of context on each side of a match
+MAX_PASSAGE_CHARS = 1500         # merged passages stop growing here; further matches start a new one
+MAX_PASSAGES_PER_CATEGORY = 3
+MAX_TOTAL_CHARS = 12000          # prompt budget for all passages together
+
+
+def _expand(text: str, start: int, end: int) -> tuple:
+    """Widens a match to roughly sentence boundaries within PASSAGE_RADIUS."""
+    lo = max(0, start - PASSAGE_RADIUS)
+    hi = min(len(text), end + PASSAGE_RADIUS)
+    cut = max(text.rfind(". ", lo, start), text.rfind("\n", lo, start))
+    lo = cut + 1 if cut != -1 else lo
+    stops = [i for i in (text.find(". ", end, hi), text.find("\n", end, hi)) if i != -1]
+    hi = min(stops) + 1 if stops else hi
+    return lo, hi
+
+
+def find_candidates(text: str) -> Dict[str, List[dict]]:
+    """
+    Scans the whole text once and returns {category: [{"start", "end", "text", "match"}]}.
+    Overlapping passages within a category are merged up to MAX_PASSAGE_CHARS;
+    each category is capped, and all passages together fit in MAX_TOTAL_CHARS.
+    """
+    spans: Dict[str, List[list]] = {}
+    for m in _COMBINED_RE.finditer(text):
+        category = m.lastgroup
+        lo, hi = _expand(text, m.start(), m.end())
+        bucket = spans.setdefault(category, [])
+        if bucket and lo <= bucket[-1][1] and max(bucket[-1][1], hi) - bucket[-1][0] <= MAX_PASSAGE_CHARS:
+            bucket[-1][1] = max(bucket[-1][1], hi)
+        elif len(bucket) < MAX_PASSAGES_PER_CATEGORY and all(text[lo:hi] != text[b[0]:b[1]] for b in bucket):
+            bucket.append([lo, hi, m.group(0)])  # repeated boilerplate is only sent once
+
+    candidates = {}
+    budget = MAX_TOTAL_CHARS
+    # Round-robin over categories so one noisy category cannot eat the whole budget.
+    for rank in range(MAX_PASSAGES_PER_CATEGORY):
+        for category, bucket in spans.items():
+            if rank >= len(bucket):
+                continue
+            lo, hi, matched = bucket[rank]
+            passage = text[lo:hi].strip()
+            if len(passage) > budget:
+                continue   # a shorter passage of another category may still fit
+            budget -= len(passage)
+            candidates.setdefault(category, []).append(
+                {"start": lo, "end": hi, "text": passage, "match": matched}
+            )
+    return candidates
+
+
+def format_passages(candidates: Dict[str, List[dict]]) -> tuple:
+    """Returns (prompt block, {passage_id: passage}) with stable ids like P1, P2…"""
+    lines = []
+    index = {}
+    n = 0
+    for category, passages in candidates.items():
+        label = CLAUSE_CATEGORIES[category][0]
+        for passage in passages:
+            n += 1
+            pid = f"P{n}"
+            index[pid] = {**passage, "category": category}
+            lines.append(f'[{pid}] candidate_category="{label}" offset={passage["start"]}-{passage["end"]}\n"{passage["text"]}"')
+    return "\n\n".join(lines), index
+
+
+def preliminary_result(candidates: Dict[str, List[dict]]) -> dict:
+    """
+    Hidden-clause result built from lexical matches alone, in the same shape as
+    the LLM output. Marked preliminary: matches are candidates, not findings,
+    and analysis_service.cacheable() keeps it out of the analysis cache.
+    """
+    clauses = []
+    for category, passages in candidates.items():
+        label = CLAUSE_CATEGORIES[category][0]
+        for passage in passages:
+            clauses.append({
+                "title": f"Possible clause: {label}",
+                "original_text": passage["text"],
+                "plain_english": f'The policy mentions "{passage["match"]}", which often signals this kind of clause. Review the passage.',
+                "severity": "medium",
+                "category": label,
+                "action_recommended": "Read this passage before accepting.",
+                "offset": [passage["start"], passage["end"]],
+            })
+    return {
+        "hidden_clauses": clauses,   # no transparency_score: the keyword scan cannot rate one
+        "overall_assessment": f"Preliminary keyword scan: {len(clauses)} candidate passage(s) in {len(candidates)} categor{'y' if len(candidates) == 1 else 'ies'}. Not yet reviewed by the AI.",
+        "preliminary": True,
+    }
@@ -90,6 +90,9 @@ def get_scan_by_url(db: Session, url: str):
     url_hash = hashlib.md5(url.encode()).hexdigest()
     return db.query(ProcessedSite).filter(ProcessedSite.url_hash == url_hash).first()
 
+def get_scan_by_hash(db: Session, url_hash: str):
+    return db.query(ProcessedSite).filter(ProcessedSite.url_hash == url_hash).first()
+
 def get_db():
     db = SessionLocal()
     try:
@@ -5,10 +5,14 @@ Mount this router in main.py: app.include_router(enhanced_router)
 """
 
 import os
+import re
+import json
+import asyncio
 import hashlib
-from fastapi import APIRouter, HTTPException, Depends
-from pydantic import BaseModel
-from typing import Optional, List
+from fastapi import APIRouter, HTTPException, Depends, Request
+from fastapi.responses import Response, StreamingResponse
+from pydantic import BaseModel, ValidationError
+from typing import Optional, List, AsyncIterator
 from sqlalchemy.orm import Session
 from sqlalchemy.sql import func
 
@@ -18,6 +22,13 @@ import database
 from database import get_db
 import risk_analyzer
 import pipeline
+import analysis_cache
+import analysis_service
+import analysis_views
+import metrics
+import clause_detector
+import faq
+import revalidation
 from auth import get_current_user, get_required_current_user
 
 enhanced_router = APIRouter(tags=["Enhanced Analysis"])
@@ -53,6 +64,13 @@ class HiddenClauseResponse(BaseModel):
 class FullAnalysisResponse(BaseModel):
     status: str
     url: str
+    url_hash: Optional[str] = None  # for fetching the full detail later (GET /analysis/{url_hash})
+    pipeline_data: dict
+    permission_data: dict
+    hidden_clauses_data: dict
+
+class StoredAnalysisResponse(BaseModel):
+    url_hash: str
     pipeline_data: dict
     permission_data: dict
     hidden_clauses_data: dict
@@ -102,15 +120,20 @@ async def get_permissions(request: PolicyRequest):
 
 
 @enhanced_router.post("/hidden-clauses", response_model=HiddenClauseResponse)
-async def get_hidden_clauses(request: PolicyRequest):
+async def get_hidden_clauses(request: PolicyRequest, preliminary: bool = False):
     """
     Detects hidden, misleading, or dangerous clauses in the policy.
+    With preliminary=true, returns the instant keyword pre-scan without calling the LLM.
     """
     clean_text = ai_engine.clean_html(request.html)
 
     if len(clean_text) < 100:
         raise HTTPException(status_code=400, detail="Content too short to analyze.")
 
+    if preliminary:
+        hidden_data = clause_detector.preliminary_result(clause_detector.find_candidates(clean_text))
+        return HiddenClauseResponse(status="preliminary", url=request.url, hidden_clauses_data=hidden_data)
+
     hidden_data = await risk_analyzer.detect_hidden_clauses_async(clean_text)
 
     return HiddenClauseResponse(
@@ -120,85 +143,87 @@ async def get_hidden_clauses(request: PolicyRequest):
     )
 
 
+async def _resolve_cache_hit(url: str, html: str, cached_payload: dict,
+                             previous_text: Optional[str]) -> tuple:
+    """
+    (status, payload, clean_text) for a cached URL, shared by /full-analysis and
+    the batch endpoint: "updated" with a (possibly incremental) re-analysis and
+    its clean_text, to be stored, if the submitted policy changed; otherwise the
+    cached payload, "stale" if a background revalidation was scheduled, else
+    "cached", and clean_text None.
+    """
+    clean_text = await analysis_service.detect_policy_change(cached_payload, html, previous_text)
+    if clean_text:
+        payload = await analysis_service.reanalyze_changed_policy(previous_text, clean_text, cached_payload)
+        return "updated", payload, clean_text
+    scheduled = revalidation.schedule(analysis_cache.url_hash(url), cached_payload, url, html)
+    return ("stale" if scheduled else "cached"), cached_payload, None
+
+
 @enhanced_router.post("/full-analysis", response_model=FullAnalysisResponse)
 async def get_full_analysis(
     request: PolicyRequest,
+    view: str = "full",
+    fields: Optional[str] = None,
     db: Session = Depends(get_db),
     current_user: Optional[database.User] = Depends(get_current_user)
 ):
     """
     Complete analysis pipeline optimized for concurrent parallel execution with caching:
     1. Check if we have a cached JSON analysis file in storage/analysis_cache/.
-    2. If yes, load and return it instantly (~1ms).
-    3. If no, clean HTML, run the new 3-stage pipeline, save cache file, and return.
+    2. If yes and the submitted policy is unchanged, return it instantly (~1ms);
+       if it was computed with older prompts / models, status "stale" and a
+       background re-analysis (revalidation.py).
+    3. If the policy changed since it was cached, re-analyze only the changed sections.
+    4. If no cache, clean HTML, run the new 3-stage pipeline, save cache file, and return.
+    `view=compact` / `fields=` trim the response (see analysis_views.py).
     """
-    import asyncio
-    import json
-    
-    url_hash = hashlib.md5(request.url.encode()).hexdigest()
-    cache_dir = "storage/analysis_cache"
-    cache_path = os.path.join(cache_dir, f"{url_hash}_v3.json")
-    
+    analysis_views.check_view(view)  # before any work is done
+    url_hash = analysis_cache.url_hash(request.url)
+
     # 1. Check cache
-    cached_payload = None
-    if os.path.exists(cache_path):
-        try:
-            with open(cache_path, "r", encoding="utf-8") as f:
-                cached_payload = json.load(f)
-        except Exception as e:
-            print(f"Error reading cache file {cache_path}: {e}")
+    cached_payload = analysis_cache.load(url_hash)
+    status = "cached"
+    clean_text = None
 
     if cached_payload:
-        pipeline_data = cached_payload.get("pipeline_data", {})
-        permission_data = cached_payload.get("permission_data", {})
-        hidden_data = cached_payload.get("hidden_clauses_data", {})
+        previous = database.get_scan_by_url(db, request.url)
+        previous_text = previous.policy_text if previous else None
+        try:
+            status, payload, clean_text = await _resolve_cache_hit(
+                request.url, request.html, cached_payload, previous_text
+            )
+        except Exception as e:
+            raise HTTPException(
+                status_code=500,
+                detail=f"Incremental re-analysis failed: {str(e)}"
+            )
     else:
+        status = "analyzed"
         clean_text = ai_engine.clean_html(request.html)
         if len(clean_text) < 100:
             raise HTTPException(status_code=400, detail="Content too short to analyze.")
 
-        pipeline_task = pipeline.run_full_pipeline(clean_text)
-        permissions_task = risk_analyzer.map_permissions_async(clean_text)
-        hidden_task = risk_analyzer.detect_hidden_clauses_async(clean_text)
-
         try:
-            pipeline_data, permission_data, hidden_data = await asyncio.gather(
-                pipeline_task,
-                permissions_task,
-                hidden_task
-            )
+            payload = await analysis_service.analyze_policy_text(clean_text)
         except Exception as e:
             raise HTTPException(
                 status_code=500,
                 detail=f"Concurrent pipeline analysis failed: {str(e)}"
             )
 
+    pipeline_data = payload.get("pipeline_data", {})
+
+    if clean_text:
         # Save to file cache
-        try:
-            os.makedirs(cache_dir, exist_ok=True)
-            cache_content = {
-                "pipeline_data": pipeline_data,
-                "permission_data": permission_data,
-                "hidden_clauses_data": hidden_data
-            }
-            with open(cache_path, "w", encoding="utf-8") as f:
-                json.dump(cache_content, f, indent=4, ensure_ascii=False)
-        except Exception as e:
-            print(f"Failed to write cache file {cache_path}: {e}")
+        analysis_service.attach_source_hashes(payload, clean_text, request.html)
+        if analysis_service.cacheable(payload):
+            analysis_cache.save(url_hash, payload)
+        faq.schedule(url_hash, clean_text, pipeline_data)
 
         # Save to database synchronously (global cache)
         try:
-            existing = database.get_scan_by_url(db, request.url)
-            summary_text = "Analysis complete."
-            if "trust_score" in pipeline_data:
-                summary_text = f"Trust Score: {pipeline_data['trust_score'].get('score')} ({pipeline_data['trust_score'].get('grade')})"
-                
-            if existing:
-                existing.risk_summary = summary_text
-                existing.policy_text = clean_text
-                db.commit()
-            else:
-                database.create_scan(db, request.url, summary_text, "", clean_text)
+            analysis_service.save_scan(db, request.url, pipeline_data, clean_text)
         except Exception as e:
             print(f"Error saving to global scan DB: {e}")
 
@@ -231,11 +256,300 @@ async def get_full_analysis(
             print(f"Error saving to user history DB: {e}")
 
     return FullAnalysisResponse(
-        status="cached" if cached_payload else "analyzed",
+        status=status,
         url=request.url,
-        pipeline_data=pipeline_data,
-        permission_data=permission_data,
-        hidden_clauses_data=hidden_data
+        url_hash=url_hash,
+        **analysis_views.apply(payload, view, fields)
+    )
+
+
+_URL_HASH_RE = re.compile(r"^[0-9a-f]{32}$")
+
+# Stored analyses only change when the policy is re-analysed, and then get a new
+# ETag; clients (Node gateway, extension) may reuse a response this long before
+# revalidating with If-None-Match.
+ANALYSIS_MAX_AGE = int(os.getenv("ANALYSIS_MAX_AGE", "300"))
+
+
+def _analysis_etag(tag: str, view: str, fields: Optional[str]) -> str:
+    """One strong ETag per stored entry and representation (view + fields)."""
+    shape = hashlib.sha256(fields.encode()).hexdigest()[:8] if fields else "all"
+    return f'"{tag}-{view}-{shape}"'
+
+
+# The compression middleware (main._encoding_etag) appends the content coding to
+# the ETag of a compressed body; each coding is a distinct representation.
+_ENCODED_ETAG_RE = re.compile(r'^(".*)-(br|gzip)"$')
+
+
+def _etag_matches(etag: str, if_none_match: Optional[str]) -> Optional[str]:
+    """
+    The If-None-Match entry that matches `etag` in any content coding, as the
+    client sent it (without W/), so the 304 names the representation it holds;
+    None if there is none.
+    """
+    if not if_none_match:
+        return None
+    for candidate in (c.strip() for c in if_none_match.split(",")):
+        if candidate == "*":
+            return etag
+        # Weak comparison, as RFC 9110 prescribes for If-None-Match.
+        candidate = candidate[2:] if candidate.startswith("W/") else candidate
+        encoded = _ENCODED_ETAG_RE.match(candidate)
+        if candidate == etag or (encoded and f'{encoded.group(1)}"' == etag):
+            return candidate
+    return None
+
+
+@enhanced_router.get("/analysis/{url_hash}", response_model=StoredAnalysisResponse)
+async def get_stored_analysis(url_hash: str, request: Request, response: Response,
+                              view: str = "full", fields: Optional[str] = None):
+    """
+    A stored analysis by url_hash (as returned by /full-analysis), so clients can
+    render a compact response first and fetch the full detail only when needed.
+    Sends a strong ETag (per content coding, see main._encoding_etag); a matching
+    If-None-Match gets 304 without the cached file being parsed.
+    """
+    analysis_views.check_view(view)
+    tag = analysis_cache.entry_tag(url_hash) if _URL_HASH_RE.match(url_hash) else None
+    if tag is None:
+        raise HTTPException(status_code=404, detail="No stored analysis for this url_hash.")
+
+    headers = {
+        "ETag": _analysis_etag(tag, view, fields),
+        "Cache-Control": f"public, max-age={ANALYSIS_MAX_AGE}",
+    }
+    matched = _etag_matches(headers["ETag"], request.headers.get("if-none-match"))
+    if matched:
+        metrics.inc("analysis_conditional_requests_total", result="not_modified")
+        return Response(status_code=304, headers={**headers, "ETag": matched, "Vary": "Accept-Encoding"})
+
+    payload = analysis_cache.load(url_hash)
+    if payload is None:
+        raise HTTPException(status_code=404, detail="No stored analysis for this url_hash.")
+    revalidation.schedule(url_hash, payload)
+    metrics.inc("analysis_conditional_requests_total", result="full")
+    response.headers.update(headers)
+    return StoredAnalysisResponse(url_hash=url_hash, **analysis_views.apply(payload, view, fields))
+
+
+# ──────────────────────────────────────────────
+#  BATCH ANALYSIS
+# ──────────────────────────────────────────────
+
+# Max policies analysed at once by one batch request. Each policy fans out into
+# several LLM calls, which are further capped by the governor in llm_config.
+BATCH_MAX_CONCURRENCY = int(os.getenv("BATCH_MAX_CONCURRENCY", "4"))
+
+
+async def _iter_batch_items(request: Request) -> AsyncIterator[dict]:
+    """
+    Yields raw batch items from either a JSON body (a list, or {"items": [...]})
+    or an NDJSON stream (one {"url", "html"} object per line), read incrementally.
+    """
+    content_type = request.headers.get("content-type", "")
+    if "ndjson" in content_type or "jsonl" in content_type:
+        buffer = b""
+        async for chunk in request.stream():
+            buffer += chunk
+            while b"\n" in buffer:
+                line, buffer = buffer.split(b"\n", 1)
+                if line.strip():
+                    yield _decode_batch_line(line)
+        if buffer.strip():
+            yield _decode_batch_line(buffer)
+        return
+
+    try:
+        body = await request.json()
+    except Exception:
+        raise HTTPException(status_code=400, detail="Body must be a JSON list or NDJSON stream.")
+    items = body.get("items") if isinstance(body, dict) else body
+    if not isinstance(items, list):
+        raise HTTPException(status_code=400, detail="Body must be a JSON list or {\"items\": [...]}.")
+    for item in items:
+        yield item
+
+
+def _decode_batch_line(line: bytes):
+    try:
+        return json.loads(line)
+    except json.JSONDecodeError as e:
+        return {"_error": f"Invalid JSON line: {e}"}
+
+
+async def _analyze_batch_item(item: PolicyRequest) -> tuple:
+    """
+    Returns (status, payload) for one policy, reusing the file cache the same way
+    /full-analysis does: a changed policy is re-analysed ("updated").
+    """
+    url_hash = analysis_cache.url_hash(item.url)
+    cached_payload = analysis_cache.load(url_hash)
+    if cached_payload:
+        previous_text = await asyncio.to_thread(_previous_policy_text, item.url)
+        status, payload, clean_text = await _resolve_cache_hit(item.url, item.html, cached_payload, previous_text)
+        if clean_text is None:
+            return status, payload
+    else:
+        status = "analyzed"
+        clean_text = await asyncio.to_thread(ai_engine.clean_html, item.html)
+        if len(clean_text) < 100:
+            raise HTTPException(status_code=400, detail="Content too short to analyze.")
+        payload = await analysis_service.analyze_policy_text(clean_text)
+
+    analysis_service.attach_source_hashes(payload, clean_text, item.html)
+    if analysis_service.cacheable(payload):
+        analysis_cache.save(url_hash, payload)
+    await asyncio.to_thread(_save_batch_scan, item.url, payload, clean_text)
+    faq.schedule(url_hash, clean_text, payload.get("pipeline_data", {}))
+    return status, payload
+
+
+def _previous_policy_text(url: str) -> Optional[str]:
+    db = database.SessionLocal()
+    try:
+        scan = database.get_scan_by_url(db, url)
+        return scan.policy_text if scan else None
+    finally:
+        db.close()
+
+
+def _save_batch_scan(url: str, payload: dict, clean_text: Optional[str] = None,
+                     source_url: Optional[str] = None) -> None:
+    # Batch workers run concurrently, so each gets its own short-lived session.
+    db = database.SessionLocal()
+    try:
+        if clean_text is None and source_url:
+            source = database.get_scan_by_url(db, source_url)
+            clean_text = source.policy_text if source else None
+        if clean_text:
+            analysis_service.save_scan(db, url, payload.get("pipeline_data", {}), clean_text)
+    except Exception as e:
+        print(f"[Batch] Error saving to global scan DB: {e}")
+    finally:
+        db.close()
+
+
+def _batch_result_line(index: int, url: str, status: str, payload: Optional[dict],
+                       include_results: bool, **extra) -> bytes:
+    trust_score = (payload or {}).get("pipeline_data", {}).get("trust_score", {})
+    line = {
+        "index": index,
+        "url": url,
+        "url_hash": analysis_cache.url_hash(url) if url else None,
+        "status": status,
+        "score": trust_score.get("score"),
+        "grade": trust_score.get("grade"),
+        **extra,
+    }
+    if include_results and payload:
+        line.update(payload)
+    return (json.dumps(line, ensure_ascii=False, default=str) + "\n").encode("utf-8")
+
+
+async def _stream_batch(request: Request, include_results: bool) -> AsyncIterator[bytes]:
+    queue: asyncio.Queue = asyncio.Queue()
+    slots = asyncio.Semaphore(BATCH_MAX_CONCURRENCY)
+    by_content: dict = {}   # sha256(html) -> (task, url) of the first item with that content
+    workers: set = set()    # running item tasks, cancelled if the client goes away
+    pending = 0
+
+    def spawn(coro) -> asyncio.Task:
+        task = asyncio.create_task(coro)
+        workers.add(task)
+        task.add_done_callback(workers.discard)
+        return task
+
+    async def run_primary(index: int, item: PolicyRequest) -> bool:
+        try:
+            status, payload = await _analyze_batch_item(item)
+            await queue.put(_batch_result_line(index, item.url, status, payload, include_results))
+            return True
+        except HTTPException as e:
+            await queue.put(_batch_result_line(index, item.url, "error", None, False, error=e.detail))
+        except Exception as e:
+            await queue.put(_batch_result_line(index, item.url, "error", None, False, error=str(e)))
+        finally:
+            slots.release()
+        return False
+
+    async def run_duplicate(index: int, item: PolicyRequest, primary: asyncio.Task, primary_url: str):
+        # Results are re-read from the primary's cache entry rather than kept in
+        # memory, so a 10k-item batch does not hold every payload until the end.
+        ok = await asyncio.shield(primary)
+        payload = analysis_cache.load(analysis_cache.url_hash(primary_url)) if ok else None
+        if payload is None:
+            await queue.put(_batch_result_line(index, item.url, "error", None, False,
+                                               error="Duplicate of an item that failed or was not cached.", duplicate_of=primary_url))
+            return
+        # Same content under another URL: copy the result so the URL-keyed cache hits too.
+        url_hash = analysis_cache.url_hash(item.url)
+        if analysis_cache.load(url_hash) is None:
+            analysis_cache.save(url_hash, payload)
+            await asyncio.to_thread(_save_batch_scan, item.url, payload, source_url=primary_url)
+        await queue.put(_batch_result_line(index, item.url, "duplicate", payload, include_results,
+                                           duplicate_of=primary_url))
+
+    async def produce():
+        nonlocal pending
+        index = 0
+        try:
+            async for raw in _iter_batch_items(request):
+                pending += 1
+                try:
+                    if isinstance(raw, dict) and "_error" in raw:
+                        raise ValueError(raw["_error"])
+                    item = PolicyRequest.model_validate(raw)
+                except (ValidationError, ValueError) as e:
+                    url = raw.get("url") if isinstance(raw, dict) else None
+                    await queue.put(_batch_result_line(index, url, "error", None, False, error=str(e)))
+                    index += 1
+                    continue
+
+                content_hash = hashlib.sha256(item.html.encode("utf-8")).hexdigest()
+                if content_hash in by_content:
+                    primary, primary_url = by_content[content_hash]
+                    spawn(run_duplicate(index, item, primary, primary_url))
+                else:
+                    await slots.acquire()   # backpressure: stop reading input while saturated
+                    task = spawn(run_primary(index, item))
+                    by_content[content_hash] = (task, item.url)
+                index += 1
+        except HTTPException as e:
+            pending += 1
+            await queue.put(_batch_result_line(index, None, "error", None, False, error=e.detail))
+        finally:
+            await queue.put(None)   # end-of-input marker
+
+    producer = asyncio.create_task(produce())
+    emitted = 0
+    input_done = False
+    try:
+        while not input_done or emitted < pending:
+            line = await queue.get()
+            if line is None:
+                input_done = True
+                continue
+            emitted += 1
+            yield line
+    finally:
+        producer.cancel()
+        for task in list(workers):
+            task.cancel()
+
+
+@enhanced_router.post("/batch/full-analysis")
+async def batch_full_analysis(request: Request, include_results: bool = False):
+    """
+    Bulk /full-analysis for cache pre-warming.
+    Accepts a JSON list (or {"items": [...]}) or an NDJSON stream of {url, html} items.
+    Items with identical HTML are analysed once; results stream back as NDJSON lines
+    in completion order, with the same statuses as /full-analysis (analyzed, cached,
+    stale, updated) plus duplicate and error. Pass include_results=true to get the full payload per line.
+    """
+    return StreamingResponse(
+        _stream_batch(request, include_results),
+        media_type="application/x-ndjson",
     )
 
 
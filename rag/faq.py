@@ -0,0 +1,166 @@
+"""
+PrivaShield AI - Precomputed FAQ Answers
+Most /chat traffic is the same handful of questions (deletion, selling,
+retention, children, cookies...). After an analysis, answers to a canonical
+question set are generated in the background from the Extractor's
+extracted_facts (one LLM call, off the critical path) and stored next to the
+analysis as `<url_hash>_faq.json`. /chat routes a question that matches a
+canonical one (embedding similarity >= FAQ_MATCH_THRESHOLD) to the stored
+answer without an LLM call.
+
+The question set can be replaced with FAQ_QUESTIONS_FILE (JSON list of strings).
+"""
+
+import os
+import json
+import asyncio
+import hashlib
+from typing import Optional
+
+import numpy as np
+
+import ai_engine
+import analysis_cache
+import metrics
+import policy_diff
+import prompts
+from llm_config import ainvoke_json, model_name, requires
+
+FAQ_ENABLED = os.getenv("FAQ_ENABLED", "true").lower() != "false"
+FAQ_MATCH_THRESHOLD = float(os.getenv("FAQ_MATCH_THRESHOLD", "0.8"))
+
+DEFAULT_QUESTIONS = [
+    "Can I delete my data?",
+    "Do they sell my data?",
+    "Who is my data shared with?",
+    "How long is my data kept?",
+    "What data do they collect about me?",
+    "Do they use cookies or tracking?",
+    "Can I opt out of tracking?",
+    "Is the service safe for children?",
+    "Will I be notified if the policy changes?",
+    "Do I give up the right to sue or join a class action?",
+    "Do they get a license to content I upload?",
+    "What are my rights over my data?",
+]
+
+
+def _load_questions() -> list[str]:
+    path = os.getenv("FAQ_QUESTIONS_FILE")
+    if not path:
+        return DEFAULT_QUESTIONS
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            questions = [str(q).strip() for q in json.load(f) if str(q).strip()]
+        return questions or DEFAULT_QUESTIONS
+    except Exception as e:
+        print(f"[FAQ] Could not read FAQ_QUESTIONS_FILE {path}: {e}. Using the default questions.")
+        return DEFAULT_QUESTIONS
+
+
+QUESTIONS = _load_questions()
+# Stored answers are only valid for the question set they were generated for.
+QUESTION_SET_HASH = hashlib.sha1("\n".join(QUESTIONS).encode("utf-8")).hexdigest()[:12]
+
+_question_matrix: Optional[np.ndarray] = None
+_pending: set = set()   # strong refs to background tasks until they finish
+
+
+def _questions_embedded() -> Optional[np.ndarray]:
+    global _question_matrix
+    if _question_matrix is None and ai_engine.embedding_model is not None:
+        _question_matrix = ai_engine.embed_texts(QUESTIONS)
+    return _question_matrix
+
+
+# ── Generation ───────────────────────────────────────────────────────────────
+
+def _cite_chunks(quotes: list, chunks: list[dict]) -> list[str]:
+    """Maps the verbatim source quotes an answer relies on to chunk ids, as /chat cites them."""
+    cited = []
+    normalized_chunks = [(chunk["chunk_id"], policy_diff.normalize(chunk["text"])) for chunk in chunks]
+    for quote in quotes or []:
+        probe = policy_diff.normalize(str(quote))[:80]   # a quote may straddle a chunk boundary
+        for chunk_id, text in normalized_chunks:
+            if probe and probe in text and chunk_id not in cited:
+                cited.append(chunk_id)
+                break
+    return cited
+
+
+async def generate(url_hash: str, clean_text: str, pipeline_data: dict) -> Optional[dict]:
+    """Answers the canonical questions from extracted_facts and stores them. Returns the stored payload."""
+    facts = pipeline_data.get("extracted_facts")
+    if not facts or "error" in pipeline_data:
+        return None
+
+    prompt = prompts.render(
+        "faq",
+        questions=json.dumps([{"index": i, "question": q} for i, q in enumerate(QUESTIONS)], indent=2),
+        extracted_facts=json.dumps(facts, indent=2),
+    )
+    try:
+        result = await ainvoke_json(prompt, task="faq", validate=requires("answers"))
+    except Exception as e:
+        print(f"[FAQ] Generation failed for {url_hash}: {e}")
+        return None
+
+    chunks = ai_engine.chunk_text(clean_text)
+    answers = {}
+    for item in result.get("answers") or []:
+        index = item.get("index") if isinstance(item, dict) else None
+        if not isinstance(index, int) or not 0 <= index < len(QUESTIONS) or not item.get("answer"):
+            continue
+        answers[str(index)] = {
+            "answer": item["answer"],
+            "confidence": item.get("confidence", "Low"),
+            "cited_chunks": _cite_chunks(item.get("source_quotes"), chunks),
+            "document_silent_on_topic": bool(item.get("document_silent_on_topic", False)),
+        }
+
+    payload = {
+        "content_hash": policy_diff.content_hash(clean_text),
+        "question_set": QUESTION_SET_HASH,
+        "model": model_name("faq"),
+        "questions": QUESTIONS,
+        "answers": answers,
+    }
+    analysis_cache.save(url_hash, payload, analysis_cache.FAQ_SUFFIX)
+    print(f"[FAQ] Stored {len(answers)}/{len(QUESTIONS)} answers for {url_hash}")
+    return payload
+
+
+def schedule(url_hash: str, clean_text: str, pipeline_data: dict) -> None:
+    """Starts generate() in the background (no-op if FAQ_ENABLED is false)."""
+    if not FAQ_ENABLED:
+        return
+    task = asyncio.get_running_loop().create_task(generate(url_hash, clean_text, pipeline_data))
+    _pending.add(task)
+    task.add_done_callback(_pending.discard)
+
+
+# ── Lookup ───────────────────────────────────────────────────────────────────
+
+def _match_question(question: str, query_emb: Optional[np.ndarray]) -> Optional[int]:
+    matrix = _questions_embedded() if query_emb is not None else None
+    if matrix is None:
+        key = question.strip().lower().rstrip("?")
+        return next((i for i, q in enumerate(QUESTIONS) if q.lower().rstrip("?") == key), None)
+    similarity = matrix @ query_emb
+    best = int(np.argmax(similarity))
+    return best if similarity[best] >= FAQ_MATCH_THRESHOLD else None
+
+
+def lookup(url_hash: str, content_hash: str, question: str, query_emb: Optional[np.ndarray]) -> Optional[dict]:
+    """Stored ChatResponse dict if `question` matches a canonical one answered for this policy version."""
+    index = _match_question(question, query_emb)
+    if index is None:
+        return None
+    stored = analysis_cache.load(url_hash, analysis_cache.FAQ_SUFFIX)
+    if (not stored or stored.get("content_hash") != content_hash
+            or stored.get("question_set") != QUESTION_SET_HASH or stored.get("model") != model_name("faq")):
+        return None
+    answer = (stored.get("answers") or {}).get(str(index))
+    if answer:
+        metrics.inc("chat_llm_calls_avoided_total", reason="faq")
+    return dict(answer) if answer else None
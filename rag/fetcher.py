@@ -0,0 +1,159 @@
+"""
+PrivaShield AI - Policy Page Fetcher
+App-lifetime HTTP client behind /fetch-html:
+  - one pooled httpx.AsyncClient (keep-alive, HTTP/2 when `h2` is installed)
+  - streamed bodies with a hard size cap
+  - conditional re-fetches (If-None-Match / If-Modified-Since) against a local
+    response cache in storage/fetch_cache/ (sharded by hash prefix), so unchanged
+    policies come back as 304
+
+Pass your own `client` (e.g. one with httpx.MockTransport, or pointed at a local
+stub server) to PolicyFetcher to exercise it without touching the network.
+"""
+
+import os
+import json
+import asyncio
+import time
+import hashlib
+from dataclasses import dataclass
+from typing import Optional
+
+import httpx
+
+FETCH_CACHE_DIR = os.path.join("storage", "fetch_cache")
+FETCH_MAX_BYTES = int(os.getenv("FETCH_MAX_BYTES", str(5 * 1024 * 1024)))
+FETCH_TIMEOUT = float(os.getenv("FETCH_TIMEOUT", "20"))
+FETCH_MAX_CONNECTIONS = int(os.getenv("FETCH_MAX_CONNECTIONS", "50"))
+USER_AGENT = "Mozilla/5.0 (Windows NT 10.0; Win64; x64)"
+
+try:
+    import h2  # noqa: F401 — enables httpx's HTTP/2 support
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+
+class FetchTooLarge(Exception):
+    """Raised when a response body exceeds the configured byte limit."""
+
+
+@dataclass
+class FetchResult:
+    html: str
+    url: str
+    cache_status: str  # "miss" (fresh download) | "revalidated" (304 from origin)
+    not_modified: bool = False
+
+
+class PolicyFetcher:
+    def __init__(self, client: Optional[httpx.AsyncClient] = None,
+                 cache_dir: str = FETCH_CACHE_DIR, max_bytes: int = FETCH_MAX_BYTES):
+        self._client = client
+        self._owns_client = client is None
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+
+    # ── lifecycle ───────────────────────────────────────────────────────────
+    @property
+    def client(self) -> httpx.AsyncClient:
+        # Created lazily so scripts that never call start() still share one pool.
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                http2=HTTP2_AVAILABLE,
+                timeout=FETCH_TIMEOUT,
+                follow_redirects=True,
+                headers={"User-Agent": USER_AGENT},
+                limits=httpx.Limits(
+                    max_connections=FETCH_MAX_CONNECTIONS,
+                    max_keepalive_connections=FETCH_MAX_CONNECTIONS // 2,
+                ),
+            )
+            self._owns_client = True
+        return self._client
+
+    async def start(self) -> None:
+        _ = self.client
+        print(f"[Fetcher] Shared HTTP client ready (http2={HTTP2_AVAILABLE}, max_bytes={self.max_bytes})")
+
+    async def close(self) -> None:
+        if self._client is not None and self._owns_client:
+            await self._client.aclose()
+            self._client = None
+
+    # ── response cache ──────────────────────────────────────────────────────
+    def _cache_path(self, url: str, legacy: bool = False) -> str:
+        key = hashlib.md5(url.encode()).hexdigest()
+        if legacy:  # flat layout used before sharding
+            return os.path.join(self.cache_dir, f"{key}.json")
+        return os.path.join(self.cache_dir, key[:2], f"{key}.json")
+
+    def _load_cached(self, url: str) -> Optional[dict]:
+        path = self._cache_path(url)
+        if not os.path.exists(path):
+            path = self._cache_path(url, legacy=True)
+        if not os.path.exists(path):
+            return None
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except Exception as e:
+            print(f"[Fetcher] Error reading response cache {path}: {e}")
+            return None
+
+    def _store(self, url: str, response: httpx.Response, html: str) -> None:
+        etag = response.headers.get("etag")
+        last_modified = response.headers.get("last-modified")
+        if not etag and not last_modified:
+            return  # nothing to revalidate against next time
+        path = self._cache_path(url)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({
+                    "url": url,
+                    "final_url": str(response.url),
+                    "etag": etag,
+                    "last_modified": last_modified,
+                    "fetched_at": time.time(),
+                    "html": html,
+                }, f, ensure_ascii=False)
+            os.replace(tmp_path, path)
+        except Exception as e:
+            print(f"[Fetcher] Failed to write response cache {path}: {e}")
+
+    # ── fetching ────────────────────────────────────────────────────────────
+    async def fetch(self, url: str) -> FetchResult:
+        # Cache files are read and written in a worker thread, off the event loop.
+        cached = await asyncio.to_thread(self._load_cached, url)
+        headers = {}
+        if cached:
+            if cached.get("etag"):
+                headers["If-None-Match"] = cached["etag"]
+            if cached.get("last_modified"):
+                headers["If-Modified-Since"] = cached["last_modified"]
+
+        async with self.client.stream("GET", url, headers=headers) as response:
+            if response.status_code == 304 and cached:
+                return FetchResult(html=cached["html"], url=cached.get("final_url", url),
+                                   cache_status="revalidated", not_modified=True)
+            response.raise_for_status()
+
+            declared = response.headers.get("content-length")
+            if declared and declared.isdigit() and int(declared) > self.max_bytes:
+                raise FetchTooLarge(f"Response is {declared} bytes (limit {self.max_bytes}).")
+
+            body = bytearray()
+            async for chunk in response.aiter_bytes():
+                body.extend(chunk)
+                if len(body) > self.max_bytes:
+                    raise FetchTooLarge(f"Response exceeded {self.max_bytes} bytes.")
+
+            html = bytes(body).decode(response.charset_encoding or "utf-8", errors="replace")
+            await asyncio.to_thread(self._store, url, response, html)
+            return FetchResult(html=html, url=str(response.url), cache_status="miss")
+
+
+# Shared instance; main.py opens/closes it with the app lifespan.
+policy_fetcher = PolicyFetcher()
@@ -0,0 +1,27 @@
+"""
+PrivaShield AI - HTML Cleaner
+HTML -> readable text conversion, kept free of model/LLM imports so it can run
+in worker processes (see warm.py) without loading the embedding model.
+"""
+
+from bs4 import BeautifulSoup
+
+import metrics
+
+
+@metrics.timed("clean_html")
+def clean_html(raw_html: str) -> str:
+    """
+    Strips HTML tags, scripts, and styles to leave only readable text.
+    """
+    soup = BeautifulSoup(raw_html, "html.parser")
+    
+    # Remove junk tags
+    for tag in soup(["script", "style", "nav", "footer", "header", "noscript", "meta"]):
+        tag.decompose()
+    
+    text = soup.get_text(separator="\n")
+    
+    # Remove extra whitespace/empty lines
+    clean_lines = [line.strip() for line in text.splitlines() if line.strip()]
+    return "\n".join(clean_lines)
@@ -0,0 +1,209 @@
+"""
+PrivaShield AI - Tolerant JSON Parsing for LLM Output
+Single parser for every model response. Handles markdown fences, prose before or
+after the JSON, trailing commas, and output cut off mid-object (e.g. max tokens
+reached): the text is scanned once, and unclosed strings / brackets are closed.
+If the cut falls inside a key or value, the incomplete member is dropped.
+"""
+
+import json
+import re
+from typing import Any
+
+_FENCE_RE = re.compile(r"```(?:json)?\s*\n?([\s\S]*?)(?:\n?```|$)")
+_decoder = json.JSONDecoder()
+
+
+def extract(text: str) -> str:
+    """Returns the part of `text` that should hold the JSON (fence body, from the first bracket on)."""
+    fence = _FENCE_RE.search(text)
+    if fence and ("{" in fence.group(1) or "[" in fence.group(1)):
+        text = fence.group(1)
+    starts = [i for i in (text.find("{"), text.find("[")) if i != -1]
+    return text[min(starts):] if starts else text.strip()
+
+
+def _scan(text: str) -> tuple:
+    """
+    One pass over `text`, dropping trailing commas and stray closers. Returns
+    (body, closers, cut_points): `body` is the scanned text (any open string
+    closed), `closers` the brackets still needed to complete it ("" if the value
+    was complete) and `cut_points` (length, closers) snapshots at each comma, used
+    to drop a truncated trailing member.
+    """
+    out = []
+    stack = []
+    cut_points = []
+    in_string = escaped = False
+    for ch in text:
+        if in_string:
+            out.append(ch)
+            if escaped:
+                escaped = False
+            elif ch == "\\":
+                escaped = True
+            elif ch == '"':
+                in_string = False
+            continue
+        if ch == '"':
+            in_string = True
+        elif ch in "{[":
+            stack.append("}" if ch == "{" else "]")
+        elif ch in "}]":
+            _strip_trailing_comma(out)
+            if not stack or stack[-1] != ch:
+                continue  # stray closer
+            stack.pop()
+            out.append(ch)
+            if not stack:
+                return "".join(out), "", []  # complete value; ignore anything after it
+            continue
+        elif ch == ",":
+            cut_points.append((len(out), "".join(reversed(stack))))
+        out.append(ch)
+
+    if in_string:
+        if escaped:
+            out.pop()
+        out.append('"')
+    return "".join(out), "".join(reversed(stack)), cut_points
+
+
+def _strip_trailing_comma(out: list) -> None:
+    i = len(out) - 1
+    while i >= 0 and out[i].isspace():
+        i -= 1
+    if i >= 0 and out[i] == ",":
+        del out[i]
+
+
+def _close(body: str, closers: str) -> str:
+    body = body.rstrip()
+    if body.endswith(","):
+        body = body[:-1]
+    elif body.endswith(":"):
+        body += " null"
+    return body + closers
+
+
+def parse(text: str) -> tuple:
+    """
+    Returns (value, repaired). `repaired` is True when the raw text was not valid
+    JSON as-is. Raises json.JSONDecodeError (with .doc = the raw text) if nothing
+    usable can be recovered.
+    """
+    candidate = extract(text or "")
+    try:
+        return _decoder.raw_decode(candidate)[0], False   # tolerates text after the value
+    except json.JSONDecodeError:
+        pass
+
+    body, closers, cut_points = _scan(candidate)
+    try:
+        return json.loads(_close(body, closers)), True
+    except json.JSONDecodeError:
+        pass
+    # The cut landed inside a member (e.g. a bare key or `"key": tr`):
+    # drop members from the end until the rest parses.
+    for length, member_closers in reversed(cut_points[-20:]):
+        try:
+            return json.loads(_close(body[:length], member_closers)), True
+        except json.JSONDecodeError:
+            continue
+    raise json.JSONDecodeError("No valid JSON found in model output", text or "", 0)
+
+
+def loads(text: str) -> Any:
+    """parse() without the repaired flag."""
+    return parse(text)[0]
+
+
+class ObjectStream:
+    """
+    Incremental parser for a streamed JSON object (one top-level object, e.g. the
+    Q&A Agent reply). feed() takes each text delta and returns events:
+      ("delta", key, text)  — new characters of a string value in `stream_keys`
+      ("field", key, value) — a top-level member whose value just closed
+    Text before the opening brace (fences, prose) is skipped.
+    """
+
+    def __init__(self, stream_keys=()):
+        self.stream_keys = set(stream_keys)
+        self._buf = ""
+        self._pos = 0
+        self._depth = 0
+        self._in_string = self._escaped = False
+        self._key = None            # key of the member being read
+        self._key_start = None
+        self._value_start = None
+        self._emitted = 0           # decoded chars already sent for a streamed value
+
+    def feed(self, text: str) -> list:
+        events = []
+        self._buf += text
+        buf = self._buf
+        while self._pos < len(buf):
+            ch = buf[self._pos]
+            if self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif ch == "\\":
+                    self._escaped = True
+                elif ch == '"':
+                    self._in_string = False
+                    if self._depth == 1 and self._key_start is not None:
+                        self._key = json.loads(buf[self._key_start:self._pos + 1])
+                        self._key_start = None
+            elif ch == '"':
+                self._in_string = True
+                if self._depth == 1 and self._value_start is None and self._key is None:
+                    self._key_start = self._pos
+            elif ch in "{[":
+                self._depth += 1
+            elif ch == ":" and self._depth == 1 and self._key is not None:
+                self._value_start = self._pos + 1
+                self._emitted = 0
+            elif ch in ",}]" and self._depth == 1:
+                events.extend(self._close_member(buf[self._value_start:self._pos] if self._value_start else None))
+                if ch != ",":
+                    self._depth -= 1
+            elif ch in "}]":
+                self._depth -= 1
+            self._pos += 1
+
+        # Partial string value of a streamed key: emit what is decodable so far.
+        if self._in_string and self._key in self.stream_keys and self._value_start is not None:
+            raw = buf[self._value_start:self._pos].lstrip()
+            if raw.startswith('"'):
+                decoded = _decode_partial_string(raw[1:])
+                if len(decoded) > self._emitted:
+                    events.append(("delta", self._key, decoded[self._emitted:]))
+                    self._emitted = len(decoded)
+        return events
+
+    def _close_member(self, raw_value) -> list:
+        key, self._key, self._value_start = self._key, None, None
+        if key is None or raw_value is None:
+            return []
+        try:
+            value = json.loads(raw_value)
+        except json.JSONDecodeError:
+            return []
+        events = []
+        if key in self.stream_keys and isinstance(value, str) and len(value) > self._emitted:
+            events.append(("delta", key, value[self._emitted:]))
+        events.append(("field", key, value))
+        return events
+
+
+def _decode_partial_string(raw: str) -> str:
+    """Decodes the body of an unterminated JSON string, holding back an incomplete escape."""
+    cut = raw.rfind("\\")
+    if cut != -1:
+        run = len(raw[:cut + 1]) - len(raw[:cut + 1].rstrip("\\"))
+        if run % 2 == 1 and (len(raw) - cut < 2 or (raw[cut + 1] == "u" and len(raw) - cut < 6)):
+            raw = raw[:cut]
+    try:
+        return json.loads(f'"{raw}"')
+    except json.JSONDecodeError:
+        return ""
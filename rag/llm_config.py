@@ -9,10 +9,23 @@ LangChain 1.x layout:
 """
 
 import os
+import json
+import time
+import heapq
+import asyncio
+import itertools
+import threading
+import weakref
+import contextvars
+from contextlib import asynccontextmanager, contextmanager
 from dotenv import load_dotenv
 from langchain_openai import ChatOpenAI
 from langchain_core.globals import set_llm_cache
 from langchain_community.cache import SQLiteCache
+from sqlalchemy.exc import OperationalError
+
+import json_utils
+import metrics
 
 load_dotenv()
 
@@ -21,13 +34,365 @@ load_dotenv()
 # Keyed by (prompt_text, model, temperature) — changing the model busts the cache.
 _CACHE_PATH = os.path.join("storage", "llm_cache.db")
 os.makedirs("storage", exist_ok=True)
-set_llm_cache(SQLiteCache(database_path=_CACHE_PATH))
+
+
+# storage_maintenance VACUUMs llm_cache.db, which locks the whole file for as long
+# as the copy takes. Meanwhile the cache is bypassed (pause_llm_cache): lookups
+# miss and replies are not stored. A lock error outside that window ("database
+# is locked" after SQLite's busy timeout) is handled the same way rather than
+# failing the LLM call.
+_cache_paused = threading.Event()
+
+
+@contextmanager
+def pause_llm_cache():
+    _cache_paused.set()
+    try:
+        yield
+    finally:
+        _cache_paused.clear()
+
+
+class _CountingSQLiteCache(SQLiteCache):
+    """
+    SQLiteCache that counts hits/misses (llm_cache_lookups_total); the async path
+    calls lookup() too. Paused or locked, it misses and drops writes.
+    """
+
+    def lookup(self, prompt: str, llm_string: str):
+        if _cache_paused.is_set():
+            metrics.inc("llm_cache_lookups_total", result="bypassed")
+            return None
+        try:
+            result = super().lookup(prompt, llm_string)
+        except OperationalError as e:
+            print(f"[LLM Cache] Lookup skipped: {e}")
+            metrics.inc("llm_cache_lookups_total", result="error")
+            return None
+        metrics.inc("llm_cache_lookups_total", result="hit" if result else "miss")
+        return result
+
+    def update(self, prompt: str, llm_string: str, return_val) -> None:
+        if _cache_paused.is_set():
+            metrics.inc("llm_cache_writes_skipped_total", reason="paused")
+            return
+        try:
+            super().update(prompt, llm_string, return_val)
+        except OperationalError as e:
+            print(f"[LLM Cache] Write skipped: {e}")
+            metrics.inc("llm_cache_writes_skipped_total", reason="error")
+
+
+set_llm_cache(_CountingSQLiteCache(database_path=_CACHE_PATH))
 print(f"[LLM Cache] SQLiteCache active -> {_CACHE_PATH}")
 
-# ── Shared LLM instance ──────────────────────────────────────────────────────
-llm = ChatOpenAI(
-    base_url="https://api.groq.com/openai/v1",
-    api_key=os.getenv("GROQ_API_KEY", "NOT_SET"),
-    model=os.getenv("GROQ_MODEL", "llama-3.3-70b-versatile"),
-    temperature=0.0,   # deterministic → cache hits are much more frequent
-)
+# ── Model tiers ──────────────────────────────────────────────────────────────
+# Every task runs on a tier: "large" (GROQ_MODEL) for reading whole policies,
+# "small" (GROQ_SMALL_MODEL) for short, well-structured jobs: chat answers,
+# ambiguous-permission checks, Risk Analyzer prose and summaries.
+# LLM_TASK_TIERS overrides single tasks, e.g. "chat=large,faq=small". A
+# small-tier reply that fails to parse or validate is retried on the large tier
+# (llm_escalations_total). The LLM cache key includes the model, so tiers never
+# share cached replies.
+# LLM_BASE_URL points every model at another OpenAI-compatible endpoint
+# (e.g. the offline mock server in benchmarks/).
+LLM_BASE_URL = os.getenv("LLM_BASE_URL", "https://api.groq.com/openai/v1")
+LARGE_MODEL = os.getenv("GROQ_MODEL", "llama-3.3-70b-versatile")
+SMALL_MODEL = os.getenv("GROQ_SMALL_MODEL", os.getenv("GROQ_SUMMARY_MODEL", "llama-3.1-8b-instant"))
+
+
+def _chat_model(name: str) -> ChatOpenAI:
+    return ChatOpenAI(
+        base_url=LLM_BASE_URL,
+        api_key=os.getenv("GROQ_API_KEY", "NOT_SET"),
+        model=name,
+        temperature=0.0,   # deterministic → cache hits are much more frequent
+    )
+
+
+llm = _chat_model(LARGE_MODEL)
+MODELS = {"large": llm, "small": llm if SMALL_MODEL == LARGE_MODEL else _chat_model(SMALL_MODEL)}
+MODEL_NAMES = {"large": LARGE_MODEL, "small": SMALL_MODEL}
+
+TASK_TIERS = {"chat": "small", "permissions_ambiguous": "small", "risk_prose": "small", "summary": "small"}
+for _item in filter(None, os.getenv("LLM_TASK_TIERS", "").split(",")):
+    _task, _, _tier = _item.partition("=")
+    if _tier.strip() in MODELS:
+        TASK_TIERS[_task.strip()] = _tier.strip()
+
+# USD per million (input, output) tokens, for llm_cost_usd_total{tier}.
+_PRICES = {
+    tier: tuple(float(x) for x in os.getenv(f"LLM_PRICE_{tier.upper()}", default).split(","))
+    for tier, default in (("large", "0.59,0.79"), ("small", "0.05,0.08"))
+}
+
+
+def tier_for(task: str) -> str:
+    return TASK_TIERS.get(task, "large")
+
+
+def model_name(task: str) -> str:
+    """Model a task runs on (recorded with stored answers that must not outlive a model change)."""
+    return MODEL_NAMES[tier_for(task)]
+
+
+# ── LLM concurrency governor ─────────────────────────────────────────────────
+# Caps in-flight LLM requests per event loop so bulk work (batch analysis,
+# cache warming) queues up here instead of tripping Groq's rate limit.
+# When all slots are busy, waiting calls are served by task priority (lower
+# first, FIFO within a level): a user waiting on /chat, then the pipeline's
+# critical path, then side tasks, then background precompute.
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "8"))
+_governors = weakref.WeakKeyDictionary()
+
+TASK_PRIORITY = {
+    "chat": 0, "chat_batch": 0,
+    "extractor": 1, "risk_analyzer": 1, "risk_prose": 1, "verifier": 1,
+    "risks": 2, "permissions": 2, "permissions_ambiguous": 2, "hidden_clauses": 2,
+    "hidden_clauses_full": 2, "summary": 2,
+    "faq": 3,
+}
+_DEFAULT_PRIORITY = 2
+BACKGROUND_PRIORITY = 4   # cache revalidation: only runs on slots nobody else wants
+_priority_floor = contextvars.ContextVar("llm_priority_floor", default=0)
+
+
+class _PriorityGovernor:
+    """Semaphore whose waiters are woken in (priority, arrival) order."""
+
+    def __init__(self, slots: int):
+        self._free = slots
+        self._waiters = []   # heap of (priority, seq, future)
+        self._seq = itertools.count()
+
+    @asynccontextmanager
+    async def slot(self, priority: int):
+        await self._acquire(priority)
+        try:
+            yield
+        finally:
+            self._release()
+
+    async def _acquire(self, priority: int) -> None:
+        if self._free > 0 and not self._waiters:
+            self._free -= 1
+            return
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._seq), future))
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                self._release()   # the slot was handed over just before the cancel; pass it on
+            raise
+
+    def _release(self) -> None:
+        while self._waiters:
+            future = heapq.heappop(self._waiters)[2]
+            if not future.done():
+                future.set_result(None)
+                return
+        self._free += 1
+
+
+def _governor() -> _PriorityGovernor:
+    loop = asyncio.get_running_loop()
+    governor = _governors.get(loop)
+    if governor is None:
+        governor = _PriorityGovernor(LLM_MAX_CONCURRENCY)
+        _governors[loop] = governor
+    return governor
+
+
+def _slot(task: str):
+    return _governor().slot(max(TASK_PRIORITY.get(task, _DEFAULT_PRIORITY), _priority_floor.get()))
+
+
+def deprioritize(priority: int = BACKGROUND_PRIORITY) -> None:
+    """Queues every later LLM call of the current task (and tasks it spawns) at `priority` or below."""
+    _priority_floor.set(priority)
+
+
+async def ainvoke(prompt: str, model=None, task: str = "other", tier: str = None):
+    """
+    Async LLM call scheduled through the concurrency governor. Without `model`,
+    the task's tier picks it. `task` labels the call's token usage, governor wait
+    and duration in metrics.
+    """
+    tier = tier or tier_for(task)
+    queued = time.perf_counter()
+    async with _slot(task):
+        started = time.perf_counter()
+        metrics.observe("llm_governor_wait_seconds", started - queued, task=task)
+        with metrics.span(f"llm:{task}"):
+            response = await (model or MODELS[tier]).ainvoke(prompt)
+        metrics.observe("llm_request_duration_seconds", time.perf_counter() - started, tier=tier)
+    record_usage(task, response, tier)
+    return response
+
+
+async def astream(prompt: str, model=None, task: str = "other"):
+    """
+    Streams the text deltas of one LLM call. Holds a governor slot until the
+    stream ends. Streaming bypasses the SQLite LLM cache, and a streamed reply
+    cannot be escalated to another tier.
+    """
+    tier = tier_for(task)
+    full = None
+    queued = time.perf_counter()
+    async with _slot(task):
+        started = time.perf_counter()
+        metrics.observe("llm_governor_wait_seconds", started - queued, task=task)
+        # Timed by hand: a tracing span must not stay attached across the yields.
+        try:
+            async for chunk in (model or MODELS[tier]).astream(prompt):
+                full = chunk if full is None else full + chunk
+                if chunk.content:
+                    yield chunk.content
+        finally:
+            metrics.observe("stage_duration_seconds", time.perf_counter() - started, stage=f"llm:{task}")
+            metrics.observe("llm_request_duration_seconds", time.perf_counter() - started, tier=tier)
+    if full is not None:
+        record_usage(task, full, tier)
+
+
+# ── JSON responses ───────────────────────────────────────────────────────────
+# Every structured task goes through ainvoke_json: JSON mode on the request
+# (OpenAI-compatible `response_format`, supported by Groq), the tolerant parser
+# on the reply, and ONE retry if it still doesn't parse or fails the caller's
+# `validate` check. Small-tier tasks retry on the large model; large-tier tasks
+# retry with a corrective suffix, which changes the prompt so the retry does not
+# just hit the cached reply.
+LLM_JSON_MODE = os.getenv("LLM_JSON_MODE", "true").lower() != "false"
+_JSON_RETRY_SUFFIX = "\n\nYour previous reply was not valid JSON. Reply again with ONLY the complete JSON object."
+_SCHEMA_RETRY_SUFFIX = ("\n\nYour previous reply did not follow the OUTPUT structure above. "
+                        "Reply again with ONLY the complete JSON object in that structure.")
+
+
+def _failed_generation(error: Exception):
+    """Groq rejects JSON-mode replies that don't validate (400 json_validate_failed) but returns the text."""
+    body = getattr(error, "body", None)
+    if isinstance(body, dict):
+        body = body.get("error", body)
+        if isinstance(body, dict) and body.get("code") == "json_validate_failed":
+            return body.get("failed_generation") or ""
+    return None
+
+
+def requires(*keys):
+    """`validate` check for ainvoke_json: the reply is an object with all of `keys`."""
+    return lambda value: isinstance(value, dict) and all(key in value for key in keys)
+
+
+def _can_escalate(model, tier: str) -> bool:
+    """A small-tier call has a distinct, larger model to retry on."""
+    return model is None and tier == "small" and MODELS["large"] is not MODELS["small"]
+
+
+async def ainvoke_json(prompt: str, model=None, task: str = "other", validate=None, confident=None):
+    """
+    LLM call that returns parsed JSON. `validate(value) -> bool` is an optional
+    schema check; a value that fails it triggers the retry (on the large tier if
+    the task runs on a distinct small model, else the same model with a reminder
+    of the output format), and is returned as-is if the retry fails too.
+    `confident(value) -> bool` is an optional quality check that only escalates:
+    a small-tier reply that fails it is re-asked on the large model, never on the
+    same one; without a distinct large tier it is returned unchanged, as it is if
+    the escalated call fails.
+    Raises json.JSONDecodeError (with .doc = the last raw reply) if neither the
+    reply nor the retry can be parsed.
+    Outcomes are counted in llm_json_responses_total{task, outcome}.
+    """
+    tier = tier_for(task)
+    text = prompt
+    error = invalid = unconfident = None
+    for attempt in range(2):
+        runnable = model or MODELS[tier]
+        if LLM_JSON_MODE:
+            runnable = runnable.bind(response_format={"type": "json_object"})
+        try:
+            raw = (await ainvoke(text, runnable, task=task, tier=tier)).content
+        except Exception as e:
+            raw = _failed_generation(e)
+            if raw is None:
+                raise
+        try:
+            value, repaired = json_utils.parse(raw)
+        except json.JSONDecodeError as e:
+            error, reason = e, "parse"
+            metrics.inc("llm_json_parse_failures_total", task=task)
+        else:
+            if validate is None or validate(value):
+                if attempt == 0 and confident is not None and not confident(value) and _can_escalate(model, tier):
+                    unconfident = value
+                    metrics.inc("llm_escalations_total", task=task, reason="confidence")
+                    tier = "large"
+                    continue
+                outcome = ("escalated" if tier != tier_for(task) else "retried") if attempt else (
+                    "repaired" if repaired else "ok")
+                metrics.inc("llm_json_responses_total", task=task, outcome=outcome)
+                return value
+            invalid, reason = value, "validation"
+
+        if unconfident is not None:
+            break   # the escalated call failed; keep the small model's answer
+        if _can_escalate(model, tier):
+            metrics.inc("llm_escalations_total", task=task, reason=reason)
+            tier = "large"
+        else:
+            text = prompt + (_JSON_RETRY_SUFFIX if reason == "parse" else _SCHEMA_RETRY_SUFFIX)
+
+    if unconfident is not None:
+        metrics.inc("llm_json_responses_total", task=task, outcome="unconfident")
+        return unconfident
+    if invalid is not None:
+        metrics.inc("llm_json_responses_total", task=task, outcome="invalid")
+        return invalid
+    metrics.inc("llm_json_responses_total", task=task, outcome="failed")
+    raise error
+
+
+# ── Token usage ──────────────────────────────────────────────────────────────
+# Providers with prompt caching report how many prompt tokens were served from
+# their prefix cache (OpenAI-style `prompt_tokens_details.cached_tokens`;
+# LangChain normalises it to `input_token_details.cache_read`). Groq only
+# reports it for models that support caching, so 0 is common.
+def record_usage(task: str, response, tier: str = "large") -> None:
+    usage = getattr(response, "usage_metadata", None) or {}
+    token_usage = (getattr(response, "response_metadata", None) or {}).get("token_usage") or {}
+
+    prompt_tokens = usage.get("input_tokens") or token_usage.get("prompt_tokens") or 0
+    completion_tokens = usage.get("output_tokens") or token_usage.get("completion_tokens") or 0
+    cached_tokens = (
+        (usage.get("input_token_details") or {}).get("cache_read")
+        or (token_usage.get("prompt_tokens_details") or {}).get("cached_tokens")
+        or 0
+    )
+
+    metrics.inc("llm_calls_total", task=task)
+    metrics.inc("llm_prompt_tokens_total", prompt_tokens, task=task)
+    metrics.inc("llm_completion_tokens_total", completion_tokens, task=task)
+    metrics.inc("llm_cached_prompt_tokens_total", cached_tokens, task=task)
+
+    price_in, price_out = _PRICES.get(tier, (0.0, 0.0))
+    metrics.inc("llm_tier_calls_total", tier=tier, model=MODEL_NAMES.get(tier, "custom"))
+    metrics.inc("llm_tier_prompt_tokens_total", prompt_tokens, tier=tier)
+    metrics.inc("llm_tier_completion_tokens_total", completion_tokens, tier=tier)
+    metrics.inc("llm_cost_usd_total", (prompt_tokens * price_in + completion_tokens * price_out) / 1e6, tier=tier)
+
+
+# ── Sync bridge ──────────────────────────────────────────────────────────────
+# Sync callers (scripts, legacy helpers) run the async implementations on one
+# shared background loop instead of keeping separate blocking code paths.
+_sync_loop = None
+_sync_loop_lock = threading.Lock()
+
+
+def run_sync(coro):
+    """Runs a coroutine to completion from synchronous code and returns its result."""
+    global _sync_loop
+    with _sync_loop_lock:
+        if _sync_loop is None:
+            _sync_loop = asyncio.new_event_loop()
+            threading.Thread(target=_sync_loop.run_forever, name="llm-sync-loop", daemon=True).start()
+    return asyncio.run_coroutine_threadsafe(coro, _sync_loop).result()
@@ -1,9 +1,15 @@
 import os
 import json
+import time
+import asyncio
+import hmac
 import hashlib
-from fastapi import FastAPI, HTTPException, Depends
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, HTTPException, Depends, Request
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import StreamingResponse, PlainTextResponse, JSONResponse, ORJSONResponse
+from pydantic import BaseModel, ValidationError
 from typing import List, Optional
 from sqlalchemy.orm import Session
 import httpx
@@ -13,8 +19,45 @@ import database
 from database import get_db, ProcessedSite
 import ai_engine
 import pipeline
+import analysis_cache
+import analysis_service
+import json_utils
+import policy_diff
+import semantic_cache
+import faq
+import revalidation
+from fetcher import policy_fetcher, FetchTooLarge
+import metrics
+import profiling
+import storage_maintenance
 
-app = FastAPI(title="PrivacyLens API", version="2.0")
+try:
+    import orjson  # noqa: F401  (ORJSONResponse needs it)
+    DefaultResponse = ORJSONResponse
+except ImportError:
+    DefaultResponse = JSONResponse
+
+try:
+    from brotli_asgi import BrotliMiddleware
+except ImportError:
+    BrotliMiddleware = None
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # One pooled HTTP client for the whole process instead of one per /fetch-html call
+    await policy_fetcher.start()
+    loop_monitor = profiling.start_loop_monitor()
+    maintenance = storage_maintenance.start_maintenance()
+    yield
+    if maintenance is not None:
+        await maintenance.stop()
+    if loop_monitor is not None:
+        await loop_monitor.stop()
+    await policy_fetcher.close()
+
+
+app = FastAPI(title="PrivacyLens API", version="2.0", lifespan=lifespan, default_response_class=DefaultResponse)
 
 # --- 1. CORS CONFIGURATION ---
 app.add_middleware(
@@ -25,6 +68,68 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Analysis payloads are tens of KB of JSON. Brotli when brotli-asgi is installed
+# (gzip for clients that don't accept br), GZip otherwise. Streamed endpoints are
+# left uncompressed: the compressor buffers output, which would hold back events.
+UNCOMPRESSED_PATHS = {"/chat/stream", "/batch/full-analysis"}
+COMPRESS_MIN_BYTES = int(os.getenv("COMPRESS_MIN_BYTES", "1000"))
+
+
+class _CompressUnlessStreaming:
+    def __init__(self, app):
+        self.app = app
+        if BrotliMiddleware is not None:
+            self.compressed = BrotliMiddleware(app, minimum_size=COMPRESS_MIN_BYTES, gzip_fallback=True)
+        else:
+            self.compressed = GZipMiddleware(app, minimum_size=COMPRESS_MIN_BYTES)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http" and scope["path"] not in UNCOMPRESSED_PATHS:
+            await self.compressed(scope, receive, _encoding_etag(send))
+        else:
+            await self.app(scope, receive, send)
+
+
+def _encoding_etag(send):
+    """
+    A strong ETag names one exact byte sequence, so a compressed body gets its own:
+    `"<tag>-br"` / `"<tag>-gzip"` (enhanced_routes._etag_matches strips the suffix).
+    """
+    async def wrapped(message):
+        if message["type"] == "http.response.start":
+            headers = dict(message.get("headers") or [])
+            encoding, etag = headers.get(b"content-encoding"), headers.get(b"etag")
+            if encoding and etag and etag.startswith(b'"'):
+                message["headers"] = [
+                    (k, etag[:-1] + b"-" + encoding + b'"' if k == b"etag" else v)
+                    for k, v in message["headers"]
+                ]
+        await send(message)
+    return wrapped
+
+
+app.add_middleware(_CompressUnlessStreaming)
+
+
+@app.middleware("http")
+async def time_requests(request: Request, call_next):
+    """http_request_duration_seconds{method, route, status}; the route template keeps label cardinality bounded."""
+    start = time.perf_counter()
+    response = await call_next(request)
+    route = request.scope.get("route")
+    metrics.observe(
+        "http_request_duration_seconds",
+        time.perf_counter() - start,
+        method=request.method,
+        route=getattr(route, "path", "unmatched"),
+        status=response.status_code,
+    )
+    return response
+
+
+# Opt-in per-request profiles (PROFILE_SAMPLE_RATE / X-Profile header), see profiling.py
+app.middleware("http")(profiling.profile_requests)
+
 # --- 2. DATA MODELS ---
 
 class AnalyzeRequest(BaseModel):
@@ -46,6 +151,13 @@ class ChatResponse(BaseModel):
     cited_chunks: List[str] = []
     document_silent_on_topic: bool = False
 
+class ChatBatchRequest(BaseModel):
+    url: str
+    questions: List[str]
+
+class ChatBatchResponse(BaseModel):
+    answers: List[ChatResponse]  # same order as the request's questions
+
 class URLRequest(BaseModel):
     url: str
 
@@ -62,20 +174,15 @@ async def analyze_policy(request: AnalyzeRequest, db: Session = Depends(get_db))
     Cached at file level (v3 cache) + LLM prompt level (SQLiteCache).
     Returns both a brief summary string (for extension compat) and full pipeline_data.
     """
-    url_hash = hashlib.md5(request.url.encode()).hexdigest()
-    cache_dir = "storage/analysis_cache"
-    cache_path = os.path.join(cache_dir, f"{url_hash}_v3.json")
+    url_hash = analysis_cache.url_hash(request.url)
 
     # 1. File-level cache hit — instant
-    if os.path.exists(cache_path):
-        try:
-            with open(cache_path, "r", encoding="utf-8") as f:
-                cached = json.load(f)
-            pipeline_data = cached.get("pipeline_data", {})
-            summary = _make_summary(pipeline_data)
-            return AnalyzeResponse(status="cached", summary=summary, pipeline_data=pipeline_data)
-        except Exception as e:
-            print(f"[/analyze] Cache read failed: {e}")
+    cached = analysis_cache.load(url_hash)
+    if cached:
+        revalidation.schedule(url_hash, cached, request.url, request.html)
+        pipeline_data = cached.get("pipeline_data", {})
+        summary = _make_summary(pipeline_data)
+        return AnalyzeResponse(status="cached", summary=summary, pipeline_data=pipeline_data)
 
     clean_text = ai_engine.clean_html(request.html)
     if len(clean_text) < 100:
@@ -101,12 +208,8 @@ async def analyze_policy(request: AnalyzeRequest, db: Session = Depends(get_db))
         pass
 
     # 3. Persist to file cache
-    try:
-        os.makedirs(cache_dir, exist_ok=True)
-        with open(cache_path, "w", encoding="utf-8") as f:
-            json.dump({"pipeline_data": pipeline_data}, f, indent=2, ensure_ascii=False)
-    except Exception as e:
-        print(f"[/analyze] Cache write failed: {e}")
+    payload = analysis_service.attach_source_hashes({"pipeline_data": pipeline_data}, clean_text, request.html)
+    analysis_cache.save(url_hash, payload)
 
     return AnalyzeResponse(status="processed_new", summary=summary, pipeline_data=pipeline_data)
 
@@ -118,6 +221,12 @@ async def chat_policy(request: ChatRequest, db: Session = Depends(get_db)):
     - Retrieves top-k chunks semantically relevant to the question.
     - Returns structured JSON with confidence and chunk citations.
     - LLM prompt is SQLiteCached — same question on same policy = no Groq call.
+    - Paraphrased questions that retrieve the same chunks reuse a stored answer
+      (semantic_cache) — also no Groq call.
+    - Questions nothing in the policy matches are answered locally as
+      document_silent_on_topic.
+    - Common questions matching the canonical FAQ set use the answers
+      precomputed after analysis (faq.py).
     """
     scan = database.get_scan_by_url(db, request.url)
     if not scan or not scan.policy_text:
@@ -126,47 +235,281 @@ async def chat_policy(request: ChatRequest, db: Session = Depends(get_db)):
             detail="Policy not found. Please analyze the site first."
         )
 
-    raw = await ai_engine.chat_with_policy_async(request.question, scan.policy_text)
+    chat = _ChatContext(request.url, request.question, scan.policy_text)
+    if chat.local_answer is not None:
+        return ChatResponse(**chat.local_answer)
 
-    # Parse structured JSON from Q&A Agent
-    try:
-        # Strip any markdown fences the model might add
-        clean = raw.strip()
-        if clean.startswith("```"):
-            clean = clean.split("```")[1]
-            if clean.startswith("json"):
-                clean = clean[4:]
-        data = json.loads(clean.strip())
-        return ChatResponse(
-            answer=data.get("answer", raw),
-            confidence=data.get("confidence", "Low"),
-            cited_chunks=data.get("cited_chunks", []),
-            document_silent_on_topic=data.get("document_silent_on_topic", False),
-        )
-    except (json.JSONDecodeError, Exception):
-        # Graceful fallback if model returns plain text instead of JSON
+    raw = await ai_engine.chat_with_policy_async(request.question, scan.policy_text, chat.retrieved)
+    parsed = _parse_chat(raw)
+    if parsed is None:
         return ChatResponse(answer=raw, confidence="Low")
+    chat.store(parsed)
+    return parsed
+
+
+@app.post("/chat/stream")
+async def chat_policy_stream(request: ChatRequest, db: Session = Depends(get_db)):
+    """
+    Streaming /chat over Server-Sent Events. The Q&A Agent's JSON is parsed as it
+    arrives:
+      event: delta  {"text": "..."}            — next piece of the answer
+      event: field  {"name": ..., "value": ...} — confidence / cited_chunks / ... once closed
+      event: done   <ChatResponse>              — final parsed answer (same as /chat)
+      event: error  {"detail": "..."}
+    """
+    scan = database.get_scan_by_url(db, request.url)
+    if not scan or not scan.policy_text:
+        raise HTTPException(
+            status_code=404,
+            detail="Policy not found. Please analyze the site first."
+        )
+    return StreamingResponse(
+        _stream_chat_events(_ChatContext(request.url, request.question, scan.policy_text), scan.policy_text),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+CHAT_BATCH_MAX_QUESTIONS = int(os.getenv("CHAT_BATCH_MAX_QUESTIONS", "12"))
+
+
+@app.post("/chat/batch", response_model=ChatBatchResponse)
+async def chat_policy_batch(request: ChatBatchRequest, db: Session = Depends(get_db)):
+    """
+    Several /chat questions on one policy (e.g. the popup's suggested questions).
+    The policy is loaded, chunked and embedded once; all questions are retrieved
+    with one matrix multiply. Questions answered locally (off-topic, semantic
+    cache) skip the LLM; the rest are answered together in one LLM call, with a
+    concurrent per-question fallback for any it leaves out.
+    """
+    if not request.questions:
+        return ChatBatchResponse(answers=[])
+    if len(request.questions) > CHAT_BATCH_MAX_QUESTIONS:
+        raise HTTPException(status_code=400, detail=f"At most {CHAT_BATCH_MAX_QUESTIONS} questions per request.")
+    scan = database.get_scan_by_url(db, request.url)
+    if not scan or not scan.policy_text:
+        raise HTTPException(
+            status_code=404,
+            detail="Policy not found. Please analyze the site first."
+        )
+
+    retrievals = ai_engine.retrieve_for_questions(request.questions, scan.policy_text)
+    chats = [
+        _ChatContext(request.url, question, scan.policy_text, retrieval)
+        for question, retrieval in zip(request.questions, retrievals)
+    ]
+    answers = [ChatResponse(**c.local_answer) if c.local_answer is not None else None for c in chats]
+    pending = [i for i, answer in enumerate(answers) if answer is None]
+
+    if len(pending) > 1:
+        batch = await ai_engine.chat_batch_async(
+            [chats[i].question for i in pending], [chats[i].retrieved for i in pending]
+        )
+        for i, data in zip(pending, batch):
+            answers[i] = _chat_from_data(data) if data else None
+            if answers[i] is not None:
+                chats[i].store(answers[i])
+        pending = [i for i in pending if answers[i] is None]
+
+    # Left out of the batch reply (or a single question): answer individually, concurrently.
+    raws = await asyncio.gather(*(
+        ai_engine.chat_with_policy_async(chats[i].question, scan.policy_text, chats[i].retrieved) for i in pending
+    ))
+    for i, raw in zip(pending, raws):
+        answers[i] = _parse_chat(raw)
+        if answers[i] is None:
+            answers[i] = ChatResponse(answer=raw, confidence="Low")
+        else:
+            chats[i].store(answers[i])
+    return ChatBatchResponse(answers=answers)
+
+
+def _sse(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+async def _stream_chat_events(chat: "_ChatContext", policy_text: str):
+    if chat.local_answer is not None:
+        yield _sse("delta", {"text": chat.local_answer["answer"]})
+        for name, value in chat.local_answer.items():
+            if name != "answer":
+                yield _sse("field", {"name": name, "value": value})
+        yield _sse("done", chat.local_answer)
+        return
+
+    parser = json_utils.ObjectStream(stream_keys={"answer"})
+    raw = ""
+    try:
+        async for text in ai_engine.stream_chat_async(chat.question, policy_text, chat.retrieved):
+            raw += text
+            for kind, name, value in parser.feed(text):
+                if kind == "delta":
+                    yield _sse("delta", {"text": value})
+                elif name != "answer":
+                    yield _sse("field", {"name": name, "value": value})
+    except Exception as e:
+        yield _sse("error", {"detail": f"AI Error: {str(e)}"})
+        return
+    parsed = _parse_chat(raw)
+    if parsed is not None:
+        chat.store(parsed)
+    yield _sse("done", (parsed or ChatResponse(answer=raw, confidence="Low")).model_dump())
 
 
 @app.post("/fetch-html")
 async def fetch_html(request: URLRequest):
+    """
+    Fetches page HTML server-side through the shared, size-capped client.
+    Previously fetched pages are revalidated with ETag / Last-Modified; a 304 from
+    the origin returns the stored body with not_modified=true.
+    """
     try:
-        async with httpx.AsyncClient(timeout=20.0) as client:
-            headers = {"User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64)"}
-            response = await client.get(request.url, headers=headers, follow_redirects=True)
-            response.raise_for_status()
-            return {"html": response.text}
+        result = await policy_fetcher.fetch(request.url)
+        return {
+            "html": result.html,
+            "cache_status": result.cache_status,
+            "not_modified": result.not_modified,
+        }
     except httpx.HTTPStatusError as e:
         raise HTTPException(
             status_code=e.response.status_code,
             detail=f"Target URL returned: {e.response.status_code}"
         )
+    except FetchTooLarge as e:
+        raise HTTPException(status_code=413, detail=f"Could not fetch URL: {str(e)}")
     except Exception as e:
         raise HTTPException(status_code=400, detail=f"Could not fetch URL: {str(e)}")
 
 
+@app.get("/stats")
+async def stats():
+    """
+    In-process counters since startup, including per-task LLM token usage.
+    llm_cached_prompt_tokens_total shows how much of each prompt the provider
+    served from its prefix cache.
+    """
+    return metrics.snapshot()
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def prometheus_metrics():
+    """
+    The same counters plus latency histograms in Prometheus text format:
+    stage_duration_seconds{stage} (pipeline stages, side tasks, retrieval, cache
+    I/O, llm:<task>), llm_governor_wait_seconds and http_request_duration_seconds.
+    """
+    return PlainTextResponse(metrics.render_prometheus(), media_type="text/plain; version=0.0.4")
+
+
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN", "")
+
+
+def _require_admin(request: Request) -> None:
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=403, detail="Admin endpoints are disabled (ADMIN_TOKEN is not set).")
+    if not hmac.compare_digest(request.headers.get("x-admin-token", ""), ADMIN_TOKEN):
+        raise HTTPException(status_code=403, detail="Invalid admin token.")
+
+
+@app.get("/admin/cache-stats")
+async def cache_stats(request: Request):
+    """
+    Analysis cache entries by age and by version (schema, prompt hash, models),
+    stale counts per reason, and background revalidations in flight.
+    Requires `X-Admin-Token: <ADMIN_TOKEN>`.
+    """
+    _require_admin(request)
+    return await asyncio.to_thread(revalidation.cache_report)
+
+
+@app.get("/admin/storage")
+async def storage_usage(request: Request):
+    """
+    Bytes and files per storage/ area, SQLite file sizes, budgets, free disk and
+    the last maintenance sweep. Requires `X-Admin-Token: <ADMIN_TOKEN>`.
+    """
+    _require_admin(request)
+    return await asyncio.to_thread(storage_maintenance.usage_report)
+
+
+@app.post("/admin/storage/sweep")
+async def storage_sweep(request: Request, vacuum: bool = False):
+    """
+    Runs a maintenance sweep now (`?vacuum=true` also compacts the SQLite files)
+    and returns the usage report. Requires `X-Admin-Token: <ADMIN_TOKEN>`.
+    """
+    _require_admin(request)
+    await asyncio.to_thread(storage_maintenance.sweep, vacuum)
+    return await asyncio.to_thread(storage_maintenance.usage_report)
+
+
 # --- 4. HELPERS ---
 
+def _parse_chat(raw: str) -> Optional[ChatResponse]:
+    """
+    Parses the Q&A Agent's JSON (fences, trailing commas, truncation tolerated).
+    None if the reply is not a usable answer; callers then return the raw text.
+    """
+    try:
+        return _chat_from_data(json_utils.loads(raw))
+    except (json.JSONDecodeError, Exception):
+        return None
+
+
+def _chat_from_data(data: dict) -> Optional[ChatResponse]:
+    """
+    A ChatResponse from the Q&A Agent's parsed JSON; optional fields sent as null
+    take their defaults. None if the answer is missing or a field has the wrong
+    type, so the caller re-asks or falls back.
+    """
+    if not isinstance(data, dict) or "error" in data or "answer" not in data:
+        return None
+    try:
+        return ChatResponse(
+            answer=data["answer"],
+            confidence=data.get("confidence") or "Low",
+            cited_chunks=data.get("cited_chunks") or [],
+            document_silent_on_topic=data.get("document_silent_on_topic") or False,
+        )
+    except ValidationError:
+        return None
+
+
+_SILENT_ANSWER = "The policy does not appear to address this question."
+
+
+class _ChatContext:
+    """
+    Retrieval result for one question. `local_answer` is set (a ChatResponse dict)
+    when no LLM call is needed: retrieval found nothing relevant, the question
+    has a precomputed FAQ answer, or the semantic cache has an answer.
+    """
+
+    def __init__(self, url: str, question: str, policy_text: str, retrieval: tuple = None):
+        self.question = question
+        self.url_hash = analysis_cache.url_hash(url)
+        self.content_hash = policy_diff.content_hash(policy_text)
+        self.retrieved, self.query_emb, scorer = retrieval or ai_engine.retrieve_for_question(question, policy_text)
+
+        if ai_engine.document_silent(self.retrieved, scorer):
+            metrics.inc("chat_llm_calls_avoided_total", reason="low_similarity")
+            self.local_answer = ChatResponse(
+                answer=_SILENT_ANSWER, confidence="Medium", document_silent_on_topic=True,
+            ).model_dump()
+        else:
+            self.local_answer = faq.lookup(self.url_hash, self.content_hash, self.question, self.query_emb)
+            if self.local_answer is None:
+                self.local_answer = semantic_cache.lookup(
+                    self.url_hash, self.content_hash, self.question, self.query_emb, self.retrieved
+                )
+
+    def store(self, response: ChatResponse) -> None:
+        semantic_cache.store(
+            self.url_hash, self.content_hash, self.question, self.query_emb, self.retrieved,
+            response.model_dump(),
+        )
+
+
 def _make_summary(pipeline_data: dict) -> str:
     """Generates a brief human-readable summary for the extension and DB storage."""
     ts = pipeline_data.get("trust_score", {})
@@ -0,0 +1,149 @@
+"""
+PrivaShield AI - In-process Metrics
+Thread-safe counters and histograms keyed by name + labels, e.g.
+    metrics.inc("llm_prompt_tokens_total", 5120, task="extractor")
+    with metrics.span("extractor"): ...        # -> stage_duration_seconds{stage="extractor"}
+Read them back with snapshot() (GET /stats) or render_prometheus() (GET /metrics).
+
+Spans are also exported as OpenTelemetry spans when the `opentelemetry-api`
+package is installed; without a configured SDK (e.g. `opentelemetry-instrument`)
+they are no-ops.
+"""
+
+import time
+import inspect
+import functools
+import threading
+from collections import defaultdict
+from contextlib import contextmanager
+
+try:
+    from opentelemetry import trace as _otel_trace
+    _tracer = _otel_trace.get_tracer("privashield")
+except ImportError:
+    _tracer = None
+
+_lock = threading.Lock()
+_counters = defaultdict(float)   # (name, ((label, value), ...)) -> total
+_histograms = {}                 # (name, labels) -> [bucket counts, sum, count]
+
+# Seconds; covers everything from a cache read to a slow LLM call.
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _key(name: str, labels: dict) -> tuple:
+    return name, tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def inc(name: str, value: float = 1, **labels) -> None:
+    with _lock:
+        _counters[_key(name, labels)] += value
+
+
+def get(name: str, **labels) -> float:
+    with _lock:
+        return _counters.get(_key(name, labels), 0.0)
+
+
+def observe(name: str, value: float, **labels) -> None:
+    """Adds one observation to a histogram (DEFAULT_BUCKETS)."""
+    key = _key(name, labels)
+    with _lock:
+        hist = _histograms.get(key)
+        if hist is None:
+            hist = _histograms[key] = [[0] * len(DEFAULT_BUCKETS), 0.0, 0]
+        for i, bound in enumerate(DEFAULT_BUCKETS):
+            if value <= bound:
+                hist[0][i] += 1
+                break
+        hist[1] += value
+        hist[2] += 1
+
+
+@contextmanager
+def span(stage: str, **attributes):
+    """Times the block into stage_duration_seconds{stage} (and an OpenTelemetry span, if available)."""
+    start = time.perf_counter()
+    try:
+        if _tracer is None:
+            yield
+        else:
+            with _tracer.start_as_current_span(stage, attributes={k: str(v) for k, v in attributes.items()}):
+                yield
+    finally:
+        observe("stage_duration_seconds", time.perf_counter() - start, stage=stage)
+
+
+def timed(stage: str):
+    """Decorator form of span() for sync and async functions."""
+    def decorate(func):
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with span(stage):
+                    return await func(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(stage):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def snapshot() -> dict:
+    """
+    {name: [{"labels": {...}, "value": n}, ...]} for every counter seen so far;
+    histograms appear as {"labels": {...}, "count": n, "sum": seconds}.
+    """
+    with _lock:
+        items = list(_counters.items())
+        hists = [(key, hist[1], hist[2]) for key, hist in _histograms.items()]
+    out = defaultdict(list)
+    for (name, labels), value in sorted(items):
+        out[name].append({"labels": dict(labels), "value": value})
+    for (name, labels), total, count in sorted(hists):
+        out[name].append({"labels": dict(labels), "count": count, "sum": round(total, 6)})
+    return dict(out)
+
+
+# ── Prometheus text exposition ───────────────────────────────────────────────
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(labels, extra: tuple = ()) -> str:
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}"
+
+
+def render_prometheus() -> str:
+    """All counters and histograms in the Prometheus text format (version 0.0.4)."""
+    with _lock:
+        items = sorted(_counters.items())
+        hists = sorted((key, (list(h[0]), h[1], h[2])) for key, h in _histograms.items())
+
+    lines = []
+    typed = set()
+    for (name, labels), value in items:
+        if name not in typed:
+            lines.append(f"# TYPE {name} counter")
+            typed.add(name)
+        lines.append(f"{name}{_labels(labels)} {value:g}")
+
+    for (name, labels), (buckets, total, count) in hists:
+        if name not in typed:
+            lines.append(f"# TYPE {name} histogram")
+            typed.add(name)
+        cumulative = 0
+        for bound, n in zip(DEFAULT_BUCKETS, buckets):
+            cumulative += n
+            lines.append(f"{name}_bucket{_labels(labels, (('le', f'{bound:g}'),))} {cumulative}")
+        lines.append(f"{name}_bucket{_labels(labels, (('le', '+Inf'),))} {count}")
+        lines.append(f"{name}_sum{_labels(labels)} {total:.6f}")
+        lines.append(f"{name}_count{_labels(labels)} {count}")
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,203 @@
+"""
+PrivaShield AI - Embedding-based Permission Matcher
+Local first pass for permission mapping: exemplar phrases for each device
+permission are embedded once, scored against the policy's chunk embeddings with a
+single matrix multiply, and each permission is classified as requested / not
+requested / ambiguous. Only the ambiguous ones need the LLM.
+"""
+
+import os
+from typing import Optional
+
+import numpy as np
+
+import ai_engine
+
+# Cosine thresholds for all-MiniLM-L6-v2, set high for "requested" and low for
+# "not requested" so that anything unclear goes to the LLM. The labelled pairs in
+# tests/data/permission_pairs.json are the reference: test_calibration fails if a
+# labelled negative is accepted or a positive rejected, and
+# `python -m rag.benchmarks.calibrate permissions` derives both values from them.
+# Override with PERMISSION_ACCEPT_THRESHOLD / PERMISSION_REJECT_THRESHOLD.
+ACCEPT_THRESHOLD = float(os.getenv("PERMISSION_ACCEPT_THRESHOLD", "0.55"))
+REJECT_THRESHOLD = float(os.getenv("PERMISSION_REJECT_THRESHOLD", "0.35"))
+TOP_CHUNKS_PER_PERMISSION = 2
+
+# Keys must match risk_analyzer.DEVICE_PERMISSIONS.
+PERMISSION_EXEMPLARS = {
+    "Camera": [
+        "we access your device camera to take photos or videos",
+        "the app uses the camera to scan documents or QR codes",
+        "images captured with your camera",
+    ],
+    "Microphone": [
+        "we access your microphone to record audio",
+        "voice commands and audio recordings from your device",
+        "we collect voice data when you use speech features",
+    ],
+    "Location (GPS)": [
+        "we collect your precise geolocation from GPS",
+        "location information from your device",
+        "we use your location to provide nearby results",
+    ],
+    "Contacts": [
+        "we access your address book and contact list",
+        "you may upload your contacts to find friends",
+        "names and phone numbers of your contacts",
+    ],
+    "Storage / Files": [
+        "we access files and photos stored on your device",
+        "read and write access to your device storage",
+        "media files you upload from your device",
+    ],
+    "Notifications": [
+        "we send you push notifications",
+        "you can turn off notifications in your device settings",
+        "alerts and reminders delivered to your device",
+    ],
+    "Background Activity Tracking": [
+        "we collect data while the app is running in the background",
+        "activity tracked even when you are not using the app",
+        "background location and usage monitoring",
+    ],
+    "Clipboard Access": [
+        "we read content copied to your clipboard",
+        "text you copy and paste within the app",
+        "access to the device clipboard",
+    ],
+    "Biometric Data (Face / Fingerprint)": [
+        "we collect biometric identifiers such as face geometry or fingerprints",
+        "facial recognition and face scans",
+        "fingerprint or face unlock authentication data",
+    ],
+    "Bluetooth / Nearby Devices": [
+        "we use Bluetooth to connect to nearby devices",
+        "information about devices near you via Bluetooth or beacons",
+        "scan for nearby wireless devices",
+    ],
+    "Calendar": [
+        "we access your calendar events",
+        "the app reads and adds entries to your calendar",
+        "calendar appointments and schedules",
+    ],
+    "Call Logs": [
+        "we access your call history and call logs",
+        "records of phone calls made and received",
+        "incoming and outgoing call information",
+    ],
+    "SMS / Messages": [
+        "we read your SMS text messages",
+        "access to messages to verify your phone number automatically",
+        "content of text messages on your device",
+    ],
+    "Advertising ID / Cross-App Tracking": [
+        "we collect your mobile advertising identifier such as IDFA or AAID",
+        "we track your activity across other apps and websites for advertising",
+        "device identifiers shared with advertising partners",
+    ],
+    "Network / Wi-Fi Information": [
+        "we collect your IP address and network information",
+        "Wi-Fi network names and connection details",
+        "information about your mobile carrier and network connection",
+    ],
+}
+
+DENY_CONSEQUENCES = {
+    "Camera": "Photo, video or scanning features will not work.",
+    "Microphone": "Voice input, calls or audio recording features will not work.",
+    "Location (GPS)": "Location-based features and nearby results will be unavailable or approximate.",
+    "Contacts": "You will need to add friends or recipients manually.",
+    "Storage / Files": "You will not be able to upload or save files and media.",
+    "Notifications": "You will not receive alerts or reminders.",
+    "Background Activity Tracking": "Features that rely on running in the background may be delayed or unavailable.",
+    "Clipboard Access": "Paste shortcuts may require manual entry.",
+    "Biometric Data (Face / Fingerprint)": "You will need to use a password or PIN instead.",
+    "Bluetooth / Nearby Devices": "Connecting to nearby devices or accessories will not work.",
+    "Calendar": "Events will not be added to or read from your calendar.",
+    "Call Logs": "Call-related features such as caller identification will be limited.",
+    "SMS / Messages": "Automatic code verification will not work; codes must be entered manually.",
+    "Advertising ID / Cross-App Tracking": "Ads will be less personalized; core features are unaffected.",
+    "Network / Wi-Fi Information": "Usually cannot be denied; some connectivity diagnostics may be limited.",
+}
+
+HIGH_RISK_PERMISSIONS = {
+    "Camera", "Microphone", "Location (GPS)", "Contacts", "Biometric Data (Face / Fingerprint)",
+    "Call Logs", "SMS / Messages", "Advertising ID / Cross-App Tracking", "Background Activity Tracking",
+}
+
+_exemplar_matrix: Optional[np.ndarray] = None
+_exemplar_owner: list = []   # permission name for each exemplar row
+
+
+def _exemplars() -> tuple:
+    """Embeds all exemplar phrases once per process."""
+    global _exemplar_matrix, _exemplar_owner
+    if _exemplar_matrix is None:
+        phrases, owners = [], []
+        for name, examples in PERMISSION_EXEMPLARS.items():
+            phrases.extend(examples)
+            owners.extend([name] * len(examples))
+        _exemplar_matrix = ai_engine.embed_texts(phrases)
+        _exemplar_owner = owners
+    return _exemplar_matrix, _exemplar_owner
+
+
+def score_permissions(chunks: list[dict]) -> Optional[dict]:
+    """
+    Returns {permission: {"score", "top_chunks"}} or None when no embedding model
+    is available (callers then fall back to the full-text LLM prompt).
+    Blocking (model inference); async callers run it in a worker thread.
+    """
+    if ai_engine.embedding_model is None or not chunks:
+        return None
+    exemplar_embs, owners = _exemplars()
+    chunk_embs = ai_engine.get_chunk_embeddings(chunks)
+    similarity = chunk_embs @ exemplar_embs.T          # (n_chunks, n_exemplars)
+
+    results = {}
+    owners_arr = np.array(owners)
+    for name in PERMISSION_EXEMPLARS:
+        per_chunk = similarity[:, owners_arr == name].max(axis=1)   # best exemplar per chunk
+        order = np.argsort(per_chunk)[::-1][:TOP_CHUNKS_PER_PERMISSION]
+        results[name] = {
+            "score": float(per_chunk[order[0]]),
+            "top_chunks": [chunks[i] for i in order],
+        }
+    return results
+
+
+def classify(score: float) -> str:
+    if score >= ACCEPT_THRESHOLD:
+        return "requested"
+    if score < REJECT_THRESHOLD:
+        return "not_requested"
+    return "ambiguous"
+
+
+def local_entry(name: str, match: dict) -> dict:
+    """Permission entry in the LLM output shape, decided from embedding similarity."""
+    requested = classify(match["score"]) == "requested"
+    margin = match["score"] - ACCEPT_THRESHOLD if requested else REJECT_THRESHOLD - match["score"]
+    evidence = match["top_chunks"][0]["text"][:300] if requested and match["top_chunks"] else "Not mentioned in the policy."
+    return {
+        "name": name,
+        "requested": requested,
+        "confidence": "high" if margin >= 0.1 else "medium",
+        "purpose": "Referenced in the policy; see evidence." if requested else "No use described in the policy.",
+        "policy_evidence": evidence,
+        "deny_consequence": DENY_CONSEQUENCES.get(name, ""),
+        "recommendation": "CONDITIONAL" if requested else "DENY",
+        "recommendation_reason": (
+            "Allow only if you use the feature that needs it."
+            if requested else "The policy gives no reason for the app to need this."
+        ),
+        "similarity": round(match["score"], 3),
+        "source": "embedding",
+    }
+
+
+def risk_score(permissions: list[dict]) -> int:
+    """1-10 score from how many (and which) permissions are requested."""
+    requested = [p["name"] for p in permissions if p.get("requested")]
+    high = sum(1 for name in requested if name in HIGH_RISK_PERMISSIONS)
+    return max(1, min(10, round(1 + 1.5 * high + 0.5 * (len(requested) - high))))
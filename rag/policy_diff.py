@@ -0,0 +1,165 @@
+"""
+PrivaShield AI - Policy Change Detection
+Section-level diffing of cleaned policy text and merging of partial extractions,
+so an edited policy only re-sends its changed sections to the Extraction Agent.
+"""
+
+import re
+import hashlib
+from typing import List
+
+# A line counts as a heading if it is short and does not read like a sentence.
+_HEADING_MAX_CHARS = 80
+_SENTENCE_END = (".", "!", "?", ",", ";")
+
+
+def content_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def normalize(text: str) -> str:
+    """Whitespace/case-insensitive form used for section hashes and quote lookups."""
+    return re.sub(r"\s+", " ", text).strip().lower()
+
+
+def _is_heading(line: str) -> bool:
+    return (
+        len(line) <= _HEADING_MAX_CHARS
+        and not line.endswith(_SENTENCE_END)
+        and any(ch.isalpha() for ch in line)
+    )
+
+
+def split_sections(text: str) -> List[dict]:
+    """
+    Splits clean_html() output (one block per line) into heading-led sections.
+    Each section carries its character offset in `text` and a whitespace/case
+    insensitive hash, so cosmetic reflows do not count as changes.
+    """
+    sections = []
+    current = []
+    start = 0
+    offset = 0
+
+    def flush():
+        if current:
+            body = "\n".join(current)
+            sections.append({
+                "heading": current[0] if _is_heading(current[0]) else None,
+                "text": body,
+                "start": start,
+                "hash": hashlib.sha1(normalize(body).encode("utf-8")).hexdigest(),
+            })
+
+    for line in text.split("\n"):
+        if _is_heading(line) and current and not _is_heading(current[-1]):
+            flush()
+            current = []
+            start = offset
+        if not current:
+            start = offset
+        current.append(line)
+        offset += len(line) + 1
+    flush()
+    return sections
+
+
+def diff_sections(old_text: str, new_text: str) -> dict:
+    """Returns the new sections that did not exist in the old text, plus change stats."""
+    old_hashes = {s["hash"] for s in split_sections(old_text)}
+    new_sections = split_sections(new_text)
+    new_hashes = {s["hash"] for s in new_sections}
+
+    changed = [s for s in new_sections if s["hash"] not in old_hashes]
+    removed_count = len(old_hashes - new_hashes)
+    changed_chars = sum(len(s["text"]) for s in changed)
+    return {
+        "changed": changed,
+        "changed_count": len(changed),
+        "removed_count": removed_count,
+        "total_count": len(new_sections),
+        "change_ratio": changed_chars / max(len(new_text), 1),
+    }
+
+
+# ──────────────────────────────────────────────
+#  FACT MERGING
+# ──────────────────────────────────────────────
+
+def quote_present(quote, normalized_text: str) -> bool:
+    """True if `quote` occurs in text already passed through normalize()."""
+    return bool(quote) and normalize(str(quote)) in normalized_text
+
+
+# Names a jurisdiction signal may appear under in a policy (lowercase).
+_SIGNAL_ALIASES = {
+    "gdpr": ("gdpr", "general data protection regulation", "european economic area", "eea"),
+    "ccpa": ("ccpa", "cpra", "california consumer privacy act", "california privacy rights act"),
+    "dpdp": ("dpdp", "digital personal data protection"),
+    "lgpd": ("lgpd", "lei geral de prote"),
+    "pipeda": ("pipeda", "personal information protection and electronic documents act"),
+    "coppa": ("coppa", "children's online privacy protection act", "children’s online privacy protection act"),
+    "uk gdpr": ("uk gdpr", "data protection act 2018"),
+}
+
+
+def signal_present(signal, normalized_text: str) -> bool:
+    """
+    True if the document still mentions a jurisdiction signal such as "GDPR" or
+    "DPDP Act (India)": by a known alias, else by its own wording (parenthetical
+    dropped). Signals carry no source quote, so this is how the incremental path
+    drops the ones that only came from removed sections.
+    """
+    name = normalize(re.sub(r"\(.*?\)", "", str(signal)))
+    keys = [key for key in _SIGNAL_ALIASES if re.search(rf"\b{re.escape(key)}\b", name)]
+    aliases = _SIGNAL_ALIASES[max(keys, key=len)] if keys else (name,)
+    return bool(name) and any(alias in normalized_text for alias in aliases)
+
+
+def _not_stated(fact: dict) -> dict:
+    """A dict fact in the form the Extractor gives for an absent topic: every field null."""
+    return {k: False if k == "multiple_mentions" else None for k in fact}
+
+
+def merge_facts(prior_facts: dict, delta_facts: dict, new_text: str) -> dict:
+    """
+    Merges an extraction of only the changed sections into the previous full
+    extraction. Prior facts survive while their source_quote is still in the
+    document; facts whose quote disappeared are replaced by what the changed
+    sections say, or reset to "not stated" if they say nothing about it (e.g. a
+    section was only removed).
+    """
+    normalized = normalize(new_text)
+    merged = {}
+    for key in set(prior_facts) | set(delta_facts):
+        prior = prior_facts.get(key)
+        delta = delta_facts.get(key)
+
+        if isinstance(prior, list) or isinstance(delta, list):
+            kept = [
+                item for item in (prior or [])
+                if not isinstance(item, dict) or quote_present(item.get("source_quote"), normalized)
+            ]
+            seen = {normalize(str(item.get("source_quote", ""))) for item in kept if isinstance(item, dict)}
+            for item in delta or []:
+                quote = normalize(str(item.get("source_quote", ""))) if isinstance(item, dict) else None
+                if quote not in seen:
+                    kept.append(item)
+                    seen.add(quote)
+            merged[key] = kept
+        elif isinstance(prior, dict) or isinstance(delta, dict):
+            prior = prior or {}
+            delta = delta or {}
+            prior_quote = prior.get("source_quote")
+            if delta.get("source_quote"):
+                merged[key] = dict(delta)
+                if "multiple_mentions" in delta and quote_present(prior_quote, normalized) \
+                        and normalize(str(prior_quote)) != normalize(str(delta["source_quote"])):
+                    merged[key]["multiple_mentions"] = True
+            elif not prior_quote or quote_present(prior_quote, normalized):
+                merged[key] = prior
+            else:
+                merged[key] = delta or _not_stated(prior)
+        else:
+            merged[key] = delta if delta is not None else prior
+    return merged
@@ -0,0 +1,179 @@
+"""
+PrivaShield AI - Opt-in Request Profiling & Event-Loop Lag Monitor
+Two tools for finding where CPU goes inside the app, both off by default:
+
+- profile_requests (HTTP middleware) profiles a sampled share of requests
+  (PROFILE_SAMPLE_RATE, e.g. 0.01) plus any request carrying
+  `X-Profile: <PROFILE_TOKEN>`. Uses pyinstrument when installed (statistical,
+  follows the request's own coroutine, HTML report) and cProfile otherwise
+  (deterministic, .prof file for pstats / snakeviz; it sees everything running
+  on the event loop meanwhile, not just this request). Reports go to
+  storage/profiles/, newest PROFILE_MAX_FILES kept; the file name is returned in
+  the X-Profile-Id response header. One request is profiled at a time. Covers
+  the handler up to the response headers (HTML cleaning, chunking/tokenization,
+  embedding, prompt building), not the body of a streamed response.
+
+- The loop monitor (LOOP_LAG_THRESHOLD_MS > 0) ticks a heartbeat on the event
+  loop; a watchdog thread prints the loop thread's stack whenever the heartbeat
+  is late by more than the threshold, i.e. while something blocks the loop.
+  Lag is recorded in event_loop_lag_seconds, episodes in event_loop_blocked_total.
+"""
+
+import os
+import sys
+import time
+import random
+import asyncio
+import cProfile
+import threading
+import traceback
+from typing import Optional
+
+import metrics
+
+try:
+    from pyinstrument import Profiler as _Pyinstrument
+except ImportError:
+    _Pyinstrument = None
+
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+PROFILE_TOKEN = os.getenv("PROFILE_TOKEN", "")
+PROFILE_MAX_FILES = int(os.getenv("PROFILE_MAX_FILES", "200"))
+PROFILE_DIR = os.path.join("storage", "profiles")
+
+LOOP_LAG_THRESHOLD_MS = float(os.getenv("LOOP_LAG_THRESHOLD_MS", "0"))
+_LOOP_TICK = 0.05   # heartbeat interval, seconds
+
+_profiling = False  # one profiler at a time: both hook the interpreter's (per-thread) profile function
+
+
+# ── Request profiling ────────────────────────────────────────────────────────
+
+def _wants_profile(request) -> bool:
+    if PROFILE_TOKEN and request.headers.get("x-profile") == PROFILE_TOKEN:
+        return True
+    return PROFILE_SAMPLE_RATE > 0 and random.random() < PROFILE_SAMPLE_RATE
+
+
+def _report_name(request, extension: str) -> str:
+    path = request.url.path.strip("/").replace("/", "_") or "root"
+    return f"{time.strftime('%Y%m%d-%H%M%S')}_{int(time.time() * 1000) % 1000:03d}_{request.method}_{path}{extension}"
+
+
+def _prune() -> None:
+    try:
+        names = sorted(os.listdir(PROFILE_DIR))
+    except OSError:
+        return
+    for name in names[:max(0, len(names) - PROFILE_MAX_FILES)]:
+        try:
+            os.remove(os.path.join(PROFILE_DIR, name))
+        except OSError:
+            pass
+
+
+def _write_report(request, profiler) -> Optional[str]:
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    try:
+        if isinstance(profiler, cProfile.Profile):
+            name = _report_name(request, ".prof")
+            profiler.dump_stats(os.path.join(PROFILE_DIR, name))
+        else:
+            name = _report_name(request, ".html")
+            with open(os.path.join(PROFILE_DIR, name), "w", encoding="utf-8") as f:
+                f.write(profiler.output_html())
+    except Exception as e:
+        print(f"[Profiling] Could not write profile: {e}")
+        return None
+    _prune()
+    return name
+
+
+async def profile_requests(request, call_next):
+    """HTTP middleware; a no-op unless the request is sampled or carries the profile token."""
+    global _profiling
+    if _profiling or not _wants_profile(request):
+        return await call_next(request)
+
+    _profiling = True
+    if _Pyinstrument is not None:
+        profiler = _Pyinstrument(async_mode="enabled")
+        profiler.start()
+    else:
+        profiler = cProfile.Profile()
+        profiler.enable()
+    try:
+        response = await call_next(request)
+    finally:
+        if isinstance(profiler, cProfile.Profile):
+            profiler.disable()
+        else:
+            profiler.stop()
+        _profiling = False
+
+    name = await asyncio.to_thread(_write_report, request, profiler)
+    if name:
+        metrics.inc("profiles_written_total")
+        response.headers["X-Profile-Id"] = name
+    return response
+
+
+# ── Event-loop lag monitor ───────────────────────────────────────────────────
+
+class LoopMonitor:
+    """Heartbeat task on the loop + watchdog thread that dumps the loop's stack while it is blocked."""
+
+    def __init__(self, threshold_ms: float):
+        self.threshold = threshold_ms / 1000
+        self._heartbeat = time.monotonic()
+        self._loop_thread_id = None
+        self._task = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self) -> None:
+        self._loop_thread_id = threading.get_ident()
+        self._heartbeat = time.monotonic()
+        self._task = asyncio.get_running_loop().create_task(self._tick())
+        self._thread = threading.Thread(target=self._watch, name="loop-lag-watchdog", daemon=True)
+        self._thread.start()
+        print(f"[Profiling] Event-loop lag monitor active (threshold {self.threshold * 1000:.0f}ms)")
+
+    async def stop(self) -> None:
+        self._stop.set()
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+
+    async def _tick(self) -> None:
+        while True:
+            expected = time.monotonic() + _LOOP_TICK
+            await asyncio.sleep(_LOOP_TICK)
+            now = time.monotonic()
+            metrics.observe("event_loop_lag_seconds", max(0.0, now - expected))
+            self._heartbeat = now
+
+    def _watch(self) -> None:
+        reported = None   # heartbeat value of the episode already reported
+        while not self._stop.wait(self.threshold / 2):
+            heartbeat = self._heartbeat
+            blocked_for = time.monotonic() - heartbeat - _LOOP_TICK
+            if blocked_for <= self.threshold or reported == heartbeat:
+                continue
+            reported = heartbeat
+            metrics.inc("event_loop_blocked_total")
+            frame = sys._current_frames().get(self._loop_thread_id)
+            stack = "".join(traceback.format_stack(frame)) if frame is not None else "  (stack unavailable)\n"
+            print(f"[Profiling] Event loop blocked for {blocked_for * 1000:.0f}ms+, loop thread stack:\n{stack}")
+
+
+def start_loop_monitor() -> Optional[LoopMonitor]:
+    """Starts the monitor on the running loop if LOOP_LAG_THRESHOLD_MS > 0; returns it (or None)."""
+    if LOOP_LAG_THRESHOLD_MS <= 0:
+        return None
+    monitor = LoopMonitor(LOOP_LAG_THRESHOLD_MS)
+    monitor.start()
+    return monitor
@@ -0,0 +1,169 @@
+"""
+PrivaShield AI - Background Cache Revalidation (stale-while-revalidate)
+Every stored analysis records what produced it (cache_meta: schema version,
+prompt hash, models; see analysis_service.CURRENT_VERSION). An entry that no
+longer matches - after a prompt edit, a model swap, a schema bump, or one written
+before versioning - is still served immediately, and schedule() re-analyses the
+policy in the background: at the LLM governor's lowest priority, at most
+REVALIDATE_MAX_CONCURRENCY policies at a time, one run per entry at once. The
+stale entry stays in place until the new analysis succeeds. An entry whose
+re-analysis failed, or had no policy text to work from, is not retried for
+REVALIDATE_RETRY_AFTER seconds (the memo is per process, i.e. per
+CURRENT_VERSION), so a policy that always fails does not cost a full analysis
+on every request.
+
+cache_report() summarises entry ages and versions for GET /admin/cache-stats.
+"""
+
+import os
+import json
+import time
+import asyncio
+import weakref
+from collections import Counter
+from typing import Optional
+
+import ai_engine
+import analysis_cache
+import analysis_service
+import database
+import faq
+import metrics
+from llm_config import deprioritize
+
+REVALIDATE_ENABLED = os.getenv("REVALIDATE_ENABLED", "true").lower() != "false"
+REVALIDATE_MAX_CONCURRENCY = int(os.getenv("REVALIDATE_MAX_CONCURRENCY", "1"))
+REVALIDATE_RETRY_AFTER = float(os.getenv("REVALIDATE_RETRY_AFTER", "86400"))
+
+_pending: set = set()    # strong refs to background tasks until they finish
+_inflight: set = set()   # url_hashes being revalidated
+_backoff: dict = {}      # url_hash -> (retry after, outcome) for failed / no_source runs
+_BACKOFF_MAX = 10000
+_semaphores = weakref.WeakKeyDictionary()   # event loop -> Semaphore
+
+_AGE_BUCKETS = ((1, "<1d"), (7, "1-7d"), (30, "7-30d"), (float("inf"), ">30d"))
+
+
+def _semaphore() -> asyncio.Semaphore:
+    loop = asyncio.get_running_loop()
+    semaphore = _semaphores.get(loop)
+    if semaphore is None:
+        semaphore = _semaphores[loop] = asyncio.Semaphore(REVALIDATE_MAX_CONCURRENCY)
+    return semaphore
+
+
+def schedule(url_hash: str, payload: dict, url: Optional[str] = None, html: Optional[str] = None) -> Optional[str]:
+    """
+    Starts a background re-analysis if `payload` is stale and returns why it is
+    (see analysis_service.stale_reason); returns None for a current entry.
+    The policy text comes from `html` when given, else from processed_sites.
+    """
+    reason = analysis_service.stale_reason(payload)
+    if reason is None or not REVALIDATE_ENABLED or url_hash in _inflight or _backing_off(url_hash, html):
+        return reason
+    _inflight.add(url_hash)
+    metrics.inc("cache_revalidations_total", result="scheduled", reason=reason)
+    task = asyncio.get_running_loop().create_task(_revalidate(url_hash, url, html))
+    _pending.add(task)
+    task.add_done_callback(_pending.discard)
+    return reason
+
+
+def _backing_off(url_hash: str, html: Optional[str]) -> bool:
+    retry_after, outcome = _backoff.get(url_hash, (0.0, None))
+    if time.time() >= retry_after:
+        _backoff.pop(url_hash, None)
+        return False
+    return not (outcome == "no_source" and html)   # a submitted page is a new source
+
+
+async def _revalidate(url_hash: str, url: Optional[str], html: Optional[str]) -> None:
+    deprioritize()   # user-facing requests always go first
+    try:
+        async with _semaphore():
+            result = await _reanalyze(url_hash, url, html)
+    except Exception as e:
+        print(f"[Revalidation] Re-analysis failed for {url_hash}: {e}")
+        result = "failed"
+    finally:
+        _inflight.discard(url_hash)
+    if result in ("failed", "no_source"):
+        if len(_backoff) >= _BACKOFF_MAX:
+            _backoff.pop(next(iter(_backoff)))
+        _backoff[url_hash] = (time.time() + REVALIDATE_RETRY_AFTER, result)
+    metrics.inc("cache_revalidations_total", result=result)
+
+
+async def _reanalyze(url_hash: str, url: Optional[str], html: Optional[str]) -> str:
+    clean_text = await asyncio.to_thread(ai_engine.clean_html, html) if html else None
+    db = database.SessionLocal()
+    try:
+        scan = database.get_scan_by_hash(db, url_hash)
+        if scan is not None:
+            url = url or scan.url
+            if not clean_text or len(clean_text) < 100:
+                clean_text = scan.policy_text
+
+        if not clean_text or len(clean_text) < 100:
+            return "no_source"
+        payload = await analysis_service.analyze_policy_text(clean_text)
+        if "error" in payload.get("pipeline_data", {}) or not analysis_service.cacheable(payload):
+            return "failed"   # keep serving the stale entry
+        analysis_service.attach_source_hashes(payload, clean_text, html)
+        analysis_cache.save(url_hash, payload)
+        if url:
+            analysis_service.save_scan(db, url, payload["pipeline_data"], clean_text)
+    finally:
+        db.close()
+    faq.schedule(url_hash, clean_text, payload["pipeline_data"])
+    print(f"[Revalidation] Refreshed {url_hash}")
+    return "ok"
+
+
+# ── Reporting ────────────────────────────────────────────────────────────────
+
+def _version_label(meta) -> str:
+    if not isinstance(meta, dict):
+        return "legacy"
+    models = ",".join(sorted(set((meta.get("models") or {}).values())))
+    return f"schema={meta.get('schema_version')} prompts={meta.get('prompt_hash')} models={models}"
+
+
+def cache_report() -> dict:
+    """Entry count, age distribution, versions and stale reasons over the analysis cache (reads every entry)."""
+    now = time.time()
+    ages, versions, stale = [], Counter(), Counter()
+    entries = 0
+    for _, suffix, path, stat in analysis_cache.entries():
+        if suffix != analysis_cache.CACHE_SUFFIX:
+            continue
+        entries += 1
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                payload = json.load(f)
+        except (OSError, ValueError):
+            stale["unreadable"] += 1
+            continue
+        meta = payload.get("cache_meta") if isinstance(payload, dict) else None
+        analyzed_at = meta.get("analyzed_at") if isinstance(meta, dict) else None
+        ages.append(max(0.0, now - (analyzed_at or stat.st_mtime)) / 86400)
+        versions[_version_label(meta)] += 1
+        reason = analysis_service.stale_reason(payload) if isinstance(payload, dict) else "unreadable"
+        if reason:
+            stale[reason] += 1
+
+    ages.sort()
+    buckets = Counter(next(label for bound, label in _AGE_BUCKETS if age < bound) for age in ages)
+    return {
+        "entries": entries,
+        "current_version": _version_label(analysis_service.CURRENT_VERSION),
+        "versions": dict(versions.most_common()),
+        "stale": dict(stale),
+        "age_days": {
+            "min": round(ages[0], 2) if ages else None,
+            "median": round(ages[len(ages) // 2], 2) if ages else None,
+            "max": round(ages[-1], 2) if ages else None,
+            **{label: buckets.get(label, 0) for _, label in _AGE_BUCKETS},
+        },
+        "revalidating": len(_inflight),
+    }
@@ -1,13 +1,20 @@
 """
 PrivaShield AI - Risk Analyzer & Permission Mapper
 Provides advanced privacy risk analysis and device-permission-to-policy mapping.
+Async-first: every task has one async implementation and one prompt (prompts.py);
+the sync functions at the bottom are thin wrappers around them.
 """
 
 import os
 import json
-import re
+import asyncio
 from dotenv import load_dotenv
-from llm_config import llm  # shared instance with SQLiteCache
+from llm_config import ainvoke_json, requires, run_sync  # shared LLM with SQLiteCache, via the concurrency governor
+import metrics
+import prompts
+import clause_detector
+import ai_engine
+import permission_matcher
 
 load_dotenv()
 
@@ -15,58 +22,21 @@ load_dotenv()
 #  RISK ANALYSIS
 # ──────────────────────────────────────────────
 
-def analyze_risks(clean_text: str) -> dict:
+@metrics.timed("risks")
+async def analyze_risks_async(clean_text: str) -> dict:
     """
-    Analyzes cleaned privacy policy text for critical privacy risks.
-    Returns structured risk data including score, categories, and flags.
+    Asynchronously analyzes the clean text of a privacy policy.
     """
-    context = clean_text[:15000]
-
-    prompt = f"""You are a senior privacy policy auditor. Analyze the following privacy policy text and return a JSON response.
-
-You MUST return ONLY valid JSON, no markdown, no explanation, no code fences. Just raw JSON.
-
-Return this exact structure:
-{{
-    "overall_risk_score": <number 1-10>,
-    "risk_level": "<LOW|MEDIUM|HIGH|CRITICAL>",
-    "data_collected": [
-        {{"category": "<category name>", "items": ["<item1>", "<item2>"], "severity": "<low|medium|high>"}}
-    ],
-    "third_party_sharing": [
-        {{"entity": "<company/type>", "purpose": "<why>", "data_shared": ["<what data>"]}}
-    ],
-    "hidden_clauses": [
-        {{"clause": "<summary of the hidden/dangerous clause>", "risk": "<why this is dangerous>", "severity": "<medium|high|critical>"}}
-    ],
-    "user_rights": {{
-        "can_delete_data": <true|false>,
-        "can_opt_out": <true|false>,
-        "data_portability": <true|false>,
-        "consent_withdrawal": <true|false>,
-        "details": "<brief explanation>"
-    }},
-    "retention_policy": "<how long data is kept>",
-    "red_flags": ["<flag1>", "<flag2>"]
-}}
-
-Privacy Policy Text:
-{context}
-"""
+    prompt = prompts.render_with_document("risks", clean_text)
 
     try:
-        response = llm.invoke(prompt)
-        content = response.content.strip()
-        # Try to extract JSON from the response
-        content = _extract_json(content)
-        result = json.loads(content)
-        return result
-    except json.JSONDecodeError:
+        return await ainvoke_json(prompt, task="risks")
+    except json.JSONDecodeError as e:
         return {
             "overall_risk_score": 0,
             "risk_level": "UNKNOWN",
             "error": "Failed to parse AI response",
-            "raw_response": response.content[:500] if response else ""
+            "raw_response": e.doc[:500]
         }
     except Exception as e:
         return {
@@ -99,348 +69,166 @@ DEVICE_PERMISSIONS = [
 ]
 
 
-def map_permissions(clean_text: str) -> dict:
+def permission_inputs(clean_text: str):
     """
-    Maps privacy policy text to device-level permissions.
-    Explains what each permission is used for and consequences of denying it.
+    What map_permissions_async reads: every chunk with an embedding model, else
+    the document window. Equal inputs give an equal result, so an edit elsewhere
+    can reuse the previous permission_data.
     """
-    context = clean_text[:15000]
-    permissions_list = ", ".join(DEVICE_PERMISSIONS)
+    if ai_engine.embedding_model is None:
+        return clean_text[:prompts.DOCUMENT_WINDOW]
+    return [chunk["text"] for chunk in ai_engine.chunk_text(clean_text)]
 
-    prompt = f"""You are a mobile privacy expert. Analyze the following privacy policy and map it to device-level permissions.
-
-For each permission from this list: [{permissions_list}]
-
-Determine if the policy indicates the app uses/requests that permission.
-
-You MUST return ONLY valid JSON, no markdown, no explanation, no code fences. Just raw JSON.
-
-Return this exact structure:
-{{
-    "permissions": [
-        {{
-            "name": "<permission name>",
-            "requested": <true|false>,
-            "confidence": "<high|medium|low>",
-            "purpose": "<why the app needs this based on the policy>",
-            "policy_evidence": "<exact quote or paraphrase from the policy>",
-            "deny_consequence": "<what happens if user denies this permission>",
-            "recommendation": "<ALLOW|DENY|CONDITIONAL>",
-            "recommendation_reason": "<why this recommendation>"
-        }}
-    ],
-    "total_permissions_requested": <number>,
-    "unnecessary_permissions": ["<permission that seems excessive>"],
-    "permission_risk_score": <number 1-10>
-}}
-
-Privacy Policy Text:
-{context}
-"""
 
-    try:
-        response = llm.invoke(prompt)
-        content = response.content.strip()
-        content = _extract_json(content)
-        result = json.loads(content)
-        return result
-    except json.JSONDecodeError:
-        return {
-            "permissions": [],
-            "error": "Failed to parse AI response",
-            "raw_response": response.content[:500] if response else ""
-        }
-    except Exception as e:
-        return {
-            "permissions": [],
-            "error": f"AI Error: {str(e)}"
-        }
+def _score_permissions(clean_text: str):
+    return permission_matcher.score_permissions(ai_engine.chunk_text(clean_text))
 
 
-# ──────────────────────────────────────────────
-#  HIDDEN CLAUSE DETECTION
-# ──────────────────────────────────────────────
+@metrics.timed("permissions")
+async def map_permissions_async(clean_text: str) -> dict:
+    """
+    Asynchronously maps privacy policy text to device-level permissions.
+    Permissions are first scored locally by embedding similarity (permission_matcher);
+    only the ambiguous ones go to the LLM, with just their best-matching chunks.
+    """
+    # Chunking and embedding are CPU-bound; keep them off the event loop.
+    matches = await asyncio.to_thread(_score_permissions, clean_text)
+    if matches is None:
+        # No embedding model available — classify everything with the LLM.
+        return await _map_permissions_full_text(clean_text)
+
+    ambiguous = [name for name in DEVICE_PERMISSIONS if permission_matcher.classify(matches[name]["score"]) == "ambiguous"]
+    entries = {
+        name: permission_matcher.local_entry(name, matches[name])
+        for name in DEVICE_PERMISSIONS if name not in ambiguous
+    }
+    result = {}
+
+    if ambiguous:
+        excerpts = {}
+        for name in ambiguous:
+            for chunk in matches[name]["top_chunks"]:
+                excerpts.setdefault(chunk["chunk_id"], chunk["text"])
+        excerpt_text = "\n\n".join(f"[{cid}]\n{text}" for cid, text in excerpts.items())
+
+        prompt = prompts.render(
+            "permissions_ambiguous",
+            permissions_list=", ".join(ambiguous),
+            excerpt_text=excerpt_text,
+        )
+        try:
+            result = await ainvoke_json(prompt, task="permissions_ambiguous", validate=requires("permissions"))
+            for entry in result.get("permissions", []):
+                if entry.get("name") in ambiguous:
+                    entries[entry["name"]] = {**entry, "source": "llm"}
+        except Exception as e:
+            print(f"[Permissions] LLM pass for ambiguous permissions failed: {e}")
+            result = {"error": f"AI Error: {str(e)}"}
+
+        # Anything the LLM did not answer falls back to the closer embedding side.
+        for name in ambiguous:
+            if name not in entries:
+                entry = permission_matcher.local_entry(name, matches[name])
+                entry["confidence"] = "low"
+                entries[name] = entry
+
+    permissions = [entries[name] for name in DEVICE_PERMISSIONS]
+    output = {
+        "permissions": permissions,
+        "total_permissions_requested": sum(1 for p in permissions if p.get("requested")),
+        "unnecessary_permissions": result.get("unnecessary_permissions", []),
+        "permission_risk_score": permission_matcher.risk_score(permissions),
+        "llm_checked_permissions": ambiguous,
+    }
+    if "error" in result:
+        output["error"] = result["error"]
+    return output
 
-def detect_hidden_clauses(clean_text: str) -> dict:
+
+async def _map_permissions_full_text(clean_text: str) -> dict:
     """
-    Specifically focuses on finding hidden, misleading, or dangerous clauses
-    that average users would miss.
+    LLM-only permission mapping over the document window (used without an embedding model).
     """
-    context = clean_text[:15000]
-
-    prompt = f"""You are a consumer rights attorney specializing in digital privacy. 
-Analyze this privacy policy and find ALL hidden, misleading, or dangerous clauses that an average user would miss.
-
-Focus on:
-1. Perpetual content ownership / license grants
-2. Data selling to third parties (even if disguised)
-3. Arbitration clauses that waive class-action rights
-4. Auto-renewal / cancellation traps
-5. Right to change terms without notice
-6. Data retention after account deletion
-7. Cross-device tracking
-8. Sharing data with government/law enforcement without warrant
-9. Using data for AI/ML training
-10. Broad indemnification clauses
-
-You MUST return ONLY valid JSON, no markdown, no explanation, no code fences. Just raw JSON.
-
-Return this exact structure:
-{{
-    "hidden_clauses": [
-        {{
-            "title": "<short title>",
-            "original_text": "<quote or close paraphrase from policy>",
-            "plain_english": "<what this actually means for the user>",
-            "severity": "<low|medium|high|critical>",
-            "category": "<one of the 10 categories above>",
-            "action_recommended": "<what the user should do>"
-        }}
-    ],
-    "transparency_score": <1-10, where 10 is fully transparent>,
-    "overall_assessment": "<one paragraph summary of how trustworthy this policy is>"
-}}
-
-Privacy Policy Text:
-{context}
-"""
+    permissions_list = ", ".join(DEVICE_PERMISSIONS)
+
+    prompt = prompts.render_with_document("permissions", clean_text, permissions_list=permissions_list)
 
     try:
-        response = llm.invoke(prompt)
-        content = response.content.strip()
-        content = _extract_json(content)
-        result = json.loads(content)
-        return result
-    except json.JSONDecodeError:
+        return await ainvoke_json(prompt, task="permissions")
+    except json.JSONDecodeError as e:
         return {
-            "hidden_clauses": [],
+            "permissions": [],
             "error": "Failed to parse AI response",
-            "raw_response": response.content[:500] if response else ""
+            "raw_response": e.doc[:500]
         }
     except Exception as e:
         return {
-            "hidden_clauses": [],
+            "permissions": [],
             "error": f"AI Error: {str(e)}"
         }
 
 
 # ──────────────────────────────────────────────
-#  FULL DETAILED ANALYSIS
-# ──────────────────────────────────────────────
-
-def full_analysis(clean_text: str) -> dict:
-    """
-    Runs all analysis pipelines and returns a combined result.
-    """
-    risks = analyze_risks(clean_text)
-    permissions = map_permissions(clean_text)
-    hidden = detect_hidden_clauses(clean_text)
-
-    return {
-        "risk_analysis": risks,
-        "permission_mapping": permissions,
-        "hidden_clauses_analysis": hidden
-    }
-
-
-# ──────────────────────────────────────────────
-#  UTILITY
+#  HIDDEN CLAUSE DETECTION
 # ──────────────────────────────────────────────
 
-def _extract_json(text: str) -> str:
+@metrics.timed("hidden_clauses")
+async def detect_hidden_clauses_async(clean_text: str) -> dict:
     """
-    Extracts JSON from a response that might contain markdown code fences or extra text.
+    Asynchronously focuses on finding hidden, misleading, or dangerous clauses.
+    A lexical pre-filter (clause_detector) scans the full text and only the candidate
+    passages are sent to the LLM. If the LLM call fails (e.g. rate limited) the
+    keyword-based preliminary result is returned instead.
     """
-    # Try to find JSON in code fences first
-    json_match = re.search(r'```(?:json)?\s*\n?([\s\S]*?)\n?```', text)
-    if json_match:
-        return json_match.group(1).strip()
-
-    # Try to find raw JSON (starts with { and ends with })
-    brace_start = text.find('{')
-    brace_end = text.rfind('}')
-    if brace_start != -1 and brace_end != -1:
-        return text[brace_start:brace_end + 1]
-
-    return text
-
-
-# ──────────────────────────────────────────────
-#  ASYNCHRONOUS HIGH-SPEED API VERSIONS
-# ──────────────────────────────────────────────
+    candidates = clause_detector.find_candidates(clean_text)
+    if not candidates:
+        # Nothing matched any signature — let the LLM read the document as before.
+        return await _detect_hidden_clauses_full_text(clean_text)
+
+    passages, passage_index = clause_detector.format_passages(candidates)
+    categories = "\n".join(
+        f"{i}. {label}" for i, (label, _) in enumerate(clause_detector.CLAUSE_CATEGORIES.values(), start=1)
+    )
 
-async def analyze_risks_async(clean_text: str) -> dict:
-    """
-    Asynchronously analyzes the clean text of a privacy policy.
-    """
-    context = clean_text[:15000]
-
-    prompt = f"""You are a cybersecurity and privacy expert. Analyze the following privacy policy and extract key risks.
-You MUST return ONLY valid JSON, no markdown, no explanation, no code fences. Just raw JSON.
-
-Return this exact structure:
-{{
-    "overall_risk_score": <number 1-10>,
-    "risk_level": "<LOW|MEDIUM|HIGH|CRITICAL>",
-    "data_collected": [
-        {{"category": "<category name>", "items": ["<item1>", "<item2>"], "severity": "<low|medium|high>"}}
-    ],
-    "third_party_sharing": [
-        {{"entity": "<company/type>", "purpose": "<why>", "data_shared": ["<what data>"]}}
-    ],
-    "hidden_clauses": [
-        {{"clause": "<summary of the hidden/dangerous clause>", "risk": "<why this is dangerous>", "severity": "<medium|high|critical>"}}
-    ],
-    "user_rights": {{
-        "can_delete_data": <true|false>,
-        "can_opt_out": <true|false>,
-        "data_portability": <true|false>,
-        "consent_withdrawal": <true|false>,
-        "details": "<brief explanation>"
-    }},
-    "retention_policy": "<how long data is kept>",
-    "red_flags": ["<flag1>", "<flag2>"]
-}}
-
-Privacy Policy Text:
-{context}
-"""
+    prompt = prompts.render("hidden_clauses", categories=categories, passages=passages)
 
-    response = None
     try:
-        response = await llm.ainvoke(prompt)
-        content = response.content.strip()
-        content = _extract_json(content)
-        result = json.loads(content)
-        return result
-    except json.JSONDecodeError:
-        return {
-            "overall_risk_score": 0,
-            "risk_level": "UNKNOWN",
-            "error": "Failed to parse AI response",
-            "raw_response": response.content[:500] if response else ""
-        }
+        result = await ainvoke_json(prompt, task="hidden_clauses")
     except Exception as e:
-        return {
-            "overall_risk_score": 0,
-            "risk_level": "UNKNOWN",
-            "error": f"AI Error: {str(e)}"
-        }
+        print(f"[Hidden Clauses] LLM unavailable, returning keyword pre-scan: {e}")
+        result = clause_detector.preliminary_result(candidates)
+        result["error"] = f"AI Error: {str(e)}"
+        return result
 
+    for clause in result.get("hidden_clauses", []):
+        passage = passage_index.get(str(clause.get("passage_id", "")))
+        if passage:
+            clause["offset"] = [passage["start"], passage["end"]]
+    result["candidate_passages"] = len(passage_index)
+    return result
 
-async def map_permissions_async(clean_text: str) -> dict:
-    """
-    Asynchronously maps privacy policy text to device-level permissions.
-    """
-    context = clean_text[:15000]
-    permissions_list = ", ".join(DEVICE_PERMISSIONS)
 
-    prompt = f"""You are a mobile privacy expert. Analyze the following privacy policy and map it to device-level permissions.
-
-For each permission from this list: [{permissions_list}]
-
-Determine if the policy indicates the app uses/requests that permission.
-
-You MUST return ONLY valid JSON, no markdown, no explanation, no code fences. Just raw JSON.
-
-Return this exact structure:
-{{
-    "permissions": [
-        {{
-            "name": "<permission name>",
-            "requested": <true|false>,
-            "confidence": "<high|medium|low>",
-            "purpose": "<why the app needs this based on the policy>",
-            "policy_evidence": "<exact quote or paraphrase from the policy>",
-            "deny_consequence": "<what happens if user denies this permission>",
-            "recommendation": "<ALLOW|DENY|CONDITIONAL>",
-            "recommendation_reason": "<why this recommendation>"
-        }}
-    ],
-    "total_permissions_requested": <number>,
-    "unnecessary_permissions": ["<permission that seems excessive>"],
-    "permission_risk_score": <number 1-10>
-}}
-
-Privacy Policy Text:
-{context}
-"""
-
-    response = None
-    try:
-        response = await llm.ainvoke(prompt)
-        content = response.content.strip()
-        content = _extract_json(content)
-        result = json.loads(content)
-        return result
-    except json.JSONDecodeError:
-        return {
-            "permissions": [],
-            "error": "Failed to parse AI response",
-            "raw_response": response.content[:500] if response else ""
-        }
-    except Exception as e:
-        return {
-            "permissions": [],
-            "error": f"AI Error: {str(e)}"
-        }
+def hidden_clause_inputs(clean_text: str):
+    """What detect_hidden_clauses_async reads: the candidate passages, else the document window."""
+    candidates = clause_detector.find_candidates(clean_text)
+    if not candidates:
+        return clean_text[:prompts.DOCUMENT_WINDOW]
+    return [(category, p["text"]) for category, passages in candidates.items() for p in passages]
 
 
-async def detect_hidden_clauses_async(clean_text: str) -> dict:
+async def _detect_hidden_clauses_full_text(clean_text: str) -> dict:
     """
-    Asynchronously focuses on finding hidden, misleading, or dangerous clauses.
+    Full-text fallback used when the keyword scan finds no candidate passages.
     """
-    context = clean_text[:15000]
-
-    prompt = f"""You are a consumer rights attorney specializing in digital privacy. 
-Analyze this privacy policy and find ALL hidden, misleading, or dangerous clauses that an average user would miss.
-
-Focus on:
-1. Perpetual content ownership / license grants
-2. Data selling to third parties (even if disguised)
-3. Arbitration clauses that waive class-action rights
-4. Auto-renewal / cancellation traps
-5. Right to change terms without notice
-6. Data retention after account deletion
-7. Cross-device tracking
-8. Sharing data with government/law enforcement without warrant
-9. Using data for AI/ML training
-10. Broad indemnification clauses
-
-You MUST return ONLY valid JSON, no markdown, no explanation, no code fences. Just raw JSON.
-
-Return this exact structure:
-{{
-    "hidden_clauses": [
-        {{
-            "title": "<short title>",
-            "original_text": "<quote or close paraphrase from policy>",
-            "plain_english": "<what this actually means for the user>",
-            "severity": "<low|medium|high|critical>",
-            "category": "<one of the 10 categories above>",
-            "action_recommended": "<what the user should do>"
-        }}
-    ],
-    "transparency_score": <1-10, where 10 is fully transparent>,
-    "overall_assessment": "<one paragraph summary of how trustworthy this policy is>"
-}}
-
-Privacy Policy Text:
-{context}
-"""
+    prompt = prompts.render_with_document("hidden_clauses_full", clean_text)
 
-    response = None
     try:
-        response = await llm.ainvoke(prompt)
-        content = response.content.strip()
-        content = _extract_json(content)
-        result = json.loads(content)
-        return result
-    except json.JSONDecodeError:
+        return await ainvoke_json(prompt, task="hidden_clauses_full")
+    except json.JSONDecodeError as e:
         return {
             "hidden_clauses": [],
             "error": "Failed to parse AI response",
-            "raw_response": response.content[:500] if response else ""
+            "raw_response": e.doc[:500]
         }
     except Exception as e:
         return {
@@ -449,12 +237,15 @@ Privacy Policy Text:
         }
 
 
+# ──────────────────────────────────────────────
+#  FULL DETAILED ANALYSIS
+# ──────────────────────────────────────────────
+
+@metrics.timed("side_tasks")
 async def full_analysis_async(clean_text: str) -> dict:
     """
     Runs all analysis pipelines concurrently in parallel and returns a combined result.
     """
-    import asyncio
-    
     # Execute all three tasks simultaneously in parallel
     risks_task = analyze_risks_async(clean_text)
     permissions_task = map_permissions_async(clean_text)
@@ -472,3 +263,30 @@ async def full_analysis_async(clean_text: str) -> dict:
         "hidden_clauses_analysis": hidden
     }
 
+
+# ──────────────────────────────────────────────
+#  SYNC WRAPPERS
+# ──────────────────────────────────────────────
+
+# Kept for scripts and older callers. They run the async implementations above on
+# llm_config's shared background loop, so both paths send identical prompts.
+
+def analyze_risks(clean_text: str) -> dict:
+    """Sync wrapper for analyze_risks_async."""
+    return run_sync(analyze_risks_async(clean_text))
+
+
+def map_permissions(clean_text: str) -> dict:
+    """Sync wrapper for map_permissions_async."""
+    return run_sync(map_permissions_async(clean_text))
+
+
+def detect_hidden_clauses(clean_text: str) -> dict:
+    """Sync wrapper for detect_hidden_clauses_async."""
+    return run_sync(detect_hidden_clauses_async(clean_text))
+
+
+def full_analysis(clean_text: str) -> dict:
+    """Sync wrapper for full_analysis_async."""
+    return run_sync(full_analysis_async(clean_text))
+
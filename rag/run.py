@@ -25,10 +25,13 @@ if __name__ == "__main__":
     print("   GET  /           - Health check")
     print("   POST /analyze    - Analyze policy (original)")
     print("   POST /chat       - Chat with policy (original)")
+    print("   POST /chat/stream - Chat with policy, streamed as SSE (new)")
+    print("   POST /chat/batch  - Several questions on one policy (new)")
     print("   POST /risks      - Risk analysis (new)")
     print("   POST /permissions - Permission mapping (new)")
     print("   POST /hidden-clauses - Hidden clause detection (new)")
     print("   POST /full-analysis  - Complete analysis (new)")
+    print("   POST /batch/full-analysis - Bulk analysis, NDJSON results (new)")
     default_port = 7860 if "SPACE_ID" in os.environ else 8000
     port = int(os.environ.get("PORT", default_port))
     uvicorn.run(app, host="0.0.0.0", port=port)
@@ -0,0 +1,163 @@
+"""
+PrivaShield AI - Deterministic Trust Scoring
+Local implementation of the Risk Analyzer's weighted rubric. Given the Extractor's
+structured facts the score is plain arithmetic, so it is computed here instead of
+by the LLM: same input, same score, no round-trip.
+"""
+
+import re
+
+START_SCORE = 100
+
+# Rubric weights — keep in sync with the scoring model text in prompts.RISK_ANALYZER.
+DEDUCTIONS = {
+    "data_sale": -25,
+    "retention_indefinite": -15,
+    "retention_unspecified": -8,
+    "arbitration_class_waiver": -15,
+    "arbitration_only": -8,
+    "no_deletion": -15,
+    "deletion_unclear": -7,
+    "tracking_opt_out": -10,
+    "passive_policy_changes": -8,
+    "broad_content_license": -10,
+    "children_not_addressed": -5,
+    "contradiction": -5,
+}
+MAX_CONTRADICTION_DEDUCTION = -15
+
+GRADE_BANDS = [(90, "A"), (75, "B"), (60, "C"), (40, "D")]
+
+_SALE_RE = re.compile(r"\b(sell|sells|sold|selling|sale|rent|rents|rented|renting)\b", re.IGNORECASE)
+_NEGATION_RE = re.compile(r"\b(not|never|no|don't|doesn't|won't|neither|nor)\b[^.]{0,40}$", re.IGNORECASE)
+# "sale of our business/assets" in a merger clause is not a sale of user data.
+_CORPORATE_SALE_RE = re.compile(
+    r"^\W*(of\s+)?(all\s+or\s+(a\s+)?(portion|part)\s+of\s+)?(our|the|its|a)\s+(business|company|assets|stock|shares)",
+    re.IGNORECASE,
+)
+_CORPORATE_CONTEXT_RE = re.compile(r"(merger|acquisition|bankruptcy|reorgani[sz]ation)[^.]{0,40}$", re.IGNORECASE)
+_INDEFINITE_RE = re.compile(
+    r"indefinite|unlimited|perpetual|forever|permanent|no (fixed|set|specific) (period|time)"
+    r"|as long as (is |we deem |reasonably )?(necessary|needed|required)",
+    re.IGNORECASE,
+)
+_BROAD_LICENSE_RE = re.compile(
+    r"perpetual|irrevocable|worldwide|royalty[- ]free|sublicens|transferable|unlimited|any purpose",
+    re.IGNORECASE,
+)
+
+
+def grade_for(score: int) -> str:
+    for floor, grade in GRADE_BANDS:
+        if score >= floor:
+            return grade
+    return "F"
+
+
+def _is_true(value) -> bool:
+    return value is True or (isinstance(value, str) and value.strip().lower() == "true")
+
+
+# Each deduction records what it rests on:
+#   "quote"     - a verbatim source quote from the Extractor          -> High
+#   "absence"   - a rubric rule for a fact the policy does not state  -> Medium
+#                 (deterministic; wrong only if the Extractor missed the clause)
+#   "inference" - a fact asserted by the Extractor without a quote    -> Low
+BASIS_CONFIDENCE = {"quote": "High", "absence": "Medium", "inference": "Low"}
+
+
+def _mentions_sale(text: str) -> bool:
+    """True if the text affirmatively says data is sold/rented (not "we do not sell")."""
+    for match in _SALE_RE.finditer(text or ""):
+        before, after = text[:match.start()], text[match.end():]
+        if _NEGATION_RE.search(before) or _CORPORATE_CONTEXT_RE.search(before) or _CORPORATE_SALE_RE.search(after):
+            continue
+        return True
+    return False
+
+
+def score_extraction(extractor_json: dict) -> dict:
+    """
+    Applies the weighted rubric to the Extractor output and returns a trust_score
+    block in the same shape the Risk Analyzer prompt asks the LLM for.
+    """
+    facts = extractor_json.get("extracted_facts") or {}
+    breakdown = []
+
+    def deduct(factor: str, key: str, source_quote=None, absence: bool = False):
+        basis = "quote" if source_quote else "absence" if absence else "inference"
+        breakdown.append({
+            "factor": factor,
+            "deduction": DEDUCTIONS[key],
+            "confidence": BASIS_CONFIDENCE[basis],
+            "basis": basis,
+        })
+
+    # Data sale / rental
+    for share in facts.get("third_party_sharing") or []:
+        if not isinstance(share, dict):
+            continue
+        text = " ".join(str(share.get(k) or "") for k in ("party_type", "purpose", "source_quote"))
+        if _mentions_sale(text):
+            deduct("Data sold/rented to third parties", "data_sale", share.get("source_quote"))
+            break
+
+    # Retention
+    retention = facts.get("retention_period") or {}
+    stated = retention.get("stated")
+    if not stated:
+        deduct("Retention period not specified", "retention_unspecified", absence=True)
+    elif _INDEFINITE_RE.search(str(stated)) or _INDEFINITE_RE.search(str(retention.get("source_quote") or "")):
+        deduct("Indefinite/unbounded retention", "retention_indefinite", retention.get("source_quote"))
+
+    # Arbitration
+    arbitration = facts.get("arbitration_clause") or {}
+    if _is_true(arbitration.get("exists")):
+        if _is_true(arbitration.get("waives_class_action")):
+            deduct("Forced arbitration + class action waiver", "arbitration_class_waiver", arbitration.get("source_quote"))
+        else:
+            deduct("Forced arbitration (no class waiver confirmed)", "arbitration_only", arbitration.get("source_quote"))
+
+    # Deletion
+    deletion = facts.get("deletion_mechanism") or {}
+    exists = deletion.get("exists")
+    if exists is False or (isinstance(exists, str) and exists.strip().lower() == "false"):
+        deduct("No deletion mechanism", "no_deletion", deletion.get("source_quote"))
+    elif not _is_true(exists):
+        deduct("Deletion mechanism unclear", "deletion_unclear", deletion.get("source_quote"), absence=True)
+
+    # Tracking cookies
+    tracking = facts.get("tracking_cookies") or {}
+    if str(tracking.get("default_state") or "").lower() == "opt-out":
+        deduct("Tracking enabled by default (opt-out)", "tracking_opt_out", tracking.get("source_quote"))
+
+    # Policy change notice
+    notice = facts.get("policy_change_notice") or {}
+    if str(notice.get("method") or "").lower() == "passive-posting":
+        deduct("Policy changes via passive posting only", "passive_policy_changes", notice.get("source_quote"))
+
+    # Content license
+    license_grant = facts.get("content_license_grant") or {}
+    if _is_true(license_grant.get("exists")):
+        scope = " ".join(str(license_grant.get(k) or "") for k in ("scope", "source_quote"))
+        if _BROAD_LICENSE_RE.search(scope):
+            deduct("Broad/perpetual content license grant", "broad_content_license", license_grant.get("source_quote"))
+
+    # Children's data
+    children = facts.get("childrens_data") or {}
+    if not _is_true(children.get("addressed")):
+        deduct("Children's data not addressed", "children_not_addressed", absence=True)
+
+    # Contradictions (-5 each, capped)
+    contradictions = extractor_json.get("contradictions_found") or []
+    if contradictions:
+        total = max(DEDUCTIONS["contradiction"] * len(contradictions), MAX_CONTRADICTION_DEDUCTION)
+        breakdown.append({
+            "factor": f"Contradictions between sections ({len(contradictions)})",
+            "deduction": total,
+            "confidence": "High",
+            "basis": "quote",
+        })
+
+    score = max(0, START_SCORE + sum(item["deduction"] for item in breakdown))
+    return {"score": score, "grade": grade_for(score), "score_breakdown": breakdown}
@@ -0,0 +1,107 @@
+"""
+PrivaShield AI - Semantic Answer Cache for /chat
+The LLM cache only hits on byte-identical prompts. This cache reuses a stored
+ChatResponse for a *paraphrased* question about the same policy: per url_hash it
+keeps a small matrix of question embeddings, and a new question hits when its
+cosine similarity to a stored one is above SEMANTIC_CACHE_THRESHOLD AND both
+retrieved the same top chunks (so the answer is grounded in the same text).
+
+Entries are tied to the policy's content hash: when the stored policy text
+changes, that policy's entries are dropped. They also expire after
+SEMANTIC_CACHE_TTL seconds. Without an embedding model, only the same question
+(normalised) hits.
+"""
+
+import os
+import re
+import time
+from collections import OrderedDict
+from typing import Optional
+
+import numpy as np
+
+import metrics
+
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.85"))
+SEMANTIC_CACHE_TTL = int(os.getenv("SEMANTIC_CACHE_TTL", str(7 * 24 * 3600)))
+MAX_ENTRIES_PER_POLICY = int(os.getenv("SEMANTIC_CACHE_MAX_PER_POLICY", "64"))
+MAX_POLICIES = int(os.getenv("SEMANTIC_CACHE_MAX_POLICIES", "512"))
+TOP_CHUNKS_TO_MATCH = 3   # the leading chunks two questions must share
+
+# url_hash -> {"content_hash", "entries": [...], "matrix": stacked embeddings or None}; LRU-ordered
+_policies: "OrderedDict[str, dict]" = OrderedDict()
+
+
+def _question_key(question: str) -> str:
+    return re.sub(r"\W+", " ", question.lower()).strip()
+
+
+def _chunk_signature(retrieved: list[dict]) -> frozenset:
+    return frozenset(chunk.get("chunk_id") for chunk in retrieved[:TOP_CHUNKS_TO_MATCH])
+
+
+def _bucket(url_hash: str, content_hash: str) -> dict:
+    bucket = _policies.get(url_hash)
+    if bucket is None or bucket["content_hash"] != content_hash:
+        bucket = {"content_hash": content_hash, "entries": [], "matrix": None}
+        _policies[url_hash] = bucket
+        if len(_policies) > MAX_POLICIES:
+            _policies.popitem(last=False)
+    _policies.move_to_end(url_hash)
+    return bucket
+
+
+def _matrix(bucket: dict) -> tuple:
+    """(question embedding matrix, entry index per row), rebuilt only after the bucket changed."""
+    if bucket["matrix"] is None:
+        rows = [i for i, entry in enumerate(bucket["entries"]) if entry["embedding"] is not None]
+        matrix = np.vstack([bucket["entries"][i]["embedding"] for i in rows]) if rows else None
+        bucket["matrix"] = (matrix, rows)
+    return bucket["matrix"]
+
+
+def _drop_expired(bucket: dict) -> None:
+    cutoff = time.time() - SEMANTIC_CACHE_TTL
+    fresh = [entry for entry in bucket["entries"] if entry["created"] >= cutoff]
+    if len(fresh) != len(bucket["entries"]):
+        bucket["entries"] = fresh
+        bucket["matrix"] = None
+
+
+def lookup(url_hash: str, content_hash: str, question: str, query_emb: Optional[np.ndarray],
+           retrieved: list[dict]) -> Optional[dict]:
+    """Returns a stored ChatResponse dict for an equivalent question, or None."""
+    bucket = _bucket(url_hash, content_hash)
+    _drop_expired(bucket)
+    key = _question_key(question)
+
+    hit = next((entry for entry in bucket["entries"] if entry["question_key"] == key), None)
+    if hit is None and query_emb is not None:
+        matrix, rows = _matrix(bucket)
+        if matrix is not None:
+            signature = _chunk_signature(retrieved)
+            similarity = matrix @ query_emb
+            for r in np.argsort(similarity)[::-1]:
+                if similarity[r] < SEMANTIC_CACHE_THRESHOLD:
+                    break
+                if bucket["entries"][rows[r]]["signature"] == signature:
+                    hit = bucket["entries"][rows[r]]
+                    break
+
+    metrics.inc("chat_semantic_cache_lookups_total", result="hit" if hit else "miss")
+    return dict(hit["response"]) if hit else None
+
+
+def store(url_hash: str, content_hash: str, question: str, query_emb: Optional[np.ndarray],
+          retrieved: list[dict], response: dict) -> None:
+    bucket = _bucket(url_hash, content_hash)
+    bucket["entries"].append({
+        "question_key": _question_key(question),
+        "signature": _chunk_signature(retrieved),
+        "embedding": query_emb,
+        "response": dict(response),
+        "created": time.time(),
+    })
+    if len(bucket["entries"]) > MAX_ENTRIES_PER_POLICY:
+        bucket["entries"].pop(0)
+    bucket["matrix"] = None
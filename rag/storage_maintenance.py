@@ -0,0 +1,341 @@
+"""
+PrivaShield AI - Storage Maintenance
+Keeps storage/ (the rag_data volume in docker-compose) bounded. A background
+task sweeps every STORAGE_SWEEP_INTERVAL seconds (0 = off), in a worker thread:
+
+- moves flat cache files written before sharding into their hash-prefix shard
+  and removes temp files left behind by interrupted writes;
+- evicts least-recently-used entries once a cache exceeds its byte or entry
+  budget, down to STORAGE_EVICT_TARGET of it. Analysis cache entries (analysis
+  + FAQ file of one url_hash) go by access time, which analysis_cache.load
+  refreshes on every hit; fetch cache files by access or write time. The
+  processed_sites rows stay, so /chat keeps working for evicted policies;
+- trims the oldest LLM cache rows beyond LLM_CACHE_MAX_BYTES (FIFO by
+  insertion, not LRU: SQLiteCache records no access time);
+- once a day at STORAGE_VACUUM_HOUR (server local time), checkpoints the WAL
+  and VACUUMs the SQLite files (llm_cache.db, and privashield.db when
+  DATABASE_URL is not set) if the disk has room for the copy VACUUM writes.
+  The LLM cache is bypassed while its file is vacuumed (llm_config.pause_llm_cache).
+
+usage_report() (GET /admin/storage) lists sizes per area and the last sweep;
+POST /admin/storage/sweep runs one on demand.
+"""
+
+import os
+import time
+import shutil
+import sqlite3
+import asyncio
+import threading
+from contextlib import closing, nullcontext
+from typing import Optional
+
+import analysis_cache
+import database
+import fetcher
+import llm_config
+import metrics
+import profiling
+
+STORAGE_DIR = "storage"
+STORAGE_SWEEP_INTERVAL = float(os.getenv("STORAGE_SWEEP_INTERVAL", "600"))
+ANALYSIS_CACHE_MAX_BYTES = int(os.getenv("ANALYSIS_CACHE_MAX_BYTES", str(2 * 1024 ** 3)))
+ANALYSIS_CACHE_MAX_ENTRIES = int(os.getenv("ANALYSIS_CACHE_MAX_ENTRIES", "100000"))
+FETCH_CACHE_MAX_BYTES = int(os.getenv("FETCH_CACHE_MAX_BYTES", str(512 * 1024 ** 2)))
+FETCH_CACHE_MAX_ENTRIES = int(os.getenv("FETCH_CACHE_MAX_ENTRIES", "50000"))
+LLM_CACHE_MAX_BYTES = int(os.getenv("LLM_CACHE_MAX_BYTES", str(1024 ** 3)))
+STORAGE_EVICT_TARGET = float(os.getenv("STORAGE_EVICT_TARGET", "0.9"))
+STORAGE_VACUUM_HOUR = int(os.getenv("STORAGE_VACUUM_HOUR", "4"))   # -1 = never
+
+_FIRST_SWEEP_DELAY = 60        # seconds after startup
+_TMP_MAX_AGE = 3600            # seconds; older *.tmp files are from interrupted writes
+_LLM_TRIM_BATCH = 500          # rows deleted per statement
+_SQLITE_TIMEOUT = 30           # seconds to wait for a lock held by the app
+
+_lock = threading.Lock()       # one sweep at a time (the daemon, or a manual run)
+_last_sweep: dict = {}
+_last_vacuum_day: Optional[str] = None
+
+
+# ── Cache files ──────────────────────────────────────────────────────────────
+
+def _remove_stale_tmp(path: str, stat: os.stat_result, now: float) -> bool:
+    if not path.endswith(".tmp") or now - stat.st_mtime < _TMP_MAX_AGE:
+        return False
+    try:
+        os.remove(path)
+        return True
+    except OSError:
+        return False
+
+
+def _migrate_into_shard(path: str, sharded: str) -> None:
+    """Moves a flat file into its shard; a sharded copy already there is newer (saves only write shards)."""
+    try:
+        if os.path.exists(sharded):
+            os.remove(path)
+        else:
+            os.makedirs(os.path.dirname(sharded), exist_ok=True)
+            os.replace(path, sharded)
+    except OSError as e:
+        print(f"[Storage] Could not move {path} into its shard: {e}")
+
+
+def _evict(groups: dict, max_bytes: int, max_entries: int, remove) -> tuple:
+    """
+    groups: key -> [last access, bytes]. Removes least recently used keys via
+    remove(key) until both budgets are met with STORAGE_EVICT_TARGET headroom.
+    Returns (entries evicted, bytes freed).
+    """
+    total = sum(size for _, size in groups.values())
+    if total <= max_bytes and len(groups) <= max_entries:
+        return 0, 0
+    byte_goal, entry_goal = max_bytes * STORAGE_EVICT_TARGET, max_entries * STORAGE_EVICT_TARGET
+    remaining, evicted, freed = len(groups), 0, 0
+    for key, (_, size) in sorted(groups.items(), key=lambda item: item[1][0]):
+        if total - freed <= byte_goal and remaining <= entry_goal:
+            break
+        remove(key)
+        freed += size
+        remaining -= 1
+        evicted += 1
+    return evicted, freed
+
+
+def _sweep_analysis_cache(now: float) -> dict:
+    groups = {}   # url_hash -> [last access, bytes]
+    legacy = tmp_removed = 0
+    for key, suffix, path, stat in list(analysis_cache.entries()):
+        if path == analysis_cache.legacy_path(key, suffix):
+            legacy += 1
+            _migrate_into_shard(path, analysis_cache.cache_path(key, suffix))
+        group = groups.setdefault(key, [0.0, 0])
+        group[0] = max(group[0], stat.st_atime, stat.st_mtime)
+        group[1] += stat.st_size
+
+    for directory, _, names in os.walk(analysis_cache.CACHE_DIR):
+        for name in names:
+            path = os.path.join(directory, name)
+            try:
+                tmp_removed += _remove_stale_tmp(path, os.stat(path), now)
+            except OSError:
+                continue
+
+    evicted, freed = _evict(groups, ANALYSIS_CACHE_MAX_BYTES, ANALYSIS_CACHE_MAX_ENTRIES, analysis_cache.remove)
+    return {"entries": len(groups) - evicted, "migrated": legacy, "tmp_removed": tmp_removed,
+            "evicted": evicted, "freed_bytes": freed}
+
+
+def _sweep_fetch_cache(now: float) -> dict:
+    files = {}    # path -> [last access, bytes]
+    migrated = tmp_removed = 0
+    for directory, _, names in os.walk(fetcher.FETCH_CACHE_DIR):
+        for name in names:
+            path = os.path.join(directory, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            if _remove_stale_tmp(path, stat, now):
+                tmp_removed += 1
+                continue
+            if not name.endswith(".json"):
+                continue
+            if directory == fetcher.FETCH_CACHE_DIR:
+                sharded = os.path.join(directory, name[:2], name)
+                _migrate_into_shard(path, sharded)
+                migrated += 1
+                path = sharded
+            files[path] = [max(stat.st_atime, stat.st_mtime), stat.st_size]
+
+    def remove(path: str) -> None:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    evicted, freed = _evict(files, FETCH_CACHE_MAX_BYTES, FETCH_CACHE_MAX_ENTRIES, remove)
+    return {"entries": len(files) - evicted, "migrated": migrated, "tmp_removed": tmp_removed,
+            "evicted": evicted, "freed_bytes": freed}
+
+
+# ── SQLite files ─────────────────────────────────────────────────────────────
+
+def _sqlite_files() -> list:
+    paths = [llm_config._CACHE_PATH]
+    if database.engine.url.get_backend_name() == "sqlite" and database.engine.url.database:
+        paths.append(database.engine.url.database)
+    return [p for p in paths if os.path.exists(p)]
+
+
+def _trim_llm_cache() -> int:
+    """
+    Deletes the oldest LLM cache rows (by rowid, i.e. insertion order) while the
+    live data exceeds LLM_CACHE_MAX_BYTES. This is FIFO, not LRU: a reply that is
+    still hit often goes as soon as it is among the oldest, and is re-cached on
+    its next call. The file shrinks at the next VACUUM.
+    """
+    path = llm_config._CACHE_PATH
+    if LLM_CACHE_MAX_BYTES <= 0 or not os.path.exists(path) or os.path.getsize(path) <= LLM_CACHE_MAX_BYTES:
+        return 0
+    deleted = 0
+    with closing(sqlite3.connect(path, timeout=_SQLITE_TIMEOUT)) as conn:
+        tables = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+        if "full_llm_cache" not in tables:
+            return 0
+        while True:
+            page_size, pages, free = (conn.execute(f"PRAGMA {p}").fetchone()[0]
+                                      for p in ("page_size", "page_count", "freelist_count"))
+            if (pages - free) * page_size <= LLM_CACHE_MAX_BYTES * STORAGE_EVICT_TARGET:
+                break
+            cursor = conn.execute("DELETE FROM full_llm_cache WHERE rowid IN "
+                                  "(SELECT rowid FROM full_llm_cache ORDER BY rowid LIMIT ?)", (_LLM_TRIM_BATCH,))
+            conn.commit()
+            if cursor.rowcount <= 0:
+                break
+            deleted += cursor.rowcount
+    return deleted
+
+
+def _compact_sqlite() -> dict:
+    """WAL checkpoint + VACUUM for each SQLite file, skipped when the disk cannot hold a copy."""
+    results = {}
+    for path in _sqlite_files():
+        size = os.path.getsize(path)
+        started = time.perf_counter()
+        paused = llm_config.pause_llm_cache() if path == llm_config._CACHE_PATH else nullcontext()
+        try:
+            with paused, closing(sqlite3.connect(path, timeout=_SQLITE_TIMEOUT)) as conn:
+                conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+                if shutil.disk_usage(os.path.dirname(os.path.abspath(path))).free > 2 * size:
+                    conn.execute("VACUUM")
+                    outcome = "vacuumed"
+                else:
+                    outcome = "checkpointed (no room to vacuum)"
+        except sqlite3.Error as e:
+            outcome = f"failed: {e}"
+        results[os.path.basename(path)] = {
+            "outcome": outcome,
+            "bytes_before": size,
+            "bytes_after": os.path.getsize(path),
+            "seconds": round(time.perf_counter() - started, 2),
+        }
+    return results
+
+
+def _vacuum_due(now: float) -> bool:
+    if STORAGE_VACUUM_HOUR < 0:
+        return False
+    local = time.localtime(now)
+    return local.tm_hour == STORAGE_VACUUM_HOUR and time.strftime("%Y-%m-%d", local) != _last_vacuum_day
+
+
+# ── Sweep & report ───────────────────────────────────────────────────────────
+
+def sweep(force_vacuum: bool = False) -> dict:
+    """One maintenance pass (blocking; the daemon runs it in a worker thread)."""
+    global _last_vacuum_day
+    with _lock:
+        now = time.time()
+        started = time.perf_counter()
+        result = {"at": int(now)}
+        for area, step in (("analysis_cache", _sweep_analysis_cache), ("fetch_cache", _sweep_fetch_cache)):
+            result[area] = step(now)
+            metrics.inc("storage_evictions_total", result[area]["evicted"], area=area)
+        try:
+            result["llm_cache_rows_trimmed"] = _trim_llm_cache()
+        except sqlite3.Error as e:
+            print(f"[Storage] Could not trim the LLM cache: {e}")
+        if force_vacuum or _vacuum_due(now):
+            result["sqlite"] = _compact_sqlite()
+            _last_vacuum_day = time.strftime("%Y-%m-%d", time.localtime(now))
+        result["seconds"] = round(time.perf_counter() - started, 2)
+
+    metrics.inc("storage_sweeps_total")
+    _last_sweep.clear()
+    _last_sweep.update(result)
+    evicted = result["analysis_cache"]["evicted"] + result["fetch_cache"]["evicted"]
+    if evicted or result.get("sqlite"):
+        print(f"[Storage] Sweep: {evicted} cache entries evicted, "
+              f"sqlite {'compacted' if result.get('sqlite') else 'untouched'} ({result['seconds']}s)")
+    return result
+
+
+def _dir_usage(path: str) -> dict:
+    files, size = 0, 0
+    for directory, _, names in os.walk(path):
+        for name in names:
+            try:
+                size += os.stat(os.path.join(directory, name)).st_size
+                files += 1
+            except OSError:
+                continue
+    return {"files": files, "bytes": size}
+
+
+def usage_report() -> dict:
+    """Bytes and files per storage area, SQLite file sizes, budgets, free disk and the last sweep."""
+    areas = {
+        "analysis_cache": {**_dir_usage(analysis_cache.CACHE_DIR),
+                           "max_bytes": ANALYSIS_CACHE_MAX_BYTES, "max_entries": ANALYSIS_CACHE_MAX_ENTRIES},
+        "fetch_cache": {**_dir_usage(fetcher.FETCH_CACHE_DIR),
+                        "max_bytes": FETCH_CACHE_MAX_BYTES, "max_entries": FETCH_CACHE_MAX_ENTRIES},
+        "profiles": _dir_usage(profiling.PROFILE_DIR),
+    }
+    sqlite_files = {}
+    for path in _sqlite_files():
+        wal = f"{path}-wal"
+        sqlite_files[os.path.basename(path)] = {
+            "bytes": os.path.getsize(path),
+            "wal_bytes": os.path.getsize(wal) if os.path.exists(wal) else 0,
+        }
+    total = _dir_usage(STORAGE_DIR)["bytes"]
+    disk = shutil.disk_usage(STORAGE_DIR) if os.path.isdir(STORAGE_DIR) else None
+    return {
+        "total_bytes": total,
+        "disk_free_bytes": disk.free if disk else None,
+        "areas": areas,
+        "sqlite": sqlite_files,
+        "llm_cache_max_bytes": LLM_CACHE_MAX_BYTES,
+        "last_sweep": dict(_last_sweep) or None,
+    }
+
+
+# ── Daemon ───────────────────────────────────────────────────────────────────
+
+class MaintenanceDaemon:
+    """Runs sweep() in a worker thread every `interval` seconds on the app's event loop."""
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self._task = None
+
+    def start(self) -> None:
+        self._task = asyncio.get_running_loop().create_task(self._run())
+        print(f"[Storage] Maintenance active (every {self.interval:.0f}s)")
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+
+    async def _run(self) -> None:
+        await asyncio.sleep(min(_FIRST_SWEEP_DELAY, self.interval))
+        while True:
+            try:
+                await asyncio.to_thread(sweep)
+            except Exception as e:
+                print(f"[Storage] Maintenance sweep failed: {e}")
+            await asyncio.sleep(self.interval)
+
+
+def start_maintenance() -> Optional[MaintenanceDaemon]:
+    """Starts the daemon on the running loop if STORAGE_SWEEP_INTERVAL > 0; returns it (or None)."""
+    if STORAGE_SWEEP_INTERVAL <= 0:
+        return None
+    daemon = MaintenanceDaemon(STORAGE_SWEEP_INTERVAL)
+    daemon.start()
+    return daemon
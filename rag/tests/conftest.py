@@ -0,0 +1,16 @@
+import os
+import sys
+import tempfile
+
+# The rag/ modules import each other as top-level modules (see test_auth.py).
+RAG_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if RAG_DIR not in sys.path:
+    sys.path.insert(0, RAG_DIR)
+
+# Like benchmarks/bench.py: modules that open storage/ or the database at import
+# time get a throwaway working directory, and nothing reaches the network.
+_WORKDIR = tempfile.mkdtemp(prefix="privashield-tests-")
+os.chdir(_WORKDIR)
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{os.path.join(_WORKDIR, 'test.db')}")
+os.environ.setdefault("GROQ_API_KEY", "test-key")
+os.environ.setdefault("HF_HUB_OFFLINE", "1")
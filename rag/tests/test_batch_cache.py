@@ -0,0 +1,51 @@
+"""Batch analysis re-checks a cached policy for changes, like /full-analysis does."""
+
+import asyncio
+
+import pytest
+
+enhanced_routes = pytest.importorskip("enhanced_routes")   # needs the full requirements
+
+URL = "https://x.example/privacy"
+CACHED = {"transparency_score": 7, "source_hash": "old"}
+
+
+def _patch(monkeypatch, changed_text):
+    saved, scheduled = [], []
+
+    async def detect_policy_change(cached_payload, html, previous_text):
+        return changed_text
+
+    async def reanalyze_changed_policy(previous_text, clean_text, prior_payload):
+        return {"transparency_score": 3}
+
+    monkeypatch.setattr(enhanced_routes.analysis_cache, "load", lambda url_hash: dict(CACHED))
+    monkeypatch.setattr(enhanced_routes.analysis_cache, "save", lambda url_hash, payload: saved.append(payload))
+    monkeypatch.setattr(enhanced_routes, "_previous_policy_text", lambda url: "old policy text")
+    monkeypatch.setattr(enhanced_routes, "_save_batch_scan", lambda *args: None)
+    monkeypatch.setattr(enhanced_routes.faq, "schedule", lambda *args: None)
+    monkeypatch.setattr(enhanced_routes.revalidation, "schedule", lambda *args: scheduled.append(args) or False)
+    monkeypatch.setattr(enhanced_routes.analysis_service, "detect_policy_change", detect_policy_change)
+    monkeypatch.setattr(enhanced_routes.analysis_service, "reanalyze_changed_policy", reanalyze_changed_policy)
+    return saved, scheduled
+
+
+def test_changed_policy_is_reanalysed(monkeypatch):
+    saved, scheduled = _patch(monkeypatch, "new policy text " * 20)
+    item = enhanced_routes.PolicyRequest(url=URL, html="<p>new</p>")
+
+    status, payload = asyncio.run(enhanced_routes._analyze_batch_item(item))
+
+    assert (status, payload["transparency_score"]) == ("updated", 3)
+    assert saved and saved[0]["transparency_score"] == 3
+    assert not scheduled
+
+
+def test_unchanged_policy_is_served_from_cache(monkeypatch):
+    saved, scheduled = _patch(monkeypatch, None)
+    item = enhanced_routes.PolicyRequest(url=URL, html="<p>same</p>")
+
+    status, payload = asyncio.run(enhanced_routes._analyze_batch_item(item))
+
+    assert (status, payload) == ("cached", CACHED)
+    assert not saved and len(scheduled) == 1
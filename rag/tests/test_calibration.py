@@ -0,0 +1,40 @@
+"""Local decision thresholds against the labelled sets in tests/data/."""
+
+import pytest
+
+from benchmarks import calibrate
+
+
+def test_fit_accept_reject_brackets_the_overlap():
+    scored = [(0.71, True), (0.48, True), (0.62, True), (0.30, False), (0.52, False)]
+    assert calibrate.fit_accept_reject(scored) == (0.55, 0.45)
+
+
+def test_fit_accept_reject_without_overlap():
+    assert calibrate.fit_accept_reject([(0.8, True), (0.2, False)]) == (0.25, 0.25)
+
+
+def test_permission_thresholds_separate_labelled_pairs():
+    permission_matcher = pytest.importorskip("permission_matcher")   # needs the full requirements
+    if permission_matcher.ai_engine.embedding_model is None:
+        pytest.skip("embedding model not available")
+    scored = calibrate.score_permission_pairs()
+
+    false_accepts = [s for s, requested in scored if not requested and permission_matcher.classify(s) == "requested"]
+    false_rejects = [s for s, requested in scored if requested and permission_matcher.classify(s) == "not_requested"]
+    assert not false_accepts and not false_rejects
+
+
+def test_fit_silence_keeps_every_answerable_question():
+    scored = [(0.83, True), (0.17, True), (0.0, False), (0.33, False)]
+    assert calibrate.fit_silence(scored) == 0.15
+
+
+def test_silence_thresholds_match_labelled_questions():
+    ai_engine = pytest.importorskip("ai_engine")   # needs the full requirements
+    scored = calibrate.score_silence_questions()
+
+    assert calibrate.fit_silence(scored["token_overlap"]) == ai_engine.SILENT_THRESHOLDS["token_overlap"]
+    for scorer, results in scored.items():
+        threshold = ai_engine.SILENT_THRESHOLDS[scorer]
+        assert not [s for s, answerable in results if answerable and s < threshold], scorer
@@ -0,0 +1,56 @@
+"""/chat/batch: a malformed item in the batched LLM reply is re-asked, not a 500."""
+
+import asyncio
+import json
+from types import SimpleNamespace
+
+import pytest
+
+main = pytest.importorskip("main")   # needs the full requirements (FastAPI, LangChain, ...)
+
+POLICY = "We retain personal information for 24 months. You can delete your account in settings."
+
+
+def _patch(monkeypatch, batch_reply):
+    chunk = {"text": POLICY, "similarity_score": 0.9}
+    monkeypatch.setattr(main.database, "get_scan_by_url", lambda db, url: SimpleNamespace(policy_text=POLICY))
+    monkeypatch.setattr(main.ai_engine, "retrieve_for_questions",
+                        lambda questions, text: [([dict(chunk)], None, "token_overlap") for _ in questions])
+    monkeypatch.setattr(main.faq, "lookup", lambda *args: None)
+    monkeypatch.setattr(main.semantic_cache, "lookup", lambda *args: None)
+    monkeypatch.setattr(main.semantic_cache, "store", lambda *args: None)
+    reasked = []
+
+    async def chat_batch_async(questions, retrieved):
+        return batch_reply
+
+    async def chat_with_policy_async(question, policy_text, retrieved):
+        reasked.append(question)
+        return json.dumps({"answer": f"single: {question}", "confidence": "High", "cited_chunks": []})
+
+    monkeypatch.setattr(main.ai_engine, "chat_batch_async", chat_batch_async)
+    monkeypatch.setattr(main.ai_engine, "chat_with_policy_async", chat_with_policy_async)
+    return reasked
+
+
+def test_null_fields_take_defaults():
+    answer = main._chat_from_data({"answer": "Yes.", "confidence": None, "cited_chunks": None,
+                                   "document_silent_on_topic": None})
+    assert (answer.confidence, answer.cited_chunks, answer.document_silent_on_topic) == ("Low", [], False)
+
+
+def test_malformed_batch_item_is_reasked(monkeypatch):
+    reasked = _patch(monkeypatch, [
+        {"answer": "Kept for 24 months.", "confidence": None, "cited_chunks": None},
+        {"answer": None, "confidence": "High"},
+        {"answer": "You can.", "cited_chunks": "chunk 1"},
+    ])
+    request = main.ChatBatchRequest(url="https://x.example/privacy",
+                                    questions=["How long is data kept?", "Is data sold?", "Can I delete?"])
+
+    response = asyncio.run(main.chat_policy_batch(request, db=None))
+
+    assert [a.answer for a in response.answers] == [
+        "Kept for 24 months.", "single: Is data sold?", "single: Can I delete?",
+    ]
+    assert reasked == ["Is data sold?", "Can I delete?"]
@@ -0,0 +1,99 @@
+"""PolicyFetcher against a local stub server: 304 revalidation, size cap, redirects."""
+
+import asyncio
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import httpx
+import pytest
+
+from fetcher import FetchTooLarge, PolicyFetcher
+
+POLICY = "<html><body><h1>Privacy</h1><p>We keep data for 30 days.</p></body></html>"
+ETAG = '"v1"'
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        self.server.hits.append((self.path, self.headers.get("If-None-Match")))
+        if self.path == "/old-privacy":
+            self.send_response(301)
+            self.send_header("Location", "/privacy")
+            self.end_headers()
+        elif self.path == "/privacy":
+            if self.headers.get("If-None-Match") == ETAG:
+                self.send_response(304)
+                self.end_headers()
+                return
+            body = POLICY.encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "text/html; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.send_header("ETag", ETAG)
+            self.end_headers()
+            self.wfile.write(body)
+        elif self.path == "/huge":
+            # Chunked, so no Content-Length: the cap must trip while streaming.
+            self.send_response(200)
+            self.send_header("Content-Type", "text/html")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            chunk = b"x" * 4096
+            try:
+                for _ in range(64):
+                    self.wfile.write(b"%x\r\n%s\r\n" % (len(chunk), chunk))
+                self.wfile.write(b"0\r\n\r\n")
+            except (BrokenPipeError, ConnectionResetError):
+                pass
+        else:
+            self.send_error(404)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def stub_server():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubHandler)
+    server.hits = []
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server, f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+    server.server_close()
+
+
+async def _fetch_all(cache_dir, urls, max_bytes=1024 * 1024):
+    async with httpx.AsyncClient(follow_redirects=True) as client:
+        fetcher = PolicyFetcher(client=client, cache_dir=str(cache_dir), max_bytes=max_bytes)
+        return [await fetcher.fetch(url) for url in urls]
+
+
+def test_second_fetch_is_revalidated_with_304(stub_server, tmp_path):
+    server, base = stub_server
+
+    first, second = asyncio.run(_fetch_all(tmp_path, [f"{base}/privacy", f"{base}/privacy"]))
+
+    assert (first.cache_status, first.not_modified) == ("miss", False)
+    assert (second.cache_status, second.not_modified) == ("revalidated", True)
+    assert second.html == first.html == POLICY
+    assert server.hits == [("/privacy", None), ("/privacy", ETAG)]
+
+
+def test_oversized_body_is_aborted(stub_server, tmp_path):
+    _, base = stub_server
+
+    with pytest.raises(FetchTooLarge):
+        asyncio.run(_fetch_all(tmp_path, [f"{base}/huge"], max_bytes=16 * 1024))
+
+
+def test_redirect_is_followed(stub_server, tmp_path):
+    server, base = stub_server
+
+    first, second = asyncio.run(_fetch_all(tmp_path, [f"{base}/old-privacy", f"{base}/old-privacy"]))
+
+    assert first.url == f"{base}/privacy"
+    assert first.html == POLICY
+    # The cache is keyed by the requested URL but remembers where it landed.
+    assert (second.cache_status, second.url) == ("revalidated", f"{base}/privacy")
+    assert server.hits[-1] == ("/privacy", ETAG)
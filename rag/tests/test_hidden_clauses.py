@@ -0,0 +1,25 @@
+"""Keyword pre-scan results: no placeholder score, never stored in the analysis cache."""
+
+import pytest
+
+import clause_detector
+
+TEXT = ("Any dispute will be resolved by binding individual arbitration, and you waive your "
+        "right to participate in a class action. Subscriptions automatically renew until you cancel.")
+
+
+def test_preliminary_result_has_no_transparency_score():
+    result = clause_detector.preliminary_result(clause_detector.find_candidates(TEXT))
+    assert result["preliminary"] is True
+    assert result["hidden_clauses"]
+    assert "transparency_score" not in result
+
+
+def test_preliminary_payload_is_not_cacheable():
+    analysis_service = pytest.importorskip("analysis_service")   # needs the full requirements
+    preliminary = clause_detector.preliminary_result(clause_detector.find_candidates(TEXT))
+    payload = {"pipeline_data": {}, "permission_data": {}, "hidden_clauses_data": preliminary}
+
+    assert not analysis_service.cacheable(payload)
+    assert analysis_service.stale_reason(payload) == "preliminary"
+    assert analysis_service.cacheable({**payload, "hidden_clauses_data": {"hidden_clauses": []}})
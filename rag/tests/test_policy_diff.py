@@ -0,0 +1,67 @@
+"""Incremental re-analysis: facts from removed sections must not survive the merge."""
+
+import policy_diff
+import scoring
+
+OLD_TEXT = """Data Retention
+We retain personal information for 24 months after your last activity.
+Dispute Resolution
+Any dispute will be resolved by binding individual arbitration, and you waive your right to participate in a class action.
+Children's Privacy
+Our services are not directed to children under 13."""
+
+NEW_TEXT = """Data Retention
+We retain personal information for 24 months after your last activity.
+Children's Privacy
+Our services are not directed to children under 13."""
+
+PRIOR_FACTS = {
+    "retention_period": {
+        "stated": "24 months",
+        "source_quote": "We retain personal information for 24 months after your last activity.",
+        "multiple_mentions": False,
+    },
+    "arbitration_clause": {
+        "exists": True,
+        "waives_class_action": True,
+        "source_quote": "Any dispute will be resolved by binding individual arbitration, "
+                        "and you waive your right to participate in a class action.",
+    },
+    "childrens_data": {
+        "addressed": True,
+        "min_age_stated": 13,
+        "source_quote": "Our services are not directed to children under 13.",
+    },
+    "third_party_sharing": [],
+}
+
+
+def _factors(facts: dict) -> set:
+    return {item["factor"] for item in scoring.score_extraction({"extracted_facts": facts})["score_breakdown"]}
+
+
+def test_removed_section_is_a_removal_only_edit():
+    diff = policy_diff.diff_sections(OLD_TEXT, NEW_TEXT)
+    assert diff["changed_count"] == 0
+    assert diff["removed_count"] == 1
+
+
+def test_removed_section_drops_fact_and_deduction():
+    assert "Forced arbitration + class action waiver" in _factors(PRIOR_FACTS)
+
+    # run_incremental_pipeline passes an empty delta when nothing was added or edited.
+    merged = policy_diff.merge_facts(PRIOR_FACTS, {}, NEW_TEXT)
+
+    assert merged["arbitration_clause"] == {"exists": None, "waives_class_action": None, "source_quote": None}
+    assert merged["retention_period"] == PRIOR_FACTS["retention_period"]
+    assert merged["childrens_data"] == PRIOR_FACTS["childrens_data"]
+    assert not any("arbitration" in factor.lower() for factor in _factors(merged))
+
+
+def test_delta_replaces_fact_whose_quote_moved():
+    delta = {"arbitration_clause": {
+        "exists": True, "waives_class_action": False,
+        "source_quote": "Disputes go to binding arbitration.",
+    }}
+    merged = policy_diff.merge_facts(PRIOR_FACTS, delta, NEW_TEXT + "\nDisputes go to binding arbitration.")
+    assert merged["arbitration_clause"] == delta["arbitration_clause"]
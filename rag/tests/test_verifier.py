@@ -0,0 +1,38 @@
+"""Deterministic verification issues survive a failed LLM Verifier."""
+
+import asyncio
+
+import pytest
+
+pipeline = pytest.importorskip("pipeline")   # needs the full requirements
+import scoring  # noqa: E402
+
+TEXT = "We retain personal information for 24 months after your last activity."
+EXTRACTION = {
+    "detected_jurisdiction_signals": ["none detected"],
+    "extracted_facts": {
+        "retention_period": {"stated": "24 months", "source_quote": TEXT, "multiple_mentions": False},
+        "arbitration_clause": {"exists": True, "waives_class_action": True,
+                               "source_quote": "You waive your right to a class action."},   # not in TEXT
+    },
+    "contradictions_found": [],
+}
+
+
+def test_verifier_error_keeps_deterministic_issues(monkeypatch):
+    async def analyzer(extractor_res):
+        return {"trust_score": scoring.score_extraction(extractor_res), "red_flags": [],
+                "sections": [], "scoring_method": "deterministic"}
+
+    async def failing_verifier(clean_text, extractor_json, analyzer_json):
+        return {"error": "Verifier AI Error: rate limited"}
+
+    monkeypatch.setattr(pipeline, "run_risk_analyzer", analyzer)
+    monkeypatch.setattr(pipeline, "run_verifier", failing_verifier)
+
+    result = asyncio.run(pipeline._analyze_and_verify(TEXT, EXTRACTION))
+
+    verification = result["verification"]
+    assert verification["verification_passed"] is False
+    assert verification["error"].startswith("Verifier AI Error")
+    assert [i["issue_type"] for i in verification["issues_found"]] == ["hallucinated_quote"]
@@ -0,0 +1,102 @@
+"""
+PrivaShield AI - Deterministic Verification Checks
+The parts of the Verifier's QA pass that need no LLM: every source quote must
+occur in the document, the trust score must equal 100 minus its deductions, and
+prose must avoid advisory / alarmist wording. Issues use the Verifier's shape
+({"field", "issue_type", "detail"}) so they can be reported side by side.
+"""
+
+import re
+
+import policy_diff
+import scoring
+
+_TONE_RE = re.compile(r"\b(you should|you must|beware|dangerous|avoid (?:this|using)|do not use|stay away)\b", re.I)
+
+
+def _quotes(value, path: str):
+    """Yields (field path, quote) for every *source_quote / *_quotes entry in a nested structure."""
+    if isinstance(value, dict):
+        for key, item in value.items():
+            child = f"{path}.{key}" if path else key
+            if key.endswith("source_quote") and isinstance(item, str) and item.strip():
+                yield child, item
+            elif key.endswith("_quotes") and isinstance(item, list):
+                for i, quote in enumerate(item):
+                    if isinstance(quote, str) and quote.strip():
+                        yield f"{child}[{i}]", quote
+            else:
+                yield from _quotes(item, child)
+    elif isinstance(value, list):
+        for i, item in enumerate(value):
+            yield from _quotes(item, f"{path}[{i}]")
+
+
+def check_quotes(data: dict, clean_text: str, prefix: str = "") -> list[dict]:
+    """hallucinated_quote issues for quotes in `data` that are not in the document."""
+    normalized = policy_diff.normalize(clean_text)
+    return [
+        {"field": field, "issue_type": "hallucinated_quote", "detail": f"Quote not found in document: {quote[:120]}"}
+        for field, quote in _quotes(data, prefix)
+        if not policy_diff.quote_present(quote, normalized)
+    ]
+
+
+def check_score(trust_score: dict) -> list[dict]:
+    """math_error if the score is not START_SCORE plus its deductions (floored at 0)."""
+    breakdown = trust_score.get("score_breakdown") or []
+    try:
+        expected = max(0, scoring.START_SCORE + sum(int(item.get("deduction", 0)) for item in breakdown))
+        stated = int(trust_score.get("score"))
+    except (TypeError, ValueError):
+        return [{"field": "trust_score", "issue_type": "math_error", "detail": "Score or deductions are not numbers"}]
+    if expected != stated:
+        return [{"field": "trust_score.score", "issue_type": "math_error",
+                 "detail": f"Stated score {stated}, deductions give {expected}"}]
+    return []
+
+
+def check_tone(analyzer_json: dict) -> list[dict]:
+    """tone_violation for advisory / alarmist wording in the analyzer's prose."""
+    issues = []
+    texts = [(f"sections[{i}].summary", s.get("summary")) for i, s in enumerate(analyzer_json.get("sections") or [])
+             if isinstance(s, dict)]
+    texts += [(f"red_flags[{i}]", flag) for i, flag in enumerate(analyzer_json.get("red_flags") or [])]
+    texts.append(("jurisdiction_notes", analyzer_json.get("jurisdiction_notes")))
+    for field, text in texts:
+        match = _TONE_RE.search(text) if isinstance(text, str) else None
+        if match:
+            issues.append({"field": field, "issue_type": "tone_violation", "detail": f"Advisory wording: {match.group(0)!r}"})
+    return issues
+
+
+def check_extraction(extractor_json: dict, clean_text: str) -> list[dict]:
+    """Checks that only need the Extractor output; can run while the Risk Analyzer is still working."""
+    return check_quotes(extractor_json.get("extracted_facts") or {}, clean_text, "extracted_facts")
+
+
+def check_analysis(analyzer_json: dict, clean_text: str) -> list[dict]:
+    """Checks on the Risk Analyzer output."""
+    issues = check_quotes({"sections": analyzer_json.get("sections") or []}, clean_text)
+    if isinstance(analyzer_json.get("trust_score"), dict):
+        issues += check_score(analyzer_json["trust_score"])
+    return issues + check_tone(analyzer_json)
+
+
+def gate_reason(analyzer_json: dict, issues: list[dict]):
+    """
+    Why an analysis still needs the LLM Verifier, or None if the deterministic
+    checks are enough: an issue was found (its issue_type), the score came from
+    the LLM ("llm_scoring"), or a deduction rests on a fact the Extractor asserted
+    without a quote ("low_confidence_deduction", basis "inference" in
+    scoring.py). Rubric deductions for facts the policy does not state (basis
+    "absence") do not count.
+    """
+    if issues:
+        return issues[0]["issue_type"]
+    if analyzer_json.get("scoring_method") != "deterministic":
+        return "llm_scoring"
+    breakdown = (analyzer_json.get("trust_score") or {}).get("score_breakdown") or []
+    if any(item.get("basis") == "inference" for item in breakdown):
+        return "low_confidence_deduction"
+    return None
@@ -0,0 +1,309 @@
+"""
+PrivaShield AI - Analysis Cache Warmer
+Populates storage/analysis_cache/ and the processed_sites table from saved HTML
+files, without any network access other than the LLM API itself.
+
+Input is a directory (searched recursively) or a .tar / .tar.gz / .tgz archive of
+.html/.htm files. Each file's URL is taken from, in order:
+  1. a manifest (TSV: "<relative path>\\t<url>", via --manifest or manifest.tsv in the
+     input; in an archive, the shallowest manifest.tsv, with paths relative to it)
+  2. the page's <link rel="canonical"> or <meta property="og:url">
+Files with no resolvable URL are skipped and reported.
+
+HTML cleaning runs in a process pool; the analysis pipelines run under a rate
+budget (analyses started per minute) plus the usual LLM concurrency governor.
+Progress is appended to a JSON-lines checkpoint so an interrupted run resumes
+where it stopped. Results are written through analysis_cache, i.e. the exact
+files /full-analysis reads.
+
+Usage (from the repo root or from rag/):
+    python -m rag.warm ./saved_policies --rate 30 --workers 4
+    python warm.py policies.tar.gz --manifest urls.tsv
+"""
+
+import os
+import re
+import sys
+import json
+import time
+import asyncio
+import argparse
+import tarfile
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Iterator, Optional, Tuple
+
+RAG_DIR = os.path.dirname(os.path.abspath(__file__))
+HTML_EXTENSIONS = (".html", ".htm")
+MIN_TEXT_LENGTH = 100  # same floor as /full-analysis
+
+_CANONICAL_RE = re.compile(
+    r'<link[^>]+rel=["\']canonical["\'][^>]*href=["\']([^"\']+)["\']'
+    r'|<link[^>]+href=["\']([^"\']+)["\'][^>]*rel=["\']canonical["\']'
+    r'|<meta[^>]+property=["\']og:url["\'][^>]*content=["\']([^"\']+)["\']',
+    re.IGNORECASE,
+)
+
+
+# ──────────────────────────────────────────────
+#  INPUT DISCOVERY
+# ──────────────────────────────────────────────
+
+def _parse_manifest(lines, prefix: str = "") -> dict:
+    manifest = {}
+    for line in lines:
+        line = line.strip()
+        if not line or line.startswith("#"):
+            continue
+        name, _, url = line.partition("\t")
+        if url:
+            manifest[prefix + name.strip().replace("\\", "/")] = url.strip()
+    return manifest
+
+
+def _load_manifest(path: Optional[str]) -> dict:
+    if not path or not os.path.exists(path):
+        return {}
+    with open(path, "r", encoding="utf-8") as f:
+        return _parse_manifest(f)
+
+
+def _load_archive_manifest(source: str) -> dict:
+    """The shallowest manifest.tsv inside a tarball, keyed by archive member name."""
+    with tarfile.open(source, "r:*") as archive:
+        members = [m for m in archive.getmembers()
+                   if m.isfile() and os.path.basename(m.name) == "manifest.tsv"]
+        if not members:
+            return {}
+        member = min(members, key=lambda m: m.name.removeprefix("./").count("/"))
+        prefix = os.path.dirname(member.name.removeprefix("./"))
+        text = archive.extractfile(member).read().decode("utf-8", errors="replace")
+    return _parse_manifest(text.splitlines(), f"{prefix}/" if prefix else "")
+
+
+def _iter_sources(source: str) -> Iterator[Tuple[str, Callable[[], str]]]:
+    """Yields (relative name, reader) for every HTML file in a directory or tarball."""
+    if os.path.isdir(source):
+        for root, _, files in os.walk(source):
+            for filename in sorted(files):
+                if filename.lower().endswith(HTML_EXTENSIONS):
+                    path = os.path.join(root, filename)
+                    name = os.path.relpath(path, source).replace(os.sep, "/")
+                    yield name, (lambda p=path: _read_text(p))
+        return
+
+    with tarfile.open(source, "r:*") as archive:
+        for member in archive:
+            if member.isfile() and member.name.lower().endswith(HTML_EXTENSIONS):
+                data = archive.extractfile(member).read()
+                yield member.name.removeprefix("./"), (lambda d=data: d.decode("utf-8", errors="replace"))
+
+
+def _read_text(path: str) -> str:
+    with open(path, "r", encoding="utf-8", errors="replace") as f:
+        return f.read()
+
+
+def _resolve_url(name: str, html: str, manifest: dict) -> Optional[str]:
+    if name in manifest:
+        return manifest[name]
+    match = _CANONICAL_RE.search(html)
+    if match:
+        return next(group for group in match.groups() if group)
+    return None
+
+
+# ──────────────────────────────────────────────
+#  CHECKPOINT / RATE BUDGET / REPORTING
+# ──────────────────────────────────────────────
+
+class Checkpoint:
+    """Append-only JSON-lines log of finished files; survives crashes mid-run."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.done = set()
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue  # torn last line from an interrupted run
+                    if record.get("status") in ("analyzed", "cached"):
+                        self.done.add(record["name"])
+
+    def record(self, name: str, status: str, **extra) -> None:
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(json.dumps({"name": name, "status": status, "ts": time.time(), **extra}) + "\n")
+        if status in ("analyzed", "cached"):
+            self.done.add(name)
+
+
+class RateBudget:
+    """Spaces analyses so that at most `per_minute` start in any minute (0 = unlimited)."""
+
+    def __init__(self, per_minute: float):
+        self.interval = 60.0 / per_minute if per_minute > 0 else 0.0
+        self._next_slot = 0.0
+        self._lock = asyncio.Lock()
+
+    async def acquire(self) -> None:
+        if not self.interval:
+            return
+        async with self._lock:
+            now = time.monotonic()
+            wait = self._next_slot - now
+            self._next_slot = max(now, self._next_slot) + self.interval
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+
+class Progress:
+    def __init__(self, report_every: float):
+        self.report_every = report_every
+        self.started = time.monotonic()
+        self.last_report = self.started
+        self.counts = {"analyzed": 0, "cached": 0, "skipped": 0, "error": 0}
+
+    def add(self, status: str) -> None:
+        self.counts[status] = self.counts.get(status, 0) + 1
+        now = time.monotonic()
+        if now - self.last_report >= self.report_every:
+            self.last_report = now
+            self.report()
+
+    def report(self, final: bool = False) -> None:
+        elapsed = max(time.monotonic() - self.started, 1e-9)
+        total = sum(self.counts.values())
+        rate = self.counts["analyzed"] / elapsed * 60
+        label = "Done" if final else "Progress"
+        print(
+            f"[Warm] {label}: {total} files in {elapsed:.0f}s | "
+            f"analyzed={self.counts['analyzed']} cached={self.counts['cached']} "
+            f"skipped={self.counts['skipped']} errors={self.counts['error']} | "
+            f"{rate:.1f} analyses/min"
+        )
+
+
+# ──────────────────────────────────────────────
+#  WARMING LOOP
+# ──────────────────────────────────────────────
+
+async def warm(args) -> Progress:
+    # Imported after chdir so "storage/..." resolves where the server expects it.
+    import database
+    import analysis_cache
+    import analysis_service
+    from html_cleaner import clean_html
+
+    database.init_db()
+    if args.manifest or os.path.isdir(args.source):
+        manifest = _load_manifest(args.manifest)
+    else:
+        manifest = _load_archive_manifest(args.source)
+    checkpoint = Checkpoint(args.checkpoint)
+    budget = RateBudget(args.rate)
+    progress = Progress(args.report_every)
+    slots = asyncio.Semaphore(args.concurrency)
+    loop = asyncio.get_running_loop()
+
+    async def process(name: str, url: str, html: str, pool: ProcessPoolExecutor):
+        try:
+            clean_text = await loop.run_in_executor(pool, clean_html, html)
+            if len(clean_text) < MIN_TEXT_LENGTH:
+                checkpoint.record(name, "skipped", url=url, reason="content too short")
+                progress.add("skipped")
+                return
+
+            await budget.acquire()
+            payload = await analysis_service.analyze_policy_text(clean_text)
+            if "error" in payload.get("pipeline_data", {}):
+                raise RuntimeError(payload["pipeline_data"]["error"])
+            if not analysis_service.cacheable(payload):
+                raise RuntimeError(payload["hidden_clauses_data"].get("error", "hidden clauses not analysed"))
+
+            key = analysis_cache.url_hash(url)
+            analysis_service.attach_source_hashes(payload, clean_text, html)
+            analysis_cache.save(key, payload)
+            db = database.SessionLocal()
+            try:
+                analysis_service.save_scan(db, url, payload["pipeline_data"], clean_text)
+            finally:
+                db.close()
+            checkpoint.record(name, "analyzed", url=url, url_hash=key)
+            progress.add("analyzed")
+        except Exception as e:
+            print(f"[Warm] {name}: {e}")
+            checkpoint.record(name, "error", url=url, error=str(e))
+            progress.add("error")
+        finally:
+            slots.release()
+
+    tasks = []
+    # spawn, not fork: the parent has the embedding model (and its threads) loaded.
+    spawn = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=args.workers, mp_context=spawn) as pool:
+        for name, read in _iter_sources(args.source):
+            if name in checkpoint.done:
+                continue
+            html = read()
+            url = _resolve_url(name, html, manifest)
+            if not url:
+                print(f"[Warm] {name}: no URL in manifest or canonical link, skipping.")
+                progress.add("skipped")
+                continue
+            if not args.force and analysis_cache.load(analysis_cache.url_hash(url)) is not None:
+                checkpoint.record(name, "cached", url=url)
+                progress.add("cached")
+                continue
+
+            await slots.acquire()  # bound the number of HTML bodies held in memory
+            tasks.append(asyncio.create_task(process(name, url, html, pool)))
+            if args.limit and len(tasks) >= args.limit:
+                break
+
+        await asyncio.gather(*tasks)
+
+    progress.report(final=True)
+    return progress
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(
+        prog="python -m rag.warm",
+        description="Pre-populate the PrivaShield analysis cache from saved HTML files.",
+    )
+    parser.add_argument("source", help="Directory or tarball of saved .html files")
+    parser.add_argument("--manifest", help="TSV of '<relative path>\\t<url>' (default: manifest.tsv in the source directory or archive)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 2, help="Processes for HTML cleaning")
+    parser.add_argument("--concurrency", type=int, default=4, help="Policies analysed at once")
+    parser.add_argument("--rate", type=float, default=30.0, help="Max analyses started per minute (0 = unlimited)")
+    parser.add_argument("--checkpoint", default=os.path.join("storage", "warm_checkpoint.jsonl"),
+                        help="Resume log, relative to --workdir")
+    parser.add_argument("--report-every", type=float, default=10.0, help="Seconds between progress lines")
+    parser.add_argument("--limit", type=int, default=0, help="Stop after scheduling N analyses")
+    parser.add_argument("--force", action="store_true", help="Re-analyse URLs that are already cached")
+    parser.add_argument("--workdir", default=RAG_DIR,
+                        help="Directory whose storage/ the server uses (default: the rag/ directory)")
+    args = parser.parse_args(argv)
+
+    args.source = os.path.abspath(args.source)
+    if not os.path.exists(args.source):
+        parser.error(f"{args.source} does not exist")
+    if args.manifest:
+        args.manifest = os.path.abspath(args.manifest)
+    elif os.path.isdir(args.source):
+        args.manifest = os.path.join(args.source, "manifest.tsv")
+
+    # Same trick as test_auth.py: make the flat rag/ modules importable from anywhere.
+    sys.path.insert(0, RAG_DIR)
+    os.chdir(args.workdir)
+    os.makedirs(os.path.dirname(args.checkpoint) or ".", exist_ok=True)
+
+    progress = asyncio.run(warm(args))
+    return 1 if progress.counts["error"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())